@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compara dos archivos de resultados de run_benchmarks.py (ej. la versión publicada
+y la rama actual) etapa por etapa y escenario por escenario.
+
+Ejemplo:
+    python benchmarks/compare.py benchmarks/results/0.1.9_*.json results_new.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+STAGES = ('init', 'download', 'filter_tiles', 'mosaic_and_clip', 'clean', 'total')
+
+
+def load(path):
+    with open(path) as f:
+        results = json.load(f)
+    return results, {scenario['name']: scenario for scenario in results['scenarios']}
+
+
+def label(results):
+    env = results['environment']
+    return f"{env['pyvpp']} ({env['commit'] or 'no commit'})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two pyvpp benchmark result files.')
+    parser.add_argument('baseline', help='reference results (JSON)')
+    parser.add_argument('current', help='new results (JSON)')
+    parser.add_argument('--stat', choices=['min', 'median', 'mean'], default='median',
+                        help='statistic to compare (default: median)')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression (default: 0.1 = 10%%)')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='ignore stages faster than this in both runs (default: 0.05)')
+    parser.add_argument('--fail', action='store_true', help='exit with code 1 if there is any regression')
+    args = parser.parse_args(argv)
+
+    baseline, old = load(args.baseline)
+    current, new = load(args.current)
+    print(f"Baseline: {label(baseline)}  Current: {label(current)}  ({args.stat})")
+    if baseline['settings'] != current['settings']:
+        changed = sorted(key for key in set(baseline['settings']) | set(current['settings'])
+                         if baseline['settings'].get(key) != current['settings'].get(key))
+        print(f"Warning: different settings: {', '.join(changed)}")
+
+    regressions = 0
+    print(f"{'scenario':<18} {'stage':<16} {'baseline':>9} {'current':>9} {'change':>8}")
+    for name in sorted(set(old) & set(new), key=list(new).index):
+        for stage in STAGES:
+            before = old[name]['stages'][stage][args.stat]
+            after = new[name]['stages'][stage][args.stat]
+            if max(before, after) < args.min_seconds:
+                continue
+            change = (after - before) / before if before else float('inf')
+            flag = ''
+            if change > args.threshold:
+                flag = '  slower'
+                regressions += 1
+            elif change < -args.threshold:
+                flag = '  faster'
+            print(f"{name:<18} {stage:<16} {before:>9.3f} {after:>9.3f} {change:>+8.1%}{flag}")
+
+    for name in sorted(set(old) ^ set(new)):
+        print(f"{name}: only in {'baseline' if name in old else 'current'}")
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if args.fail and regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Servidor local que imita los endpoints de la API HDA de WEkEO que usa pyvpp
+(token, términos del dataset, búsqueda paginada, preparación y descarga), para poder medir el
+proceso completo sin credenciales ni conexión.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from shapely.geometry import box, shape
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el cliente reutilice las conexiones (keep-alive)
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _download_entry(self):
+        download_id = self.path.rstrip('/').split('/')[-1]
+        return self.server.mock.downloads.get(download_id)
+
+    def do_POST(self):
+        mock = self.server.mock
+        mock._request('post')
+        message = self._read_json()
+        if self.path.endswith('/gettoken') or self.path.endswith('/refreshtoken'):
+            self._send_json({'access_token': 'benchmark', 'refresh_token': 'benchmark', 'expires_in': 3600})
+        elif self.path.endswith('/dataaccess/search'):
+            self._send_json(mock.search(message))
+        elif self.path.endswith('/dataaccess/download'):
+            order = mock.order(message)
+            self._send_json(order if order else {'detail': 'Product not found'}, 200 if order else 404)
+        else:
+            self._send_json({'detail': 'Not found'}, 404)
+
+    def do_HEAD(self):
+        self.server.mock._request('head')
+        entry = self._download_entry()
+        if entry is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(entry["path"])}"')
+        self.send_header('Content-Length', str(entry['size']))
+        self.end_headers()
+
+    def do_PUT(self):
+        # Aceptación de los términos del dataset (termsaccepted/...)
+        self.server.mock._request('put')
+        self._read_json()
+        self._send_json({'accepted': True})
+
+    def do_GET(self):
+        mock = self.server.mock
+        mock._request('get')
+        if '/datasets/' in self.path:
+            self._send_json({'datasetId': self.path.split('/datasets/')[-1], 'terms': ['Copernicus_License']})
+            return
+        entry = self._download_entry()
+        if entry is None:
+            self._send_json({'detail': 'Not found'}, 404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/tiff')
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(entry["path"])}"')
+        self.send_header('Content-Length', str(entry['size']))
+        self.end_headers()
+        with open(entry['path'], 'rb') as f:
+            while True:
+                chunk = f.read(mock.chunk_size)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                mock._sent(len(chunk))
+
+
+class MockHDA:
+    """
+    Servidor HDA de pruebas sobre un catálogo de archivos locales (ver synthetic.build_catalogue).
+
+    Puede simular la latencia de cada petición y el ancho de banda de cada descarga.
+    Cuenta las peticiones por método y los bytes servidos (ver stats).
+    """
+
+    def __init__(self, catalogue=None, latency=0.0, bandwidth=None, host='127.0.0.1', port=0,
+                 chunk_size=1024 * 1024):
+        """
+        :param catalogue: (Opcional) Lista de entradas del catálogo.
+        :param latency: (Opcional) Segundos de espera añadidos a cada petición.
+        :param bandwidth: (Opcional) Ancho de banda por descarga en MB/s (None = sin límite).
+        :param host: (Opcional) Dirección de escucha.
+        :param port: (Opcional) Puerto (0 = uno libre).
+        :param chunk_size: (Opcional) Tamaño de bloque de envío en bytes.
+        """
+        self.catalogue = list(catalogue or [])
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.downloads = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL base de la API, para hda.Configuration(url=...)."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'post': 0, 'put': 0, 'head': 0, 'get': 0, 'searches': 0, 'orders': 0, 'bytes_sent': 0}
+
+    def _request(self, method):
+        with self._lock:
+            self.stats[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _sent(self, nbytes):
+        with self._lock:
+            self.stats['bytes_sent'] += nbytes
+        if self.bandwidth:
+            time.sleep(nbytes / (self.bandwidth * 1024 ** 2))
+
+    def search(self, query):
+        """
+        Devuelve una página de resultados: los productos del tipo pedido, en el rango
+        de fechas, cuya huella intersecta el bbox de la búsqueda.
+        """
+        start = datetime.strptime(query['startdate'][:10], '%Y-%m-%d').strftime('%Y%m%d')
+        end = datetime.strptime(query['enddate'][:10], '%Y-%m-%d').strftime('%Y%m%d')
+        area = box(*query['bbox'])
+        matches = [entry for entry in self.catalogue
+                   if entry['product'] == query.get('productType') and start <= entry['date'] <= end
+                   and shape(entry['geometry']).intersects(area)]
+
+        start_index = int(query.get('startIndex', 0))
+        per_page = int(query.get('itemsPerPage', 200))
+        features = [{
+            'type': 'Feature',
+            'id': entry['id'],
+            'geometry': entry['geometry'],
+            'properties': {'location': entry['id'], 'size': entry['size']},
+        } for entry in matches[start_index:start_index + per_page]]
+
+        with self._lock:
+            self.stats['searches'] += 1
+        return {'type': 'FeatureCollection', 'features': features,
+                'properties': {'totalResults': len(matches), 'startIndex': start_index,
+                               'itemsPerPage': per_page}}
+
+    def order(self, query):
+        """
+        Prepara la descarga de un producto (siempre lista al momento).
+
+        :return: {'download_id': ...} o None si el producto no está en el catálogo.
+        """
+        entry = next((entry for entry in self.catalogue if entry['id'] == query.get('product_id')), None)
+        if entry is None:
+            return None
+        with self._lock:
+            download_id = f"{entry['id']}-{len(self.downloads)}"
+            self.downloads[download_id] = entry
+            self.stats['orders'] += 1
+        return {'download_id': download_id}
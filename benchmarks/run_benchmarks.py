@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de pyvpp sin conexión: levanta un servidor HDA local (mock_hda), genera
+tiles HR-VPP sintéticos (synthetic) y mide download, filter_tiles, mosaic_and_clip
+y clean para varios tamaños de AOI y números de fechas. Los resultados se guardan
+en JSON (ver compare.py para comparar dos ejecuciones).
+
+Ejemplos:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --aoi-km 10 100 --dates 4 12 --scale full --repeat 3
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Medir siempre el código de este árbol, no la versión instalada
+sys.path.insert(0, os.path.dirname(HERE))
+
+import pyvpp  # noqa: E402
+from mock_hda import MockHDA  # noqa: E402
+from synthetic import SCALES, aoi_square, build_catalogue, series_dates  # noqa: E402
+
+# Etapas medidas en cada ejecución, en orden
+STAGES = ('init', 'download', 'filter_tiles', 'mosaic_and_clip', 'clean')
+
+# Versión del formato de resultados
+SCHEMA = 1
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    Versiones y máquina en las que se ejecutan los benchmarks.
+    """
+    import rasterio
+    from importlib.metadata import PackageNotFoundError, version
+    from pyvpp.WekeoDownload import available_cores
+
+    info = {
+        'pyvpp': pyvpp.__version__,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': available_cores(),
+        'rasterio': rasterio.__version__,
+        'gdal': rasterio.__gdal_version__,
+        'hda': None,
+    }
+    try:
+        info['hda'] = version('hda')
+    except PackageNotFoundError:
+        pass
+    return info
+
+
+def summarize(values):
+    return {'min': round(min(values), 4), 'median': round(statistics.median(values), 4),
+            'mean': round(statistics.mean(values), 4)}
+
+
+def run_once(client, gdf, dates, args, out_dir):
+    """
+    Ejecuta el proceso completo una vez y mide cada etapa.
+
+    :return: Diccionario con los tiempos por etapa, bytes y el informe de la ejecución.
+    """
+    from pyvpp.WekeoDownload import wekeo_download
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    times = {}
+    output = sys.stderr if args.verbose else io.StringIO()
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        downloader = wekeo_download('VPP_ST', gdf, dates, args.products, client=client, output_dir=out_dir,
+                                    max_workers=args.max_workers, prefilter=not args.no_prefilter)
+        times['init'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        downloader.download(engine=args.engine, concurrency=args.concurrency)
+        times['download'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        downloader.filter_tiles()
+        times['filter_tiles'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        downloader.mosaic_and_clip(streaming=args.streaming, processes=args.processes, profile=args.profile)
+        times['mosaic_and_clip'] = time.perf_counter() - start
+
+        outputs = [os.path.join(out_dir, name) for name in os.listdir(out_dir) if name.endswith('_rec.tif')]
+        start = time.perf_counter()
+        downloader.clean()
+        times['clean'] = time.perf_counter() - start
+
+    summary = downloader.download_summary.values()
+    return {
+        'times': times,
+        'downloaded': sum(s['downloaded'] for s in summary),
+        'failed': sum(s['failed'] for s in summary),
+        'skipped': sum(s['skipped'] for s in summary),
+        'download_bytes': sum(s['bytes'] for s in summary),
+        'outputs': len(outputs),
+        'output_bytes': sum(os.path.getsize(path) for path in outputs if os.path.exists(path)),
+        'report': downloader.report.to_dict(items=False),
+    }
+
+
+def run_scenario(server, client, aoi_km, n_dates, args, work_dir):
+    """
+    Prepara el catálogo de un escenario (AOI de aoi_km de lado, n_dates fechas) y lo mide.
+    """
+    name = f"aoi{aoi_km:g}km_{n_dates}d"
+    gdf = aoi_square(args.lon, args.lat, aoi_km)
+    server.catalogue = build_catalogue(args.data_dir, gdf, n_dates, args.products, args.scale)
+    days = series_dates(n_dates)
+    dates = [f"{day[:4]}-{day[4:6]}-{day[6:]}" for day in (days[0], days[-1])]
+
+    runs = []
+    for i in range(args.repeat):
+        server.reset_stats()
+        run = run_once(client, gdf, dates, args, os.path.join(work_dir, name))
+        run['server'] = dict(server.stats)
+        runs.append(run)
+        if run['failed'] or not run['outputs']:
+            print(f"  Warning: {run['failed']} failed downloads, {run['outputs']} outputs (run with --verbose)")
+        total = sum(run['times'].values())
+        print(f"  {name} run {i + 1}/{args.repeat}: {total:.2f} s "
+              + ' '.join(f"{stage}={run['times'][stage]:.2f}" for stage in STAGES))
+
+    last = runs[-1]
+    stages = {stage: summarize([run['times'][stage] for run in runs]) for stage in STAGES}
+    stages['total'] = summarize([sum(run['times'].values()) for run in runs])
+    download = stages['download']['median']
+    return {
+        'name': name,
+        'aoi_km': aoi_km,
+        'dates': n_dates,
+        'products': args.products,
+        'catalogue_files': len(server.catalogue),
+        'catalogue_bytes': sum(entry['size'] for entry in server.catalogue),
+        'downloaded': last['downloaded'],
+        'failed': last['failed'],
+        'skipped': last['skipped'],
+        'download_bytes': last['download_bytes'],
+        'download_mb_per_s': round(last['download_bytes'] / 1024 ** 2 / download, 3) if download else None,
+        'outputs': last['outputs'],
+        'output_bytes': last['output_bytes'],
+        'stages': stages,
+        'runs': [run['times'] for run in runs],
+        'server': last['server'],
+        'report': last['report'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline pyvpp benchmarks against a local mock HDA service.')
+    parser.add_argument('--aoi-km', type=float, nargs='+', default=[5, 50, 150],
+                        help='side of the square AOIs in km (default: 5 50 150)')
+    parser.add_argument('--dates', type=int, nargs='+', default=[3], help='number of dates per scenario (default: 3)')
+    parser.add_argument('--products', nargs='+', default=['PPI'], help='products (default: PPI)')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small',
+                        help='tile size: small (1098 px), medium (2745 px) or full (10980 px, real 10 m tiles)')
+    # Por defecto en la esquina común de cuatro tiles de 30S, para que todos los AOIs necesiten mosaico
+    parser.add_argument('--lon', type=float, default=-3.0, help='AOI centre longitude (default: -3.0)')
+    parser.add_argument('--lat', type=float, default=37.0, help='AOI centre latitude (default: 37.0)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per scenario (default: 1)')
+    parser.add_argument('--max-workers', type=int, default=4, help='download threads (default: 4)')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads', help='download engine')
+    parser.add_argument('--concurrency', type=int, help='concurrent transfers with --engine async')
+    parser.add_argument('--processes', type=int, default=1, help='mosaicking processes (default: 1)')
+    parser.add_argument('--streaming', action='store_true', help='use streaming mosaicking')
+    parser.add_argument('--profile', default='default', help="output profile (default, deflate, zstd, cog)")
+    parser.add_argument('--no-prefilter', action='store_true', help='download every search result')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per HDA request')
+    parser.add_argument('--bandwidth', type=float, help='simulated MB/s per download (default: unlimited)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'pyvpp-benchmarks'),
+                        help='folder for the synthetic tiles, reused between runs')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<version>_<time>.json)')
+    parser.add_argument('--keep', action='store_true', help='keep the output folders')
+    parser.add_argument('--verbose', action='store_true', help='show the pyvpp messages (on stderr)')
+    args = parser.parse_args(argv)
+
+    from hda import Client, Configuration
+
+    started = time.strftime('%Y%m%d-%H%M%S')
+    work_dir = tempfile.mkdtemp(prefix='pyvpp-bench-')
+    results = {
+        'schema': SCHEMA,
+        'started': started,
+        'environment': environment(),
+        'settings': {key: value for key, value in vars(args).items()
+                     if key not in ('output', 'keep', 'verbose', 'data_dir')},
+        'scenarios': [],
+    }
+
+    with MockHDA(latency=args.latency, bandwidth=args.bandwidth) as server:
+        client = Client(config=Configuration(url=server.url, user='benchmark', password='benchmark'),
+                        progress=False)
+        try:
+            for aoi_km in args.aoi_km:
+                for n_dates in args.dates:
+                    print(f"Scenario: {aoi_km:g} km AOI, {n_dates} dates, {args.scale} tiles")
+                    results['scenarios'].append(run_scenario(server, client, aoi_km, n_dates, args, work_dir))
+        finally:
+            if args.keep:
+                print(f"Outputs kept in {work_dir}")
+            else:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(HERE, 'results', f"{pyvpp.__version__}_{started}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print(f"Results saved to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
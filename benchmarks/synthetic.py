@@ -0,0 +1,157 @@
+"""
+Tiles HR-VPP sintéticos para los benchmarks: GeoTIFFs con nombres HR-VPP, en la
+huella real de cada tile Sentinel-2 (MGRS), su CRS UTM y con el tipo de dato,
+nodata, teselado y compresión de los productos reales.
+"""
+
+import os
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+import rasterio
+from affine import Affine
+from pyproj import Transformer
+from shapely.geometry import box, mapping
+
+from pyvpp.TileIndex import LATITUDE_BANDS, TILE_SIZE, _cell_index, get_mgrs_tiles, utm_zone
+
+
+# Tamaño en píxeles de cada tile según la escala: 'full' es el tile real de 10 m
+SCALES = {
+    'small': 1098,   # 100 m
+    'medium': 2745,  # 40 m
+    'full': 10980,   # 10 m
+}
+
+NODATA = 65535
+
+# Perfil de escritura de los productos HR-VPP (uint16, teselado y comprimido)
+TILE_PROFILE = {
+    'driver': 'GTiff',
+    'dtype': 'uint16',
+    'count': 1,
+    'nodata': NODATA,
+    'tiled': True,
+    'blockxsize': 512,
+    'blockysize': 512,
+    'compress': 'deflate',
+}
+
+# Primera fecha de la serie y paso entre fechas (los productos ST son de 10 días)
+FIRST_DATE = date(2020, 1, 5)
+DATE_STEP = timedelta(days=10)
+
+
+def tile_grid(tile_id):
+    """
+    Obtiene el CRS UTM y los límites de un tile Sentinel-2.
+
+    :param tile_id: ID de tile MGRS (ej. '30STG').
+    :return: Tupla (EPSG, (xmin, ymin, xmax, ymax) en metros UTM, huella en EPSG:4326).
+    """
+    zone, band = int(tile_id[:2]), LATITUDE_BANDS.index(tile_id[2])
+    ids, footprints, _ = _cell_index(zone, band)
+    footprint = footprints[ids.index(tile_id)]
+
+    epsg = (32700 if footprint.bounds[3] <= 0 else 32600) + zone
+    to_utm = Transformer.from_crs(4326, epsg, always_xy=True)
+    xs, ys = to_utm.transform(*footprint.exterior.xy)
+    # El tile empieza en la esquina superior izquierda de su cuadrado de 100 km
+    left = round(min(xs) / 100000) * 100000
+    top = round(max(ys) / 100000) * 100000
+    return epsg, (left, top - TILE_SIZE, left + TILE_SIZE, top), footprint
+
+
+def series_dates(count):
+    """
+    :param count: Número de fechas.
+    :return: Lista de fechas 'YYYYMMDD' de la serie sintética.
+    """
+    return [(FIRST_DATE + i * DATE_STEP).strftime('%Y%m%d') for i in range(count)]
+
+
+def tile_name(tile_id, day, product, size):
+    """
+    :return: Nombre de archivo HR-VPP (ej. 'ST_20200105T000000_S2_T30STG-100m_V101_PPI.tif').
+    """
+    resolution = round(TILE_SIZE / size)
+    return f"ST_{day}T000000_S2_T{tile_id}-{resolution:03d}m_V101_{product}.tif"
+
+
+def write_tile(path, tile_id, day, product, size, rows_per_write=1024):
+    """
+    Escribe un tile sintético: un campo suave (parcelas de 64 píxeles) con ruido y
+    una franja sin datos, para que la compresión se parezca a la de los productos reales.
+    Se escribe por bandas de filas para no cargar el tile completo en memoria.
+    """
+    epsg, (left, bottom, right, top), _ = tile_grid(tile_id)
+    res = (right - left) / size
+    seed = zlib.crc32(f"{tile_id}_{day}_{product}".encode())
+    rng = np.random.default_rng(seed)
+
+    cell = 64
+    field = rng.integers(500, 6000, (size // cell + 2, size // cell + 2)).astype('uint16')
+    edge = int(size * rng.uniform(0.02, 0.1))  # Franja sin datos en el borde oeste
+
+    tmp_path = f"{path}.part"
+    with rasterio.open(tmp_path, 'w', width=size, height=size, crs=f"EPSG:{epsg}",
+                       transform=Affine(res, 0, left, 0, -res, top), **TILE_PROFILE) as dst:
+        for row in range(0, size, rows_per_write):
+            height = min(rows_per_write, size - row)
+            rows = np.arange(row, row + height) // cell
+            cols = np.arange(size) // cell
+            block = field[rows][:, cols] + rng.integers(0, 300, (height, size), dtype='uint16')
+            block[:, :edge] = NODATA
+            dst.write(block[np.newaxis], window=((row, row + height), (0, size)))
+    os.replace(tmp_path, path)
+
+
+def aoi_square(lon, lat, side_km):
+    """
+    Área de interés cuadrada de lado side_km centrada en un punto, en su CRS UTM.
+
+    :return: GeoDataFrame con el AOI.
+    """
+    import geopandas as gpd
+
+    zone = utm_zone(lon)
+    epsg = (32600 if lat >= 0 else 32700) + zone
+    x, y = Transformer.from_crs(4326, epsg, always_xy=True).transform(lon, lat)
+    half = side_km * 500
+    return gpd.GeoDataFrame(geometry=[box(x - half, y - half, x + half, y + half)], crs=f"EPSG:{epsg}")
+
+
+def build_catalogue(data_dir, gdf, dates, products, scale='small', margin_km=20):
+    """
+    Genera (o reutiliza) los tiles sintéticos de un escenario y devuelve su catálogo.
+
+    El catálogo cubre el AOI ampliado margin_km, así que incluye tiles vecinos que el
+    servidor devuelve para el bbox de la búsqueda pero no intersectan el AOI.
+
+    :param data_dir: Carpeta donde se guardan los tiles (se reutilizan entre ejecuciones).
+    :param gdf: GeoDataFrame del AOI.
+    :param dates: Número de fechas.
+    :param products: Lista de productos (ej. ['PPI', 'QFLAG']).
+    :param scale: Escala de los tiles (ver SCALES).
+    :param margin_km: Margen alrededor del AOI en km.
+    :return: Lista de entradas {'id', 'path', 'product', 'date', 'size', 'geometry'}.
+    """
+    size = SCALES[scale]
+    folder = os.path.join(data_dir, scale)
+    os.makedirs(folder, exist_ok=True)
+
+    area = gdf.buffer(margin_km * 1000).to_crs(4326).unary_union
+    catalogue = []
+    for tile_id in get_mgrs_tiles(area):
+        footprint = mapping(tile_grid(tile_id)[2])
+        for day in series_dates(dates):
+            for product in products:
+                name = tile_name(tile_id, day, product, size)
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    print(f"Generating {name}")
+                    write_tile(path, tile_id, day, product, size)
+                catalogue.append({'id': name[:-4], 'path': path, 'product': product, 'date': day,
+                                  'size': os.path.getsize(path), 'geometry': footprint})
+    return catalogue
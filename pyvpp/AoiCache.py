@@ -0,0 +1,129 @@
+import io
+import os
+import re
+import glob
+import json
+import hashlib
+import tempfile
+
+
+# Carpeta por defecto de la caché de áreas de interés resueltas
+DEFAULT_AOI_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pyvpp", "aoi")
+
+
+class AoiCache:
+    """
+    Caché en disco de áreas de interés ya resueltas (límites del sitio DEIMS o del
+    shapefile, bbox geográfico, geometría unificada y tiles MGRS), para no volver a
+    descargar, leer ni reproyectar el AOI en cada ejecución y poder trabajar sin
+    conexión una vez calentada.
+
+    Cada entrada es un JSON pequeño con las geometrías en WKB (hexadecimal) y la tabla de
+    atributos (pandas, orient='table', que conserva los tipos y el índice). Los sitios
+    DEIMS se identifican por su ID; los archivos, por ruta, fecha de modificación y tamaño
+    (incluidos los archivos auxiliares del shapefile), así que editar el archivo invalida la entrada.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        :param cache_dir: (Opcional) Carpeta de la caché. Por defecto ~/.cache/pyvpp/aoi
+        """
+        self.cache_dir = cache_dir or DEFAULT_AOI_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(shape):
+        """
+        Calcula la clave de caché de un AOI.
+
+        :param shape: Ruta a shapefile, DEIMS ID (formato: 'deimsid:https://...') o GeoDataFrame.
+        :return: Clave legible, o None si el AOI no se puede cachear (ej. un GeoDataFrame).
+        """
+        if not isinstance(shape, str):
+            return None
+        if shape.startswith('deimsid'):
+            return f"deims-{re.sub(r'[^A-Za-z0-9-]', '_', shape.rstrip('/').split('/')[-1])}"
+
+        path = os.path.abspath(shape)
+        if not os.path.exists(path):
+            return None
+        # El shapefile son varios archivos (.shp, .dbf, .prj...): cualquiera de ellos invalida la entrada
+        files = sorted(glob.glob(f"{glob.escape(os.path.splitext(path)[0])}.*")) or [path]
+        stamp = '|'.join(f"{f}:{os.stat(f).st_mtime_ns}:{os.stat(f).st_size}" for f in files)
+        digest = hashlib.sha1(f"{path}|{stamp}".encode("utf-8")).hexdigest()[:16]
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.splitext(os.path.basename(path))[0])[:60]
+        return f"{name}-{digest}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Busca un AOI en la caché.
+
+        :param key: Clave de caché.
+        :return: Diccionario con 'gdf' (GeoDataFrame con sus atributos), 'bbox',
+            'geometry' y 'tiles', o None si no está en caché.
+        """
+        if key is None:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Las entradas de versiones anteriores no tienen atributos: se vuelven a resolver
+        if 'attributes' not in entry:
+            return None
+
+        import pandas as pd
+        import geopandas as gpd
+        from shapely import wkb
+        attributes = pd.read_json(io.StringIO(entry['attributes']), orient='table')
+        gdf = gpd.GeoDataFrame(attributes, geometry=[wkb.loads(g, hex=True) for g in entry['geometries']],
+                               crs=entry['crs'])
+        return {
+            'gdf': gdf,
+            'bbox': entry['bbox'],
+            'geometry': wkb.loads(entry['geometry'], hex=True),
+            'tiles': entry['tiles'],
+        }
+
+    def put(self, key, gdf, bbox, geometry, tiles):
+        """
+        Guarda un AOI resuelto en la caché (de forma atómica).
+
+        :param key: Clave de caché.
+        :param gdf: GeoDataFrame del AOI en su CRS original.
+        :param bbox: Bbox geográfico [minx, miny, maxx, maxy].
+        :param geometry: Geometría unificada en EPSG:4326.
+        :param tiles: Lista de IDs de tile MGRS.
+        """
+        if key is None:
+            return
+        try:
+            attributes = gdf.drop(columns=gdf.geometry.name).to_json(orient='table')
+        except (TypeError, ValueError) as e:
+            # Sin la tabla de atributos la entrada no serviría (ej. para zonal_stats con id_column)
+            print(f"AOI not cached, its attributes cannot be stored: {e}")
+            return
+        entry = {
+            'crs': gdf.crs.to_wkt() if gdf.crs is not None else None,
+            'attributes': attributes,
+            'geometries': [g.wkb_hex for g in gdf.geometry],
+            'bbox': [float(v) for v in bbox],
+            'geometry': geometry.wkb_hex,
+            'tiles': list(tiles),
+        }
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{key}.", dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        """
+        Vacía la caché por completo.
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,79 @@
+import os
+import shutil
+import zipfile
+
+
+# Extensiones de los archivos comprimidos que entrega HDA
+ARCHIVE_EXTENSIONS = ('.zip',)
+
+# Prefijo del sistema de archivos virtual de GDAL para leer dentro de un zip
+VSIZIP = '/vsizip/'
+
+
+def is_archive(path):
+    """
+    :return: True si la ruta es un archivo comprimido (ver ARCHIVE_EXTENSIONS).
+    """
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def vsizip_path(archive, member):
+    """
+    Ruta de GDAL para leer un miembro de un zip directamente, sin descomprimirlo en disco
+    (ej. '/vsizip//data/ST_..._PPI.zip/ST_..._PPI.tif').
+
+    :param archive: Ruta del zip.
+    :param member: Nombre del miembro dentro del zip.
+    """
+    return f"{VSIZIP}{os.path.abspath(archive)}/{member}"
+
+
+def split_vsizip(path):
+    """
+    Separa una ruta /vsizip/ en el zip y el miembro.
+
+    :return: Tupla (zip, miembro), o (None, path) si no es una ruta /vsizip/.
+    """
+    if not path.startswith(VSIZIP):
+        return None, path
+    rest = path[len(VSIZIP):]
+    lower = rest.lower()
+    for ext in ARCHIVE_EXTENSIONS:
+        end = lower.find(ext + '/')
+        if end != -1:
+            return rest[:end + len(ext)], rest[end + len(ext) + 1:]
+    return None, path
+
+
+def archive_members(archive):
+    """
+    Lista los archivos de un zip leyendo solo su directorio central.
+
+    :param archive: Ruta del zip.
+    :return: Lista de tuplas (nombre del miembro, tamaño descomprimido en bytes).
+    """
+    with zipfile.ZipFile(archive) as zf:
+        return [(info.filename, info.file_size) for info in zf.infolist() if not info.is_dir()]
+
+
+def extract_members(archive, members, dest_dir):
+    """
+    Extrae solo los miembros indicados de un zip (en streaming, sin descomprimir el resto),
+    para los lectores que no pueden usar /vsizip/ (ej. netCDF4).
+
+    :param archive: Ruta del zip.
+    :param members: Nombres de los miembros a extraer.
+    :param dest_dir: Carpeta de destino (se conserva la estructura de carpetas del zip).
+    :return: Lista de rutas extraídas, en el mismo orden que members.
+    """
+    paths = []
+    with zipfile.ZipFile(archive) as zf:
+        for member in members:
+            path = os.path.abspath(os.path.join(dest_dir, *member.split('/')))
+            if not path.startswith(os.path.join(os.path.abspath(dest_dir), '')):
+                raise ValueError(f"Unsafe member path in {archive}: {member}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with zf.open(member) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            paths.append(path)
+    return paths
@@ -0,0 +1,205 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from hda.api import DownloadSizeError
+from .TileCache import TileCache
+
+
+# Descargas simultáneas por defecto del motor asyncio
+ASYNC_CONCURRENCY = 8
+
+# Tamaño de bloque de lectura/escritura de las descargas en streaming
+CHUNK_SIZE = 1024 * 1024
+
+
+def _import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("The async download engine needs aiohttp: pip install pyvpp[async]")
+    return aiohttp
+
+
+def run_coroutine(coroutine):
+    """
+    Ejecuta una corrutina hasta el final desde código síncrono. Si ya hay un bucle de
+    eventos en marcha en este hilo (ej. en Jupyter), la ejecuta en un hilo aparte.
+
+    :param coroutine: Corrutina a ejecutar.
+    :return: Resultado de la corrutina.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = asyncio.run(coroutine)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('result')
+
+
+def _filename(headers, fallback):
+    """
+    Nombre del archivo descargado según la cabecera Content-Disposition.
+    """
+    disposition = headers.get('Content-Disposition')
+    if not disposition or 'filename=' not in disposition:
+        return fallback
+    name = disposition[disposition.find('filename=') + len('filename='):].split(';')[0].strip().strip('"')
+    return os.path.basename(name) or fallback
+
+
+class AsyncEngine:
+    """
+    Motor de descarga asyncio de wekeo_download.
+
+    Las búsquedas paginadas y las peticiones de preparación de descargas (DataOrderRequest)
+    usan el cliente HDA síncrono en un pool de hilos; las transferencias de archivos van
+    por una única sesión aiohttp con conexiones persistentes. Los resultados a descargar
+    pasan por una cola acotada, así que las búsquedas esperan si las descargas van por detrás.
+    """
+
+    def __init__(self, downloader, concurrency=ASYNC_CONCURRENCY, chunk_size=CHUNK_SIZE):
+        """
+        :param downloader: Instancia de wekeo_download.
+        :param concurrency: (Opcional) Descargas simultáneas.
+        :param chunk_size: (Opcional) Tamaño de bloque en bytes.
+        """
+        self.downloader = downloader
+        self.concurrency = max(1, int(concurrency))
+        self.chunk_size = chunk_size
+
+    async def _blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def run(self):
+        """
+        Busca y descarga todos los productos del downloader.
+        """
+        aiohttp = _import_aiohttp()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=300)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency + len(self.downloader.products)) as executor:
+            self._executor = executor
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                workers = [asyncio.create_task(self._worker(session, queue)) for _ in range(self.concurrency)]
+                try:
+                    await asyncio.gather(*(self._produce(product, queue) for product in self.downloader.products))
+                finally:
+                    for _ in workers:
+                        await queue.put(None)
+                    await asyncio.gather(*workers)
+
+    async def _produce(self, product, queue):
+        """
+        Busca un producto y encola los resultados que hay que descargar.
+        """
+        d = self.downloader
+        try:
+            matches = await self._blocking(d._search, product)
+            print(f"Found {matches.total} matches for product: {product}.")
+            plan = d._plan_downloads(product, matches, d._new_summary(product))
+            while True:
+                # Avanzar el plan puede pedir la página siguiente: se hace en el pool de hilos
+                result = await self._blocking(next, plan, None)
+                if result is None:
+                    break
+                await queue.put((product, result))
+        except Exception as e:
+            print(f"Error downloading {product}: {e}")
+            import traceback
+            traceback.print_exc()
+
+    async def _worker(self, session, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            product, result = item
+            try:
+                self.downloader._download_done(product, await self._download_result(session, result), result)
+            except Exception as e:
+                self.downloader._download_failed(product, result['id'], e)
+
+    async def _download_result(self, session, result):
+        """
+        Descarga un resultado (o lo enlaza desde la caché de tiles) en la carpeta de salida.
+
+        :return: Lista de rutas de los archivos descargados.
+        """
+        d = self.downloader
+        start = time.perf_counter()
+        if d.cache is not None:
+            key = TileCache.key(result)
+            paths = await self._blocking(d.cache.get, key, d.pyhda)
+            if paths is not None:
+                print(f"Cache hit: {result['id']}")
+                d._report_download(result, paths, time.perf_counter() - start, cache_hit=True)
+                return paths
+
+        staging = tempfile.mkdtemp(prefix='.partial-', dir=d.pyhda)
+        try:
+            await self._stream(session, result, staging)
+            if d.cache is not None:
+                paths, _ = await self._blocking(d.cache.fetch, key, d.pyhda,
+                                                lambda cache_staging: self._move(staging, cache_staging))
+            else:
+                paths = self._move(staging, d.pyhda)
+            d._report_download(result, paths, time.perf_counter() - start)
+            return paths
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    @staticmethod
+    def _move(src_dir, dest_dir):
+        paths = []
+        for name in os.listdir(src_dir):
+            path = os.path.join(dest_dir, name)
+            os.replace(os.path.join(src_dir, name), path)
+            paths.append(path)
+        return paths
+
+    async def _stream(self, session, result, download_dir):
+        """
+        Pide la descarga de un resultado a HDA y la transfiere por bloques a disco. Las escrituras
+        se hacen en el pool de hilos, sin bloquear el bucle de eventos. El tamaño descargado
+        solo se comprueba con Content-Length cuando la respuesta no viene comprimida
+        (aiohttp descomprime el cuerpo y Content-Length es el tamaño comprimido).
+        """
+        d = self.downloader
+        download_id = await self._blocking(d._order, result)
+        await self._blocking(d.rate_limiter.wait, d.conn.config.url)
+        token = await self._blocking(lambda: d.conn.token)
+
+        url = d.conn.full_url(f"dataaccess/download/{download_id}")
+        async with session.get(url, headers={'Authorization': f"Bearer {token}"}) as response:
+            response.raise_for_status()
+            path = os.path.join(download_dir, _filename(response.headers, download_id))
+            encoding = response.headers.get('Content-Encoding', 'identity').lower()
+            size = response.content_length if encoding == 'identity' else None
+            written = 0
+            with open(path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    await self._blocking(f.write, chunk)
+                    written += len(chunk)
+
+        if size is not None and written != size:
+            raise DownloadSizeError(f"Download of {result['id']} incomplete: {written} of {size} bytes")
+        return path
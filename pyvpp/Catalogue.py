@@ -0,0 +1,201 @@
+import os
+import re
+import threading
+import zipfile
+from collections import namedtuple
+from .Archive import archive_members, is_archive, vsizip_path
+from .TileIndex import tile_from_name
+
+
+# Nombres HR-VPP (ej. 'ST_20200105T000000_S2_T30STG-010m_V101_PPI', 'VPP_2020_S2_T30STG-010m_V101_s1_SOSD')
+HRVPP_PATTERN = re.compile(r'^(?P<dataset>[A-Z]+)_(?P<date>\d{8}|\d{4})(?:T\d{6})?_S2_T(?P<tile>\d{2}[A-Z]{3})'
+                           r'-\d+m_V\d+_(?:(?P<season>s\d)_)?(?P<product>[A-Za-z0-9]+)$')
+
+# Nombres Sentinel-3 SLSTR (ej. 'S3A_SL_2_LST____20200105T101010_20200105T101310_..._O_NR_004.SEN3')
+SLSTR_PATTERN = re.compile(r'^(?P<dataset>S3[AB])_SL_2_(?P<product>[A-Z]{3})_+(?P<date>\d{8})T\d{6}_')
+
+# Nombre descompuesto de un producto o archivo descargado
+ProductName = namedtuple('ProductName', ['dataset', 'date', 'tile', 'season', 'product'])
+
+# Entrada del catálogo de archivos descargados. Los rasters dentro de un zip tienen una ruta
+# /vsizip/ (se leen sin descomprimir) y en archive la ruta del zip
+CatalogueEntry = namedtuple('CatalogueEntry', ['dataset', 'tile', 'date', 'season', 'product', 'path', 'size',
+                                               'archive'], defaults=[None])
+
+
+def parse_name(name):
+    """
+    Descompone el nombre de un archivo o el ID de un producto HR-VPP o SLSTR.
+
+    :param name: Nombre de archivo (con o sin extensión ni carpeta) o ID de producto.
+    :return: ProductName (dataset, fecha 'YYYYMMDD' o 'YYYY', tile o None, temporada o None,
+        producto), o None si el nombre no es de un producto descargado (ej. los recortes *_rec.tif).
+    """
+    base = os.path.basename(name).split('.', 1)[0]
+    match = HRVPP_PATTERN.match(base)
+    if match:
+        return ProductName(match['dataset'], match['date'], match['tile'], match['season'], match['product'])
+    match = SLSTR_PATTERN.match(base)
+    if match:
+        return ProductName(match['dataset'], match['date'], None, None, match['product'])
+
+    # Otros nombres: la fecha en el segundo campo y el producto en el último
+    parts = base.split('_')
+    if len(parts) < 3 or parts[-1] == 'rec' or not parts[1][:4].isdigit():
+        return None
+    return ProductName(parts[0], parts[1][:8], tile_from_name(base), None, parts[-1])
+
+
+def layer_name(product, season=None):
+    """
+    Nombre de las salidas de un producto: el producto, con su temporada en los productos
+    fenológicos de dos temporadas (ej. 'SOSD_s1' y 'SOSD_s2'), para que no se mezclen.
+
+    :param product: Nombre del producto.
+    :param season: (Opcional) Temporada ('s1', 's2') o None.
+    :return: Nombre de la capa de salida.
+    """
+    return f"{product}_{season}" if season else product
+
+
+class Catalogue:
+    """
+    Índice de los archivos descargados en una carpeta (dataset, tile, fecha, producto,
+    ruta y tamaño). Los rasters que llegan en zips se indexan uno a uno con su ruta /vsizip/,
+    leyendo solo el directorio central del zip, sin descomprimirlos. Se construye recorriendo la carpeta (y sus subcarpetas) una sola vez,
+    la primera vez que se consulta, y después se mantiene según se descargan o se
+    eliminan archivos, así que las etapas no vuelven a recorrer ni a descomponer nombres.
+    Es seguro entre hilos.
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: Carpeta de descarga.
+        """
+        self.folder = folder
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._scanned = False
+
+    def _entry(self, path, name):
+        parsed = parse_name(name)
+        if parsed is None:
+            return None
+        if os.path.isdir(path):
+            size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+        else:
+            size = os.path.getsize(path)
+        return CatalogueEntry(parsed.dataset, parsed.tile, parsed.date, parsed.season, parsed.product, path, size)
+
+    def _archive_entries(self, path):
+        """
+        Entradas de un zip: una por cada raster que contiene o, si no contiene rasters de
+        productos (ej. SLSTR), una para el propio zip.
+        """
+        try:
+            members = archive_members(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"Skipping unreadable archive {path}: {e}")
+            return []
+        entries = []
+        for member, size in members:
+            parsed = parse_name(member)
+            if parsed is not None and member.lower().endswith(('.tif', '.tiff')):
+                entries.append(CatalogueEntry(parsed.dataset, parsed.tile, parsed.date, parsed.season,
+                                              parsed.product, vsizip_path(path, member), size, path))
+        if not entries:
+            entry = self._entry(path, os.path.basename(path))
+            entries = [entry] if entry is not None else []
+        return entries
+
+    def _file_entries(self, path):
+        if is_archive(path):
+            return self._archive_entries(path)
+        entry = self._entry(path, os.path.basename(path))
+        return [entry] if entry is not None else []
+
+    def scan(self):
+        """
+        Recorre la carpeta de descarga y reconstruye el índice.
+        """
+        entries = {}
+        for root, dirs, files in os.walk(self.folder):
+            # Las carpetas temporales de descarga (.partial-*) no se indexan; los productos
+            # SLSTR descomprimidos (*.SEN3) son carpetas y se indexan como un único producto
+            for name in list(dirs):
+                if name.startswith('.'):
+                    dirs.remove(name)
+                elif name.endswith('.SEN3'):
+                    dirs.remove(name)
+                    entry = self._entry(os.path.join(root, name), name)
+                    if entry is not None:
+                        entries[entry.path] = entry
+            for name in files:
+                for entry in self._file_entries(os.path.join(root, name)):
+                    entries[entry.path] = entry
+        with self._lock:
+            self._entries = entries
+            self._scanned = True
+
+    def add(self, path):
+        """
+        Añade (o actualiza) un archivo descargado. De los zips se añaden los rasters que contienen.
+
+        :param path: Ruta del archivo.
+        :return: Lista de CatalogueEntry añadidas (vacía si el nombre no es de un producto).
+        """
+        entries = self._file_entries(path)
+        with self._lock:
+            for entry in entries:
+                self._entries[entry.path] = entry
+        return entries
+
+    def remove(self, path):
+        """
+        Quita del índice un archivo, todos los de una carpeta o todos los de un zip.
+
+        :param path: Ruta del archivo, de la carpeta o del zip eliminado (o ruta /vsizip/ de un miembro).
+        """
+        prefix = os.path.join(path, '')
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if key == path or key.startswith(prefix) or entry.archive == path]:
+                del self._entries[key]
+
+    def entries(self, ext=None, **fields):
+        """
+        Consulta el índice (se construye la primera vez).
+
+        :param ext: (Opcional) Extensión de los archivos (ej. '.tif').
+        :param fields: (Opcional) Valores de los campos (ej. product='PPI', tile='30STG').
+        :return: Lista de CatalogueEntry ordenada por ruta.
+        """
+        if not self._scanned:
+            self.scan()
+        with self._lock:
+            # Los archivos borrados fuera de pyvpp desaparecen del índice
+            for path in [path for path, entry in self._entries.items()
+                         if not os.path.exists(entry.archive or path)]:
+                del self._entries[path]
+            entries = list(self._entries.values())
+        return sorted((entry for entry in entries
+                       if (ext is None or entry.path.endswith(ext))
+                       and all(getattr(entry, key) == value for key, value in fields.items())),
+                      key=lambda entry: entry.path)
+
+    def groups(self, ext='.tif'):
+        """
+        Agrupa los archivos por fecha, producto y temporada (las dos temporadas de un producto
+        fenológico son grupos distintos).
+
+        :param ext: (Opcional) Extensión de los archivos.
+        :return: Lista ordenada de tuplas (fecha, producto, temporada o None, rutas).
+        """
+        groups = {}
+        for entry in self.entries(ext):
+            groups.setdefault((entry.date, entry.product, entry.season), []).append(entry.path)
+        return [(date, product, season, paths) for (date, product, season), paths
+                in sorted(groups.items(), key=lambda item: (item[0][:2], item[0][2] or ''))]
+
+    def __len__(self):
+        return len(self.entries())
@@ -0,0 +1,258 @@
+import os
+import numpy as np
+from affine import Affine
+from rasterio.crs import CRS
+
+
+# Formatos de cubo disponibles y extensión de archivo de cada uno
+CUBE_FORMATS = {'zarr': '.zarr', 'netcdf': '.nc'}
+
+# Chunks por defecto (time, y, x): largos en el tiempo y pequeños en el espacio,
+# para que leer la serie temporal de un píxel toque pocos chunks
+CUBE_CHUNKS = (64, 128, 128)
+
+# Fechas en formato CF para los archivos NetCDF
+TIME_UNITS = 'days since 1970-01-01'
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def to_datetime(date):
+    """
+    Convierte la fecha de un nombre de archivo HR-VPP ('YYYYMMDD' o 'YYYY') en datetime64.
+
+    :param date: Fecha como texto.
+    :return: numpy.datetime64 con precisión de día.
+    """
+    date = str(date)
+    if len(date) == 4:
+        date = f"{date}0101"
+    return np.datetime64(f"{date[:4]}-{date[4:6]}-{date[6:8]}", 'D')
+
+
+def _import_xarray():
+    try:
+        import xarray as xr
+    except ImportError:
+        raise ImportError("Zarr output needs xarray and zarr: pip install pyvpp[cube]")
+    return xr
+
+
+def _import_zarr():
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("Zarr output needs xarray and zarr: pip install pyvpp[cube]")
+    return zarr
+
+
+def _grid_coords(transform, width, height):
+    """
+    Coordenadas x/y de los centros de píxel de una rejilla norte-arriba.
+    """
+    xs = transform.c + transform.a * (np.arange(width) + 0.5)
+    ys = transform.f + transform.e * (np.arange(height) + 0.5)
+    return xs, ys
+
+
+class CubeWriter:
+    """
+    Escribe todas las fechas de un producto en un único cubo (time, y, x) comprimido y
+    por chunks, en Zarr o NetCDF, con coordenadas de tiempo y metadatos CRS (convención CF).
+    Las fechas se añaden una a una al final del eje time según se van procesando y, al cerrar,
+    el eje se ordena una sola vez (cada corte se mueve como mucho una vez), así que el cubo
+    queda ordenado aunque lleguen fechas anteriores a las que ya contiene. Si el cubo ya existe,
+    se abre para añadir fechas (con la misma rejilla) y se ignoran (o se sobrescriben) las que ya contiene.
+    """
+
+    def __init__(self, path, fmt, product, meta, chunks=CUBE_CHUNKS):
+        """
+        :param path: Ruta del cubo (.zarr o .nc).
+        :param fmt: Formato ('zarr' o 'netcdf').
+        :param product: Nombre del producto (nombre de la variable del cubo).
+        :param meta: Metadatos de rasterio del recorte (CRS, transform, tamaño, tipo, nodata).
+        :param chunks: Tamaño de chunk (time, y, x).
+        """
+        if fmt not in CUBE_FORMATS:
+            raise ValueError(f"Unknown cube format '{fmt}'. Options: {list(CUBE_FORMATS)}")
+
+        self.path = path
+        self.fmt = fmt
+        self.product = product
+        self.meta = meta
+        self.chunks = (chunks[0], min(chunks[1], meta['height']), min(chunks[2], meta['width']))
+        self._nc = None
+
+        if fmt == 'netcdf':
+            self._open_netcdf()
+        self._check_stored_grid()
+        # Fechas del eje time, en el orden en que están en el cubo (un cubo que no se cerró
+        # correctamente puede tener fechas sin ordenar)
+        self.times = self._stored_times()
+        self._sort()
+
+    def _crs_attrs(self):
+        """
+        Atributos de la variable 'spatial_ref' (CF grid_mapping, legibles por GDAL y rioxarray).
+        """
+        t = self.meta['transform']
+        return {
+            'crs_wkt': self.meta['crs'].to_wkt(),
+            'spatial_ref': self.meta['crs'].to_wkt(),
+            'GeoTransform': f"{t.c} {t.a} {t.b} {t.f} {t.d} {t.e}",
+        }
+
+    def _open_netcdf(self):
+        try:
+            import netCDF4
+        except ImportError:
+            raise ImportError("NetCDF output needs netCDF4: pip install pyvpp[cube]")
+
+        if os.path.exists(self.path):
+            self._nc = netCDF4.Dataset(self.path, 'a')
+            return
+
+        xs, ys = _grid_coords(self.meta['transform'], self.meta['width'], self.meta['height'])
+        nc = netCDF4.Dataset(self.path, 'w')
+        nc.createDimension('time', None)
+        nc.createDimension('y', len(ys))
+        nc.createDimension('x', len(xs))
+
+        time = nc.createVariable('time', 'f8', ('time',))
+        time.units = TIME_UNITS
+        time.calendar = 'standard'
+        nc.createVariable('y', 'f8', ('y',))[:] = ys
+        nc.createVariable('x', 'f8', ('x',))[:] = xs
+
+        spatial_ref = nc.createVariable('spatial_ref', 'i4')
+        spatial_ref.setncatts(self._crs_attrs())
+
+        var = nc.createVariable(self.product, self.meta['dtype'], ('time', 'y', 'x'),
+                                zlib=True, complevel=4, chunksizes=self.chunks,
+                                fill_value=self.meta['nodata'])
+        var.grid_mapping = 'spatial_ref'
+        self._nc = nc
+
+    def _variables(self):
+        """
+        :return: Tupla (time, variable del producto) del cubo abierto, con los valores sin decodificar
+            (time en días desde 1970-01-01), o (None, None) si el cubo Zarr aún no existe.
+        """
+        if self.fmt == 'netcdf':
+            return self._nc['time'], self._nc[self.product]
+        if not os.path.exists(self.path):
+            return None, None
+        group = _import_zarr().open_group(self.path, mode='r+')
+        return group['time'], group[self.product]
+
+    def _stored_times(self):
+        time, _ = self._variables()
+        if time is None or time.shape[0] == 0:
+            return []
+        return list(EPOCH + np.asarray(time[:]).astype('timedelta64[D]'))
+
+    def _check_grid(self, crs, transform, width, height, what):
+        if ((width, height) != (self.meta['width'], self.meta['height'])
+                or not Affine(*transform[:6]).almost_equals(self.meta['transform'])
+                or CRS.from_user_input(crs) != self.meta['crs']):
+            raise ValueError(f"{what} does not match the {self.product} cube grid ({self.path})")
+
+    def _check_stored_grid(self):
+        """
+        Comprueba que el cubo existente tiene la rejilla (CRS, transform y tamaño) de los recortes.
+        """
+        _, var = self._variables()
+        if var is None:
+            return
+        if self.fmt == 'netcdf':
+            attrs = self._nc['spatial_ref'].__dict__
+        else:
+            attrs = _import_zarr().open_group(self.path, mode='r')['spatial_ref'].attrs
+        c, a, b, f, d, e = (float(v) for v in attrs['GeoTransform'].split())
+        self._check_grid(attrs['crs_wkt'], Affine(a, b, c, d, e, f), var.shape[2], var.shape[1], "Raster grid")
+
+    def _sort(self):
+        """
+        Ordena el eje time moviendo cada corte fuera de su sitio una sola vez (por ciclos de
+        la permutación), sin cargar el cubo completo en memoria.
+        """
+        order = sorted(range(len(self.times)), key=lambda i: self.times[i])
+        if order == list(range(len(order))):
+            return
+        time, var = self._variables()
+        done = [False] * len(order)
+        for start in range(len(order)):
+            if done[start] or order[start] == start:
+                continue
+            # La posición j recibe el corte que está en order[j]
+            saved = (time[start], var[start])
+            j = start
+            while order[j] != start:
+                time[j], var[j] = time[order[j]], var[order[j]]
+                done[j] = True
+                j = order[j]
+            time[j], var[j] = saved
+            done[j] = True
+        if self._nc is not None:
+            self._nc.sync()
+        self.times = [self.times[i] for i in order]
+
+    def append(self, date, array, meta=None, overwrite=False):
+        """
+        Añade una fecha al final del eje time (se lleva a su posición al cerrar el cubo).
+
+        :param date: Fecha ('YYYYMMDD' o 'YYYY').
+        :param array: Array (1, alto, ancho) o (alto, ancho) con el recorte de esa fecha.
+        :param meta: (Opcional) Metadatos del recorte, para comprobar que la rejilla (CRS, transform
+            y tamaño) coincide con la del cubo.
+        :param overwrite: (Opcional) Si la fecha ya está en el cubo, sobrescribir su corte
+            (ej. porque sus productos de origen han cambiado) en lugar de ignorarla.
+        :return: True si se ha escrito la fecha, False si ya estaba en el cubo y no se ha sobrescrito.
+        """
+        if meta is not None:
+            self._check_grid(meta['crs'], meta['transform'], meta['width'], meta['height'], f"Raster grid for {date}")
+
+        when = to_datetime(date)
+        array = array[0] if array.ndim == 3 else array
+        if when in self.times:
+            if not overwrite:
+                print(f"Date {date} already in {self.path}, skipping.")
+                return False
+            _, var = self._variables()
+            var[self.times.index(when)] = array
+        else:
+            n = len(self.times)
+            if self.fmt == 'netcdf':
+                self._nc['time'][n] = (when - EPOCH).astype(int)
+                self._nc[self.product][n] = array
+            else:
+                self._append_zarr(when, array)
+            self.times.append(when)
+        if self._nc is not None:
+            self._nc.sync()
+        return True
+
+    def _append_zarr(self, when, array):
+        xr = _import_xarray()
+        xs, ys = _grid_coords(self.meta['transform'], self.meta['width'], self.meta['height'])
+        data = xr.DataArray(array[np.newaxis], dims=('time', 'y', 'x'),
+                            coords={'time': [when.astype('datetime64[ns]')], 'y': ys, 'x': xs},
+                            attrs={'grid_mapping': 'spatial_ref'})
+        ds = xr.Dataset({self.product: data})
+
+        if not os.path.exists(self.path):
+            ds['spatial_ref'] = xr.DataArray(0, attrs=self._crs_attrs())
+            ds.to_zarr(self.path, mode='w', encoding={
+                self.product: {'chunks': self.chunks, '_FillValue': self.meta['nodata']},
+                'time': {'units': TIME_UNITS, 'dtype': 'f8'},
+            })
+        else:
+            ds.to_zarr(self.path, append_dim='time')
+
+    def close(self):
+        """
+        Ordena el eje time y cierra el cubo (el cierre solo es necesario para NetCDF).
+        """
+        self._sort()
+        if self._nc is not None:
+            self._nc.close()
+            self._nc = None
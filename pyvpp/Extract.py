@@ -0,0 +1,135 @@
+import numpy as np
+import rasterio
+from contextlib import ExitStack
+from rasterio.features import geometry_mask
+from rasterio.windows import Window
+from .Mosaic import _open_sources, _read_block, output_grid
+from .RunReport import timed
+
+
+# Estadísticos disponibles para resumir los píxeles de cada polígono
+STATS = {
+    'mean': np.mean,
+    'median': np.median,
+    'min': np.min,
+    'max': np.max,
+    'std': np.std,
+}
+
+
+def _valid(values, nodata):
+    """
+    :return: Máscara de los valores con dato (distintos de nodata y de NaN).
+    """
+    valid = np.ones(values.shape, dtype=bool) if nodata is None else values != nodata
+    if values.dtype.kind == 'f':
+        valid &= ~np.isnan(values)
+    return valid
+
+
+def sample_points(paths, points):
+    """
+    Lee el valor de cada punto directamente de los tiles de una fecha y producto, sin mosaico.
+
+    Las coordenadas se convierten a píxeles de cada tile de forma vectorizada y los puntos
+    se agrupan por bloque interno del GeoTIFF, así que cada bloque con puntos se lee una
+    sola vez y solo en la ventana que ocupan. Como en el mosaico, gana el primer tile con dato.
+
+    :param paths: Rutas de los tiles.
+    :param points: GeoSeries de puntos (cualquier CRS).
+    :return: Array float64 con el valor de cada punto (NaN si no hay dato).
+    """
+    values = np.full(len(points), np.nan)
+    pending = np.ones(len(points), dtype=bool)
+    coords = {}
+
+    for path in paths:
+        if not pending.any():
+            break
+        with rasterio.open(path) as src:
+            # Los puntos se proyectan una sola vez por CRS (los tiles de otro huso tienen otro)
+            key = src.crs.to_string()
+            if key not in coords:
+                projected = points.to_crs(src.crs)
+                coords[key] = (projected.x.to_numpy(), projected.y.to_numpy())
+            cols, rows = ~src.transform * coords[key]
+            rows, cols = np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+
+            inside = pending & (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+            index = np.flatnonzero(inside)
+            if not len(index):
+                continue
+
+            # Agrupar los puntos por bloque interno del tile
+            block_h, block_w = src.block_shapes[0]
+            blocks = (rows[index] // block_h) * (src.width // block_w + 1) + cols[index] // block_w
+            order = np.argsort(blocks, kind='stable')
+            index, blocks = index[order], blocks[order]
+            starts = np.flatnonzero(blocks[1:] != blocks[:-1]) + 1
+
+            with timed('read'):
+                for group in np.split(index, starts):
+                    r, c = rows[group], cols[group]
+                    row0, col0 = r.min(), c.min()
+                    window = Window(col0, row0, c.max() - col0 + 1, r.max() - row0 + 1)
+                    data = src.read(1, window=window)[r - row0, c - col0]
+                    valid = _valid(data, src.nodata)
+                    values[group[valid]] = data[valid]
+                    pending[group[valid]] = False
+
+    return values
+
+
+def zonal_values(paths, polygons, stat='mean'):
+    """
+    Resume los píxeles de cada polígono leyendo solo la ventana que ocupa en los tiles.
+
+    :param paths: Rutas de los tiles.
+    :param polygons: GeoSeries de polígonos (cualquier CRS).
+    :param stat: (Opcional) Estadístico: 'mean', 'median', 'min', 'max' o 'std'.
+    :return: Array float64 con el valor de cada polígono (NaN si no hay dato).
+    """
+    values = np.full(len(polygons), np.nan)
+    with ExitStack() as stack:
+        sources = _open_sources(stack, paths)
+        ref = sources[0]
+        nodata = ref.nodata if ref.nodata is not None else 0
+
+        for i, geom in enumerate(polygons.to_crs(ref.crs)):
+            if geom is None or geom.is_empty:
+                continue
+            grid = output_grid(sources, geom)
+            if grid is None:
+                continue
+            transform, width, height = grid
+            with timed('read'):
+                block = _read_block(sources, transform, width, height, 1, ref.dtypes[0], nodata)[0]
+
+            inside = ~geometry_mask([geom], out_shape=block.shape, transform=transform)
+            if not inside.any():
+                # Polígonos más pequeños que un píxel: los píxeles que toca
+                inside = ~geometry_mask([geom], out_shape=block.shape, transform=transform, all_touched=True)
+            data = block[inside]
+            data = data[_valid(data, nodata)]
+            if data.size:
+                values[i] = STATS[stat](data)
+
+    return values
+
+
+def extract_group(paths, features, stat='mean'):
+    """
+    Extrae el valor de cada entidad (puntos y/o polígonos) para una fecha y producto.
+
+    :param paths: Rutas de los tiles de una misma fecha y producto.
+    :param features: GeoSeries de geometrías.
+    :param stat: (Opcional) Estadístico de los polígonos (ver STATS).
+    :return: Array float64 con un valor por entidad (NaN si no hay dato).
+    """
+    values = np.full(len(features), np.nan)
+    is_point = (features.geom_type == 'Point').to_numpy()
+    if is_point.any():
+        values[is_point] = sample_points(paths, features[is_point])
+    if not is_point.all():
+        values[~is_point] = zonal_values(paths, features[~is_point], stat)
+    return values
@@ -0,0 +1,57 @@
+import os
+
+
+def create_hdarc(user, password):
+    """
+    Crea un archivo .hdarc con las credenciales proporcionadas en el formato correcto
+    para la nueva versión de la librería HDA.
+    
+    :param user: Nombre de usuario de Wekeo.
+    :param password: Contraseña de Wekeo.
+    """
+    # Formato correcto según la documentación actualizada de HDA
+    hdarc_content = f"user: {user}\npassword: {password}\n"
+
+    # Guardar el contenido en el archivo .hdarc en el directorio del usuario
+    home_directory = os.path.expanduser("~")
+    hdarc_path = os.path.join(home_directory, ".hdarc")
+
+    with open(hdarc_path, "w") as hdarc_file:
+        hdarc_file.write(hdarc_content)
+    print(f"Archivo .hdarc creado en: {hdarc_path}")
+
+
+def delete_hdarc():
+    """
+    Elimina el archivo .hdarc del directorio del usuario si existe.
+    """
+    home_directory = os.path.expanduser("~")
+    hdarc_path = os.path.join(home_directory, ".hdarc")
+
+    if os.path.exists(hdarc_path):
+        os.remove(hdarc_path)
+        print(f"Archivo .hdarc eliminado de: {hdarc_path}")
+    else:
+        print("No se encontró el archivo .hdarc.")
+
+
+def clean_old_hdarc():
+    """
+    Limpia archivos .hdarc antiguos (anteriores a marzo 2024) que puedan tener
+    la línea 'url:' que ya no es necesaria.
+    """
+    home_directory = os.path.expanduser("~")
+    hdarc_path = os.path.join(home_directory, ".hdarc")
+    
+    if os.path.exists(hdarc_path):
+        with open(hdarc_path, 'r') as f:
+            lines = f.readlines()
+        
+        # Filtrar líneas que NO contengan 'url:'
+        new_lines = [line for line in lines if not line.strip().startswith('url:')]
+        
+        # Reescribir el archivo sin la línea url
+        if len(new_lines) != len(lines):
+            with open(hdarc_path, 'w') as f:
+                f.writelines(new_lines)
+            print(f"Archivo .hdarc actualizado (eliminada línea 'url:')")
@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Opciones de cada trabajo según a qué paso del proceso se pasan
+DOWNLOADER_OPTIONS = ('user', 'password', 'max_workers', 'rate_limit', 'cache_dir', 'cache_size',
+                      'prefilter', 'incremental', 'aoi_cache')
+DOWNLOAD_OPTIONS = ('engine', 'concurrency')
+CLIP_OPTIONS = ('streaming', 'block_size', 'processes', 'profile', 'bigtiff', 'output', 'qflag', 'rescale',
+                'delete_archives')
+ZONAL_OPTIONS = ('features', 'id_column', 'stats', 'output', 'source')
+JOB_KEYS = ('name', 'dataset', 'shape', 'sites', 'dates', 'products', 'output_dir', 'clean', 'zonal_stats') \
+    + DOWNLOADER_OPTIONS + DOWNLOAD_OPTIONS + CLIP_OPTIONS
+REQUIRED_KEYS = ('dataset', 'dates', 'products')
+# Opciones que solo tienen sentido con un único AOI ('shape')
+SINGLE_SITE_KEYS = ('incremental', 'zonal_stats')
+
+
+class JobFileError(ValueError):
+    pass
+
+
+def _read_job_file(path):
+    """
+    Lee un archivo de trabajos YAML (.yaml/.yml, necesita PyYAML) o TOML (.toml).
+
+    :param path: Ruta al archivo.
+    :return: Diccionario con el contenido.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML job files need PyYAML: pip install pyvpp[cli]")
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError("TOML job files need tomli on Python < 3.11: pip install pyvpp[cli]")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    raise JobFileError(f"Unknown job file format '{ext}'. Use .yaml, .yml or .toml")
+
+
+def load_jobs(path):
+    """
+    Carga y valida los trabajos de un archivo, aplicando los valores por defecto.
+
+    :param path: Ruta al archivo de trabajos (YAML o TOML).
+    :return: Lista de diccionarios, uno por trabajo.
+    """
+    content = _read_job_file(path)
+    if not isinstance(content, dict) or not isinstance(content.get('jobs'), list) or not content['jobs']:
+        raise JobFileError(f"{path}: expected a non-empty 'jobs' list")
+    defaults = content.get('defaults') or {}
+
+    jobs, names = [], set()
+    for i, entry in enumerate(content['jobs'], 1):
+        job = {**defaults, **entry}
+        job.setdefault('name', f"job{i}")
+        name = job['name']
+
+        unknown = sorted(set(job) - set(JOB_KEYS))
+        if unknown:
+            raise JobFileError(f"Job '{name}': unknown keys {unknown}")
+        missing = [key for key in REQUIRED_KEYS if key not in job]
+        if ('shape' in job) == ('sites' in job):
+            missing.append("'shape' or 'sites' (exactly one)")
+        if missing:
+            raise JobFileError(f"Job '{name}': missing {missing}")
+        if 'sites' in job:
+            for key in SINGLE_SITE_KEYS:
+                if key in entry:
+                    raise JobFileError(f"Job '{name}': '{key}' is not available for multi-site jobs")
+                # Los valores por defecto de un solo AOI no se aplican a los trabajos multi-sitio
+                job.pop(key, None)
+        zonal = job.get('zonal_stats')
+        if zonal is not None and (not isinstance(zonal, dict) or set(zonal) - set(ZONAL_OPTIONS)):
+            raise JobFileError(f"Job '{name}': 'zonal_stats' must be a table with keys {list(ZONAL_OPTIONS)}")
+        if name in names:
+            raise JobFileError(f"Duplicated job name '{name}'")
+        names.add(name)
+
+        # Cada trabajo escribe en su propia carpeta, dentro de output_dir si se indica
+        if 'output_dir' not in entry:
+            job['output_dir'] = os.path.join(defaults.get('output_dir', 'pyhda'), name)
+        job['dates'] = [str(date) for date in job['dates']]
+        jobs.append(job)
+    return jobs
+
+
+class EventLog:
+    """
+    Escribe eventos como JSON lines (seguro entre hilos).
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': datetime.now().isoformat(timespec='seconds'), **fields}
+        with self._lock:
+            self.stream.write(json.dumps(record, default=str) + '\n')
+            self.stream.flush()
+
+
+def run_job(job, log, dry_run=False):
+    """
+    Ejecuta un trabajo completo (descarga, mosaico/recorte y limpieza) informando de cada paso.
+
+    :param job: Diccionario del trabajo (ver load_jobs).
+    :param log: EventLog donde escribir los eventos.
+    :param dry_run: (Opcional) Solo contar los resultados de búsqueda, sin descargar.
+    :return: Estado del trabajo: 'ok', 'partial' (alguna descarga fallida) o 'failed'.
+    """
+    from .WekeoBatch import wekeo_batch
+    from .WekeoDownload import wekeo_download
+
+    name = job['name']
+    start = time.perf_counter()
+    log.emit('job_start', job=name, dataset=job['dataset'], products=job['products'], dates=job['dates'])
+    try:
+        options = {key: job[key] for key in DOWNLOADER_OPTIONS if key in job}
+        if 'sites' in job:
+            downloader = wekeo_batch(job['dataset'], job['sites'], job['dates'], job['products'],
+                                     output_dir=job['output_dir'], **options)
+        else:
+            downloader = wekeo_download(job['dataset'], job['shape'], job['dates'], job['products'],
+                                        output_dir=job['output_dir'], **options)
+
+        if dry_run:
+            matches = downloader.count_matches()
+            log.emit('job_end', job=name, status='ok', elapsed=round(time.perf_counter() - start, 3),
+                     matches=matches)
+            return 'ok'
+
+        t = time.perf_counter()
+        downloader.download(**{key: job[key] for key in DOWNLOAD_OPTIONS if key in job})
+        elapsed = time.perf_counter() - t
+        summary = downloader.download_summary
+        downloaded = sum(s['downloaded'] for s in summary.values())
+        failed = sum(s['failed'] for s in summary.values())
+        size = sum(s['bytes'] for s in summary.values())
+        log.emit('stage', job=name, stage='download', elapsed=round(elapsed, 3), downloaded=downloaded,
+                 failed=failed, bytes=size, mb_per_s=round(size / 1024 ** 2 / elapsed, 3) if elapsed else None,
+                 products=summary)
+
+        t = time.perf_counter()
+        clip_options = {key: job[key] for key in CLIP_OPTIONS if key in job}
+        clip_options.setdefault('delete_archives', job.get('clean', True))
+        if 'sites' in job:
+            # Cada sitio se limpia con su carpeta bloqueada, justo después de procesarlo
+            clip_options['clean'] = job.get('clean', True)
+        downloader.mosaic_and_clip(**clip_options)
+        log.emit('stage', job=name, stage='mosaic_and_clip', elapsed=round(time.perf_counter() - t, 3))
+
+        if job.get('clean', True):
+            downloader.clean()
+
+        # Después de la limpieza, que conserva los recortes y borraría la tabla de resultados
+        if job.get('zonal_stats') is not None:
+            options = dict(job['zonal_stats'])
+            options.setdefault('output', os.path.join(job['output_dir'], 'zonal_stats.csv'))
+            t = time.perf_counter()
+            downloader.zonal_stats(**options)
+            log.emit('stage', job=name, stage='zonal_stats', elapsed=round(time.perf_counter() - t, 3),
+                     output=options['output'])
+
+        status = 'partial' if failed else 'ok'
+        log.emit('job_end', job=name, status=status, elapsed=round(time.perf_counter() - start, 3),
+                 output_dir=job['output_dir'], report=downloader.report.to_dict(items=False))
+        return status
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        log.emit('job_end', job=name, status='failed', elapsed=round(time.perf_counter() - start, 3),
+                 error=f"{type(e).__name__}: {e}")
+        return 'failed'
+
+
+def main(argv=None):
+    """
+    Punto de entrada del comando `pyvpp` (y de `python -m pyvpp`).
+
+    :param argv: (Opcional) Argumentos de la línea de comandos.
+    :return: Código de salida: 0 si todo fue bien, 1 si algún trabajo falló o terminó con descargas
+        fallidas (estado 'partial'), 2 si el archivo no es válido.
+    """
+    parser = argparse.ArgumentParser(
+        prog='pyvpp', description='Run PyVPP download and processing jobs.',
+        epilog="The job file has a 'jobs' list (dataset, shape or sites, dates, products and any "
+               "wekeo_download / mosaic_and_clip option) and optional 'defaults'. Progress, throughput "
+               "and failures are written as JSON lines; library messages go to stderr.")
+    parser.add_argument('jobfile', help='YAML or TOML job file')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='jobs to run in parallel (default: 1)')
+    parser.add_argument('--max-workers', type=int, help='download threads per job (overrides the job file)')
+    parser.add_argument('--engine', choices=['threads', 'async'], help='download engine (overrides the job file)')
+    parser.add_argument('--concurrency', type=int, help='concurrent transfers with --engine async')
+    parser.add_argument('--processes', type=int, help='mosaicking processes per job, 0 = all cores')
+    parser.add_argument('--only', action='append', metavar='NAME', help='run only this job (repeatable)')
+    parser.add_argument('--dry-run', action='store_true', help='only count the search results of each job')
+    parser.add_argument('--events', metavar='PATH', help='write the JSON lines events to a file instead of stdout')
+    args = parser.parse_args(argv)
+
+    events = open(args.events, 'a') if args.events else sys.stdout
+    log = EventLog(events)
+    try:
+        try:
+            jobs = load_jobs(args.jobfile)
+        except (OSError, ValueError, ImportError) as e:
+            log.emit('error', error=f"{type(e).__name__}: {e}")
+            return 2
+
+        if args.only:
+            jobs = [job for job in jobs if job['name'] in args.only]
+        overrides = {key: value for key, value in (('max_workers', args.max_workers), ('engine', args.engine),
+                                                   ('concurrency', args.concurrency), ('processes', args.processes))
+                     if value is not None}
+        if overrides.get('processes') == 0:
+            overrides['processes'] = None  # Todos los núcleos disponibles
+        for job in jobs:
+            job.update(overrides)
+
+        log.emit('run_start', jobfile=args.jobfile, jobs=[job['name'] for job in jobs], parallel=args.jobs)
+        start = time.perf_counter()
+
+        # Los mensajes de la librería van a stderr para no mezclarse con los eventos
+        with contextlib.redirect_stdout(sys.stderr):
+            with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+                statuses = list(executor.map(lambda job: run_job(job, log, args.dry_run), jobs))
+
+        counts = {status: statuses.count(status) for status in ('ok', 'partial', 'failed')}
+        log.emit('run_end', elapsed=round(time.perf_counter() - start, 3), **counts)
+        return 1 if counts['failed'] or counts['partial'] else 0
+    finally:
+        if events is not sys.stdout:
+            events.close()
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
+from .TileCache import _pid_alive
+
+
+# Nombre del manifiesto dentro de la carpeta de salida
+MANIFEST_NAME = 'pyvpp_manifest.json'
+
+# Archivo de bloqueo de una carpeta de salida compartida entre sesiones
+LOCK_NAME = '.pyvpp.lock'
+
+
+def aoi_hash(geometry):
+    """
+    Huella corta de la geometría del área de interés, para detectar cambios de AOI.
+
+    :param geometry: Geometría unificada del AOI (shapely).
+    :return: Hash hexadecimal de 16 caracteres.
+    """
+    return hashlib.sha1(geometry.wkb).hexdigest()[:16]
+
+
+@contextmanager
+def folder_lock(folder, poll=1.0):
+    """
+    Bloqueo exclusivo de una carpeta de salida entre sesiones (y entre hilos): crea el archivo
+    .pyvpp.lock con el PID del proceso y espera mientras lo tenga otra sesión. Los bloqueos
+    de procesos que ya no existen se descartan.
+
+    :param folder: Carpeta a bloquear.
+    :param poll: (Opcional) Segundos entre intentos mientras la carpeta está bloqueada.
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, LOCK_NAME)
+    waiting = False
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                with open(path) as f:
+                    pid = int(f.read())
+            except (OSError, ValueError):
+                # Recién creado por otra sesión, que aún no ha escrito su PID
+                pid = None
+            if pid is not None and not _pid_alive(pid):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            if not waiting:
+                print(f"Waiting for another session to release {folder}...")
+                waiting = True
+            time.sleep(poll)
+
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(os.getpid()))
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class RunManifest:
+    """
+    Registro de las salidas ya producidas en una carpeta: para cada
+    (dataset, producto, fecha, AOI) guarda el archivo de salida y los IDs de los
+    productos HDA de origen. Permite que una ejecución incremental solo descargue
+    y procese las fechas nuevas o cuyos tiles de origen han cambiado.
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: Carpeta de salida donde vive el manifiesto.
+        """
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f).get('entries', {})
+
+    @staticmethod
+    def key(dataset, product, date, aoi, season=None):
+        # La temporada solo forma parte de la clave en los productos fenológicos de dos temporadas
+        key = f"{dataset}|{product}|{date}|{aoi}"
+        return f"{key}|{season}" if season else key
+
+    def is_current(self, dataset, product, date, aoi, sources, season=None):
+        """
+        Comprueba si una salida ya existe y se produjo con exactamente los mismos productos de origen.
+
+        :param sources: IDs de los productos HDA de origen.
+        :param season: (Opcional) Temporada de los productos fenológicos ('s1', 's2').
+        :return: True si no hace falta volver a descargarla ni procesarla.
+        """
+        entry = self.entries.get(self.key(dataset, product, date, aoi, season))
+        return (entry is not None and entry['sources'] == sorted(sources)
+                and os.path.exists(os.path.join(self.folder, entry['output'])))
+
+    def record(self, dataset, product, date, aoi, sources, output, season=None):
+        """
+        Registra una salida producida.
+
+        :param sources: IDs de los productos HDA de origen.
+        :param output: Ruta (o nombre) del archivo de salida.
+        :param season: (Opcional) Temporada de los productos fenológicos ('s1', 's2').
+        """
+        self.entries[self.key(dataset, product, date, aoi, season)] = {
+            'output': os.path.basename(output),
+            'sources': sorted(sources),
+            'updated': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def save(self):
+        """
+        Guarda el manifiesto de forma atómica.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,400 @@
+import os
+import math
+import numpy as np
+import rasterio
+import rasterio.shutil
+from contextlib import ExitStack, contextmanager
+from affine import Affine
+from rasterio.features import geometry_mask
+from rasterio.merge import merge
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from shapely.geometry import box
+from .RunReport import timed
+
+
+# Perfiles de salida de los rasters recortados. El predictor se elige según el tipo de dato.
+OUTPUT_PROFILES = {
+    'default': {},
+    'deflate': {'tiled': True, 'blockxsize': 512, 'blockysize': 512, 'compress': 'deflate'},
+    'zstd': {'tiled': True, 'blockxsize': 512, 'blockysize': 512, 'compress': 'zstd'},
+    'cog': {'compress': 'deflate', 'blocksize': 512, 'overviews': 'auto', 'resampling': 'nearest'},
+}
+
+
+def _predictor(dtype):
+    """
+    :return: Predictor TIFF adecuado al tipo de dato (3 = coma flotante, 2 = enteros).
+    """
+    return 3 if np.dtype(dtype).kind == 'f' else 2
+
+
+@contextmanager
+def open_output(out_path, meta, profile='default', bigtiff=False):
+    """
+    Abre el raster de salida para escritura con el perfil indicado.
+
+    Los perfiles 'deflate' y 'zstd' escriben un GeoTIFF en teselas comprimido con predictor.
+    El perfil 'cog' escribe primero un GeoTIFF en teselas temporal y al cerrarlo lo convierte
+    en un Cloud Optimized GeoTIFF (con overviews), porque el driver COG de GDAL no permite
+    escribir por ventanas.
+
+    :param out_path: Ruta del raster de salida.
+    :param meta: Metadatos de rasterio (driver, tamaño, transform, CRS, tipo, nodata...).
+    :param profile: Perfil de salida ('default', 'deflate', 'zstd' o 'cog').
+    :param bigtiff: Forzar el formato BigTIFF (archivos de más de 4 GB).
+    :return: Dataset de rasterio abierto en modo escritura.
+    """
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile '{profile}'. Options: {list(OUTPUT_PROFILES)}")
+
+    options = dict(OUTPUT_PROFILES[profile])
+    if 'compress' in options:
+        options['predictor'] = _predictor(meta['dtype'])
+    if bigtiff:
+        options['bigtiff'] = 'YES'
+
+    if profile != 'cog':
+        dest = rasterio.open(out_path, "w", **meta, **options)
+        try:
+            yield dest
+        finally:
+            # Al cerrar se comprimen y se escriben las teselas pendientes
+            with timed('write'):
+                dest.close()
+        return
+
+    tmp_path = f"{out_path}.tmp.tif"
+    try:
+        dest = rasterio.open(tmp_path, "w", **meta, tiled=True, blockxsize=512, blockysize=512,
+                             bigtiff='YES' if bigtiff else 'IF_SAFER')
+        try:
+            yield dest
+        finally:
+            with timed('write'):
+                dest.close()
+        with timed('write'):
+            rasterio.shutil.copy(tmp_path, out_path, driver='COG', **options)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def site_geometry(gdf, crs):
+    """
+    Re-proyecta el área de interés al CRS de los rasters y la unifica en una sola geometría.
+
+    :param gdf: GeoDataFrame del área de interés.
+    :param crs: CRS de destino.
+    :return: Geometría unificada (shapely).
+    """
+    return gdf.to_crs(crs).geometry.unary_union
+
+
+def output_grid(sources, site_geom, clip_to_sources=True):
+    """
+    Calcula la rejilla de salida del recorte a partir de los límites del AOI, alineada
+    con la rejilla de píxeles del primer raster y limitada a la extensión de los rasters.
+
+    :param sources: Lista de datasets de rasterio abiertos (mismo CRS).
+    :param site_geom: Geometría del AOI en el CRS de los rasters.
+    :param clip_to_sources: Limitar la rejilla a la extensión de los rasters. Si es False,
+        la rejilla cubre siempre todo el AOI (necesario para apilar fechas en un cubo).
+    :return: Tupla (transform, width, height) o None si el AOI no se superpone con los rasters.
+    """
+    ref = sources[0].transform
+    res_x, res_y = ref.a, -ref.e
+
+    # Intersección entre el AOI y la extensión conjunta de los rasters
+    lefts, bottoms, rights, tops = zip(*[src.bounds for src in sources])
+    extent = box(min(lefts), min(bottoms), max(rights), max(tops))
+    if not extent.intersects(site_geom):
+        return None
+    if clip_to_sources:
+        minx, miny, maxx, maxy = extent.intersection(site_geom.envelope).bounds
+    else:
+        minx, miny, maxx, maxy = site_geom.bounds
+
+    # Ajustar los límites a la rejilla de píxeles del raster de referencia
+    left = ref.c + math.floor(round((minx - ref.c) / res_x, 6)) * res_x
+    top = ref.f - math.floor(round((ref.f - maxy) / res_y, 6)) * res_y
+    width = max(1, math.ceil(round((maxx - left) / res_x, 6)))
+    height = max(1, math.ceil(round((top - miny) / res_y, 6)))
+    return Affine(res_x, 0.0, left, 0.0, -res_y, top), width, height
+
+
+def _pixel_window(transform, left, bottom, right, top):
+    """
+    Ventana (en píxeles) de unos límites sobre una rejilla norte-arriba.
+    """
+    col0 = int(round((left - transform.c) / transform.a))
+    col1 = int(round((right - transform.c) / transform.a))
+    row0 = int(round((top - transform.f) / transform.e))
+    row1 = int(round((bottom - transform.f) / transform.e))
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+
+def _has_data(data, nodata):
+    """
+    Máscara de los píxeles con dato. Un nodata NaN se compara con isnan (NaN != NaN siempre).
+    """
+    if np.isnan(nodata):
+        return ~np.isnan(data)
+    return data != nodata
+
+
+def _read_block(sources, transform, width, height, count, dtype, nodata):
+    """
+    Compone un bloque de la rejilla de salida leyendo solo la ventana que lo intersecta
+    en cada raster de origen. Como en merge(method='first'), gana el primer raster con dato.
+
+    :return: Array (bandas, alto, ancho) del bloque.
+    """
+    block = np.full((count, height, width), nodata, dtype=dtype)
+    filled = np.zeros((height, width), dtype=bool)
+    b_left, b_top = transform.c, transform.f
+    b_right, b_bottom = transform * (width, height)
+
+    for src in sources:
+        s_left, s_bottom, s_right, s_top = src.bounds
+        left, right = max(b_left, s_left), min(b_right, s_right)
+        bottom, top = max(b_bottom, s_bottom), min(b_top, s_top)
+        if left >= right or bottom >= top:
+            continue
+
+        dst_win = _pixel_window(transform, left, bottom, right, top)
+        src_win = _pixel_window(src.transform, left, bottom, right, top)
+        if dst_win.width <= 0 or dst_win.height <= 0 or src_win.width <= 0 or src_win.height <= 0:
+            continue
+
+        data = src.read(window=src_win, out_shape=(count, dst_win.height, dst_win.width))
+        rows = slice(dst_win.row_off, dst_win.row_off + dst_win.height)
+        cols = slice(dst_win.col_off, dst_win.col_off + dst_win.width)
+
+        # Copiar solo los píxeles con dato que aún estén vacíos en el bloque
+        new = np.any(_has_data(data, nodata), axis=0) & ~filled[rows, cols]
+        block[:, rows, cols][:, new] = data[:, new]
+        filled[rows, cols] |= new
+
+        if filled.all():
+            break
+
+    return block
+
+
+def _open_sources(stack, paths, crs=None):
+    """
+    Abre los tiles de un grupo. Los de otros husos UTM se leen re-proyectados
+    (WarpedVRT) al CRS del primero (o al CRS indicado).
+
+    :param stack: ExitStack que se encarga de cerrarlos.
+    :param paths: Rutas de los tiles.
+    :param crs: (Opcional) CRS común de lectura.
+    :return: Lista de datasets de rasterio.
+    """
+    sources = [stack.enter_context(rasterio.open(path)) for path in paths]
+    crs = crs or sources[0].crs
+    return [src if src.crs == crs else stack.enter_context(WarpedVRT(src, crs=crs))
+            for src in sources]
+
+
+def aoi_grid(path, gdf):
+    """
+    Rejilla fija que cubre todo el AOI, alineada con la rejilla de píxeles de un tile.
+    Sirve para que todas las fechas de un producto compartan exactamente la misma rejilla.
+
+    :param path: Ruta de un tile de referencia.
+    :param gdf: GeoDataFrame del área de interés.
+    :return: Tupla (crs, transform, width, height) o None si el AOI no se superpone con el tile.
+    """
+    with rasterio.open(path) as src:
+        grid = output_grid([src], site_geometry(gdf, src.crs), clip_to_sources=False)
+        return None if grid is None else (src.crs,) + grid
+
+
+def _clip_meta(ref, transform, width, height, nodata):
+    """
+    Metadatos del raster recortado a partir de los del primer tile.
+    """
+    out_meta = ref.meta.copy()
+    out_meta.update({
+        "driver": "GTiff",
+        "height": height,
+        "width": width,
+        "transform": transform,
+        "crs": ref.crs,
+        "nodata": nodata
+    })
+    return out_meta
+
+
+def _open_flags(stack, correction, crs):
+    """
+    Abre los tiles de la capa de calidad de un grupo, una sola vez por grupo.
+
+    :return: Lista de datasets de rasterio, o None si la corrección no usa capa de calidad.
+    """
+    if correction is None or not correction.flag_paths:
+        return None
+    return _open_sources(stack, correction.flag_paths, crs)
+
+
+def _read_flags(flag_sources, transform, width, height):
+    """
+    Lee la capa de calidad (ya abierta, ver _open_flags) sobre la rejilla del recorte o un bloque de ella.
+
+    :return: Array (alto, ancho), o None si no hay capa de calidad.
+    """
+    if flag_sources is None:
+        return None
+    ref = flag_sources[0]
+    nodata = ref.nodata if ref.nodata is not None else 0
+    return _read_block(flag_sources, transform, width, height, 1, ref.dtypes[0], nodata)[0]
+
+
+def read_clip(paths, gdf, grid=None, correction=None):
+    """
+    Mosaico y recorte en una sola pasada y en memoria: el merge se hace directamente
+    sobre la extensión del AOI (merge(bounds=...)) y la máscara de la geometría se
+    aplica sobre el array resultante, sin escribir ningún mosaico intermedio.
+
+    :param paths: Rutas de los tiles de una misma fecha y producto.
+    :param gdf: GeoDataFrame del área de interés.
+    :param grid: (Opcional) Rejilla fija (crs, transform, width, height), ver aoi_grid.
+    :param correction: (Opcional) Máscara de calidad y escala a aplicar (ver Quality.ClipCorrection).
+    :return: Tupla (array, metadatos) o None si el AOI no se superpone con los tiles.
+    """
+    with ExitStack() as stack:
+        sources = _open_sources(stack, paths, grid[0] if grid else None)
+        ref = sources[0]
+
+        if grid is None:
+            site_geom = site_geometry(gdf, ref.crs)
+            grid = output_grid(sources, site_geom)
+            if grid is None:
+                return None
+        else:
+            site_geom = site_geometry(gdf, grid[0])
+            grid = grid[1:]
+        transform, width, height = grid
+        nodata = ref.nodata if ref.nodata is not None else 0
+
+        left, top = transform.c, transform.f
+        right, bottom = transform * (width, height)
+        with timed('merge'):
+            mosaic, out_trans = merge(sources, bounds=(left, bottom, right, top),
+                                      res=(transform.a, -transform.e), nodata=nodata)
+
+        # Aplicar la máscara del AOI en memoria
+        with timed('mask'):
+            outside = geometry_mask([site_geom], out_shape=mosaic.shape[1:], transform=out_trans)
+            mosaic[:, outside] = nodata
+
+        out_meta = _clip_meta(ref, out_trans, mosaic.shape[2], mosaic.shape[1], nodata)
+        if correction is not None:
+            with timed('correct'):
+                flags = _read_flags(_open_flags(stack, correction, ref.crs), out_trans,
+                                    mosaic.shape[2], mosaic.shape[1])
+                mosaic = correction.apply(mosaic, nodata, flags)
+                out_meta = correction.meta(out_meta)
+
+        return mosaic, out_meta
+
+
+def merge_clip(paths, gdf, out_path, profile='default', bigtiff=False, correction=None):
+    """
+    Mosaico y recorte en una sola pasada (ver read_clip) y escritura del resultado.
+
+    :param paths: Rutas de los tiles de una misma fecha y producto.
+    :param gdf: GeoDataFrame del área de interés.
+    :param out_path: Ruta del GeoTIFF recortado de salida.
+    :param profile: Perfil de salida (ver OUTPUT_PROFILES).
+    :param bigtiff: Forzar el formato BigTIFF.
+    :param correction: (Opcional) Máscara de calidad y escala (ver Quality.ClipCorrection).
+    :return: out_path, o None si el AOI no se superpone con los tiles.
+    """
+    clipped = read_clip(paths, gdf, correction=correction)
+    if clipped is None:
+        return None
+    out_image, out_meta = clipped
+    with open_output(out_path, out_meta, profile, bigtiff) as dest:
+        with timed('write'):
+            dest.write(out_image)
+    return out_path
+
+
+def stream_clip(paths, gdf, out_path, block_size=512, profile='default', bigtiff=False, correction=None):
+    """
+    Mosaico y recorte en streaming: calcula la rejilla de salida a partir del AOI y la
+    escribe bloque a bloque, leyendo de cada tile solo las ventanas que intersectan cada
+    bloque. El mosaico completo nunca se carga en memoria ni se escribe en disco, así que
+    el pico de memoria depende del tamaño de bloque, no del tamaño del mosaico.
+
+    :param paths: Rutas de los tiles de una misma fecha y producto.
+    :param gdf: GeoDataFrame del área de interés.
+    :param out_path: Ruta del GeoTIFF recortado de salida.
+    :param block_size: Tamaño (en píxeles) de los bloques de lectura/escritura.
+    :param profile: Perfil de salida (ver OUTPUT_PROFILES).
+    :param bigtiff: Forzar el formato BigTIFF.
+    :param correction: (Opcional) Máscara de calidad y escala, aplicada a cada bloque (ver Quality.ClipCorrection).
+    :return: out_path, o None si el AOI no se superpone con los tiles.
+    """
+    with ExitStack() as stack:
+        sources = _open_sources(stack, paths)
+        ref = sources[0]
+
+        site_geom = site_geometry(gdf, ref.crs)
+        grid = output_grid(sources, site_geom)
+        if grid is None:
+            return None
+        transform, width, height = grid
+        nodata = ref.nodata if ref.nodata is not None else 0
+        out_meta = _clip_meta(ref, transform, width, height, nodata)
+        if correction is not None:
+            out_meta = correction.meta(out_meta)
+        # La capa de calidad se abre una vez, junto a los tiles, y se lee por bloques como ellos
+        flag_sources = _open_flags(stack, correction, ref.crs)
+
+        with open_output(out_path, out_meta, profile, bigtiff) as dest:
+            for row in range(0, height, block_size):
+                for col in range(0, width, block_size):
+                    window = Window(col, row, min(block_size, width - col), min(block_size, height - row))
+                    block_transform = rasterio.windows.transform(window, transform)
+                    with timed('merge'):
+                        block = _read_block(sources, block_transform, window.width, window.height,
+                                            ref.count, ref.dtypes[0], nodata)
+
+                    # Aplicar la máscara del AOI al bloque
+                    with timed('mask'):
+                        outside = geometry_mask([site_geom], out_shape=(window.height, window.width),
+                                                transform=block_transform)
+                        block[:, outside] = nodata
+                    if correction is not None:
+                        with timed('correct'):
+                            flags = _read_flags(flag_sources, block_transform, window.width, window.height)
+                            block = correction.apply(block, nodata, flags)
+                    with timed('write'):
+                        dest.write(block, window=window)
+
+    return out_path
+
+
+def clip_group(paths, gdf, out_path, streaming=False, block_size=512, profile='default', bigtiff=False,
+               correction=None):
+    """
+    Mosaico y recorte de un grupo (fecha, producto). Es una función de módulo para
+    poder enviarse a un pool de procesos.
+
+    :param paths: Rutas de los tiles del grupo.
+    :param gdf: GeoDataFrame del área de interés.
+    :param out_path: Ruta del GeoTIFF recortado de salida.
+    :param streaming: Usar el modo streaming por bloques (ver stream_clip).
+    :param block_size: Tamaño de bloque en píxeles del modo streaming.
+    :param profile: Perfil de salida (ver OUTPUT_PROFILES).
+    :param bigtiff: Forzar el formato BigTIFF.
+    :param correction: (Opcional) Máscara de calidad y escala (ver Quality.ClipCorrection).
+    :return: out_path, o None si el AOI no se superpone con los tiles.
+    """
+    if streaming:
+        return stream_clip(paths, gdf, out_path, block_size, profile, bigtiff, correction)
+    return merge_clip(paths, gdf, out_path, profile, bigtiff, correction)
@@ -0,0 +1,105 @@
+import numpy as np
+import rasterio
+
+
+# Capa de calidad que acompaña a los productos HR-VPP de la misma fecha y tile
+QUALITY_PRODUCT = 'QFLAG'
+
+# Escala y offset de los productos HR-VPP (valor físico = valor * escala + offset).
+# Solo se usan si el raster no trae los suyos en los metadatos.
+PRODUCT_SCALES = {
+    'PPI': (0.0001, 0.0),
+    'MINV': (0.0001, 0.0),
+    'MAXV': (0.0001, 0.0),
+    'AMPL': (0.0001, 0.0),
+    'SOSV': (0.0001, 0.0),
+    'EOSV': (0.0001, 0.0),
+    'SPROD': (0.1, 0.0),
+    'TPROD': (0.1, 0.0),
+}
+
+
+def companion_paths(entries, flags):
+    """
+    Rutas de la capa de calidad de cada tile: la del mismo dataset, fecha, tile y temporada,
+    esté suelta o dentro de un zip.
+
+    :param entries: CatalogueEntry de los tiles del producto.
+    :param flags: Diccionario {(dataset, fecha, tile, temporada): ruta} de la capa de calidad.
+    :return: Lista de rutas, o None si falta la capa de calidad de algún tile.
+    """
+    paths = [flags.get((entry.dataset, entry.date, entry.tile, entry.season)) for entry in entries]
+    return None if None in paths else paths
+
+
+def raster_scale(path):
+    """
+    :return: Tupla (escala, offset) de la primera banda según los metadatos del raster.
+    """
+    with rasterio.open(path) as src:
+        return src.scales[0], src.offsets[0]
+
+
+class ClipCorrection:
+    """
+    Máscara de calidad y escala/offset que se aplican al recorte mientras está en memoria,
+    para obtener valores listos para el análisis en la misma pasada del mosaico.
+    Se envía a los procesos del pool junto con cada grupo fecha/producto.
+    """
+
+    def __init__(self, scale=1.0, offset=0.0, flag_paths=None, keep_flags=None):
+        """
+        :param scale: (Opcional) Factor de escala.
+        :param offset: (Opcional) Offset.
+        :param flag_paths: (Opcional) Rutas de la capa de calidad de cada tile (ver companion_paths).
+        :param keep_flags: (Opcional) Valores de la capa de calidad que se conservan (lista) o función
+            que recibe el array de la capa de calidad y devuelve True en los píxeles válidos.
+        """
+        self.scale = float(scale)
+        self.offset = float(offset)
+        self.flag_paths = flag_paths
+        self.keep_flags = keep_flags
+
+    @property
+    def rescale(self):
+        return self.scale != 1.0 or self.offset != 0.0
+
+    def meta(self, meta):
+        """
+        :return: Metadatos del recorte corregido (float32 con NaN como nodata si se escala).
+        """
+        meta = meta.copy()
+        if self.rescale:
+            meta.update({'dtype': 'float32', 'nodata': float('nan')})
+        return meta
+
+    def accepted(self, flags):
+        """
+        :return: Máscara de los píxeles con un valor de calidad aceptado.
+        """
+        if callable(self.keep_flags):
+            return np.asarray(self.keep_flags(flags), dtype=bool)
+        return np.isin(flags, list(self.keep_flags))
+
+    def apply(self, block, nodata, flags=None):
+        """
+        Enmascara y escala un bloque del recorte.
+
+        :param block: Array (bandas, alto, ancho) del recorte.
+        :param nodata: Valor sin dato del recorte.
+        :param flags: (Opcional) Array (alto, ancho) de la capa de calidad en la misma rejilla.
+        :return: Array corregido (float32 con NaN sin dato si se escala; si no, el tipo original).
+        """
+        invalid = block == nodata
+        if flags is not None:
+            invalid |= ~self.accepted(flags)
+
+        if not self.rescale:
+            block[invalid] = nodata
+            return block
+
+        out = block.astype('float32')
+        out *= np.float32(self.scale)
+        out += np.float32(self.offset)
+        out[invalid] = np.nan
+        return out
@@ -0,0 +1,194 @@
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# Tiempos de las sub-etapas (merge, mask, write...) de la tarea en curso en este hilo o proceso
+_timings = contextvars.ContextVar('pyvpp_timings', default=None)
+
+
+@contextmanager
+def timed(name):
+    """
+    Mide una sub-etapa de la tarea en curso (ver call_timed). Fuera de call_timed no hace nada.
+
+    :param name: Nombre de la sub-etapa (ej. 'merge', 'mask', 'write').
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def call_timed(func, *args):
+    """
+    Ejecuta func(*args) midiendo su duración total y las sub-etapas marcadas con timed().
+    Es una función de módulo para poder enviarse a un pool de procesos.
+
+    :return: Tupla (resultado, diccionario {sub-etapa: segundos, 'total': segundos}).
+    """
+    timings = {}
+    token = _timings.set(timings)
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    finally:
+        _timings.reset(token)
+    timings['total'] = time.perf_counter() - start
+    return result, timings
+
+
+def peak_rss_mb():
+    """
+    Pico de memoria residente (RSS) de este proceso y de sus procesos hijos ya terminados, en MB.
+
+    :return: Tupla (MB de este proceso, MB del mayor proceso hijo), o (None, None) si no se puede medir.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+class RunReport:
+    """
+    Informe estructurado de una ejecución: tiempos por etapa (search, download,
+    mosaic_and_clip, clean) y por elemento (página de búsqueda, tile descargado, grupo
+    fecha/producto procesado, con sus sub-etapas merge/mask/write), bytes descargados y
+    escritos, MB/s, número de tiles y pico de memoria.
+
+    Las funciones de hooks reciben (evento, datos) en cada 'stage_start', 'stage_end' e
+    'item', para enviar las métricas a otro sistema según se producen.
+    """
+
+    def __init__(self, hooks=None):
+        """
+        :param hooks: (Opcional) Lista de funciones hook(evento, datos).
+        """
+        self.hooks = list(hooks or [])
+        self.started = time.time()
+        self.stages = {}
+        self.items = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        """
+        :param hook: Función hook(evento, datos).
+        """
+        self.hooks.append(hook)
+
+    def _emit(self, event, data):
+        for hook in self.hooks:
+            try:
+                hook(event, data)
+            except Exception as e:
+                print(f"Error in report hook {hook!r}: {e}")
+
+    def _stage(self, name):
+        return self.stages.setdefault(name, {'elapsed': 0.0, 'items': 0, 'busy': 0.0, 'bytes': 0, 'timings': {}})
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Mide el tiempo real (wall time) de una etapa.
+
+        :param name: Nombre de la etapa.
+        """
+        self._emit('stage_start', {'stage': name})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stage(name)['elapsed'] += elapsed
+            self._emit('stage_end', {'stage': name, 'elapsed': elapsed})
+
+    def item(self, stage, name, elapsed, nbytes=0, timings=None, **fields):
+        """
+        Registra un elemento procesado dentro de una etapa.
+
+        :param stage: Nombre de la etapa.
+        :param name: Identificador del elemento (ej. ID de producto o 'fecha_producto').
+        :param elapsed: Duración en segundos.
+        :param nbytes: (Opcional) Bytes descargados o escritos.
+        :param timings: (Opcional) Tiempos de sub-etapas {nombre: segundos}.
+        :param fields: (Opcional) Otros campos (ej. tiles=4, cache_hit=True).
+        """
+        record = {'stage': stage, 'name': name, 'elapsed': round(elapsed, 4), 'bytes': nbytes, **fields}
+        if timings:
+            record['timings'] = {key: round(value, 4) for key, value in timings.items() if key != 'total'}
+        with self._lock:
+            self.items.append(record)
+            summary = self._stage(stage)
+            summary['items'] += 1
+            summary['busy'] += elapsed
+            summary['bytes'] += nbytes
+            for key, value in (timings or {}).items():
+                if key != 'total':
+                    summary['timings'][key] = summary['timings'].get(key, 0.0) + value
+        self._emit('item', record)
+
+    def count(self, name, value=1):
+        """
+        Suma un valor a un contador (ej. 'tiles_downloaded').
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self, items=True):
+        """
+        :param items: (Opcional) Incluir el detalle por elemento.
+        :return: Diccionario serializable a JSON con el informe.
+        """
+        own, children = peak_rss_mb()
+        with self._lock:
+            stages = {}
+            for name, summary in self.stages.items():
+                # Las etapas sin tiempo real propio (ej. search) usan la suma de sus elementos
+                elapsed = summary['elapsed'] or summary['busy']
+                stages[name] = {
+                    'elapsed': round(elapsed, 4),
+                    'items': summary['items'],
+                    'busy': round(summary['busy'], 4),
+                    'bytes': summary['bytes'],
+                    'mb_per_s': round(summary['bytes'] / 1024 ** 2 / elapsed, 3) if elapsed and summary['bytes'] else None,
+                    'timings': {key: round(value, 4) for key, value in summary['timings'].items()},
+                }
+            report = {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'elapsed': round(time.time() - self.started, 3),
+                'peak_rss_mb': own,
+                'peak_rss_children_mb': children,
+                'counters': dict(self.counters),
+                'stages': stages,
+            }
+            if items:
+                report['items'] = list(self.items)
+        return report
+
+    def to_json(self, path=None, items=True):
+        """
+        :param path: (Opcional) Archivo donde guardar el informe.
+        :param items: (Opcional) Incluir el detalle por elemento.
+        :return: Informe en JSON.
+        """
+        text = json.dumps(self.to_dict(items), indent=1)
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
@@ -0,0 +1,328 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import warnings
+import numpy as np
+from collections import OrderedDict
+from affine import Affine
+from pyproj import Transformer
+from rasterio.crs import CRS
+from .Archive import archive_members, extract_members, is_archive
+from .TileIndex import utm_zone
+
+
+# Carpeta por defecto de la caché en disco de índices de remuestreo
+DEFAULT_SWATH_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pyvpp", "swath")
+
+# Archivos de un producto SL_2_LST (.SEN3) que se leen: LST, geolocalización y banderas de nubes
+LST_FILE = 'LST_in.nc'
+GEODETIC_FILE = 'geodetic_in.nc'
+FLAGS_FILE = 'flags_in.nc'
+
+# Resolución nominal (m) de la LST de SLSTR
+SWATH_RESOLUTION = 1000
+
+# Inicio de la adquisición en el nombre (ej. 'S3A_SL_2_LST____20200105T101010_...')
+START_PATTERN = re.compile(r'_(\d{8}T\d{6})_')
+
+# Plataforma, órbita relativa y posición a lo largo de la órbita (frame) en el nombre
+# (ej. 'S3A_SL_2_LST____20200105T101010_20200105T101310_20200106T150000_0179_053_222_2340_LN2_O_NT_004.SEN3')
+ORBIT_PATTERN = re.compile(r'^(?P<platform>S3[AB])_SL_2_LST_+(?:\d{8}T\d{6}_){3}\d{4}_\d{3}_'
+                           r'(?P<orbit>\d{3})_(?P<frame>\d{4})_')
+
+# Desplazamiento máximo de la geolocalización (en fracción del píxel de la rejilla) para
+# reutilizar el índice de otra adquisición de la misma órbita relativa y frame
+MAX_SHIFT = 0.1
+
+# Reducción de las adquisiciones de un mismo día
+DAILY_STATS = {'mean': np.nanmean, 'min': np.nanmin, 'max': np.nanmax, 'median': np.nanmedian}
+
+
+def _import_kdtree():
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        raise ImportError("SLSTR regridding needs scipy: pip install pyvpp[slstr]")
+    return cKDTree
+
+
+def _import_netcdf():
+    try:
+        import netCDF4
+    except ImportError:
+        raise ImportError("SLSTR regridding needs netCDF4: pip install pyvpp[slstr]")
+    return netCDF4
+
+
+def acquisition_time(name):
+    """
+    :param name: Nombre del producto SLSTR (o ruta).
+    :return: numpy.datetime64 (UTC) del inicio de la adquisición, o None.
+    """
+    match = START_PATTERN.search(os.path.basename(name))
+    if match is None:
+        return None
+    when = match.group(1)
+    return np.datetime64(f"{when[:4]}-{when[4:6]}-{when[6:8]}T{when[9:11]}:{when[11:13]}:{when[13:15]}")
+
+
+def is_daytime(when, lon):
+    """
+    Pasada diurna o nocturna según la hora solar local en una longitud.
+
+    :param when: numpy.datetime64 (UTC) de la adquisición.
+    :param lon: Longitud en grados.
+    :return: True si la hora solar local está entre las 6 y las 18.
+    """
+    hours = (when - when.astype('datetime64[D]')) / np.timedelta64(1, 'h')
+    return 6 <= (hours + lon / 15) % 24 < 18
+
+
+def swath_grid(gdf, resolution=SWATH_RESOLUTION):
+    """
+    Rejilla regular que cubre el AOI en el huso UTM de su centro, con píxeles de `resolution` m.
+
+    :param gdf: GeoDataFrame del área de interés.
+    :param resolution: (Opcional) Tamaño de píxel en metros.
+    :return: Tupla (crs, transform, width, height).
+    """
+    lon, lat = gdf.to_crs("EPSG:4326").geometry.unary_union.centroid.coords[0]
+    crs = CRS.from_epsg((32600 if lat >= 0 else 32700) + utm_zone(lon))
+    minx, miny, maxx, maxy = gdf.to_crs(crs).total_bounds
+    left = np.floor(minx / resolution) * resolution
+    top = np.ceil(maxy / resolution) * resolution
+    width = max(1, int(np.ceil((maxx - left) / resolution)))
+    height = max(1, int(np.ceil((top - miny) / resolution)))
+    return crs, Affine(resolution, 0.0, left, 0.0, -resolution, top), width, height
+
+
+def _read_variable(nc, name):
+    """
+    Lee una variable aplicando escala, offset y _FillValue (NaN).
+    """
+    values = nc[name][:]
+    return np.ma.filled(values.astype('float64'), np.nan) if np.ma.isMaskedArray(values) else np.asarray(values)
+
+
+def read_swath(path, cloud_mask=True, workdir=None):
+    """
+    Lee la LST y la geolocalización de un producto SL_2_LST, en carpeta .SEN3 o en zip.
+    De los zips solo se extraen los archivos necesarios (netCDF4 no puede leer /vsizip/),
+    en una carpeta temporal que se elimina al terminar.
+
+    :param path: Ruta de la carpeta .SEN3 o del zip.
+    :param cloud_mask: (Opcional) Descartar los píxeles marcados como nube (cloud_in != 0).
+    :param workdir: (Opcional) Carpeta donde crear la carpeta temporal de extracción.
+    :return: Tupla (lon, lat, lst) de arrays 2D de la pasada; lst en K (float32, NaN sin dato).
+    """
+    netCDF4 = _import_netcdf()
+    wanted = (LST_FILE, GEODETIC_FILE, FLAGS_FILE if cloud_mask else None)
+    tmp = None
+    try:
+        if is_archive(path):
+            members = [name for name, _ in archive_members(path) if os.path.basename(name) in wanted]
+            tmp = tempfile.mkdtemp(prefix='.partial-', dir=workdir)
+            files = {os.path.basename(p): p for p in extract_members(path, members, tmp)}
+        else:
+            files = {name: os.path.join(path, name) for name in wanted
+                     if name and os.path.exists(os.path.join(path, name))}
+        missing = [name for name in (LST_FILE, GEODETIC_FILE) if name not in files]
+        if missing:
+            raise ValueError(f"{os.path.basename(path)} has no {', '.join(missing)}")
+
+        with netCDF4.Dataset(files[GEODETIC_FILE]) as nc:
+            lat = _read_variable(nc, 'latitude_in')
+            lon = _read_variable(nc, 'longitude_in')
+        with netCDF4.Dataset(files[LST_FILE]) as nc:
+            lst = _read_variable(nc, 'LST').astype('float32')
+        if cloud_mask and FLAGS_FILE in files:
+            with netCDF4.Dataset(files[FLAGS_FILE]) as nc:
+                if 'cloud_in' in nc.variables:
+                    cloud = np.ma.filled(nc['cloud_in'][:], 0)
+                    lst[cloud != 0] = np.nan
+        return lon, lat, lst
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def orbit_key(name):
+    """
+    :param name: Nombre del producto SLSTR (o ruta).
+    :return: Tupla (plataforma, órbita relativa, frame), o None si el nombre no los incluye.
+    """
+    match = ORBIT_PATTERN.match(os.path.basename(name))
+    return None if match is None else (match['platform'], match['orbit'], match['frame'])
+
+
+def geometry_key(lon, lat, grid, radius, name=None):
+    """
+    Clave de un índice de remuestreo: la geometría de la pasada y la rejilla de destino.
+    Las adquisiciones de la misma plataforma, órbita relativa y frame (que se repiten cada
+    ciclo sobre la misma traza) comparten la clave; si el nombre no los incluye, la clave es
+    un hash de la geolocalización y solo se comparte con la misma pasada.
+
+    :param name: (Opcional) Nombre del producto SLSTR (ver orbit_key).
+    """
+    crs, transform, width, height = grid
+    digest = hashlib.sha1()
+    orbit = orbit_key(name) if name else None
+    if orbit is not None:
+        digest.update(f"{'|'.join(orbit)}|{lon.shape}".encode())
+    else:
+        for array in (lon, lat):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(f"{crs.to_string()}|{tuple(transform)}|{width}|{height}|{radius}".encode())
+    return digest.hexdigest()
+
+
+class SwathIndex:
+    """
+    Índice de remuestreo (vecino más próximo) de una pasada sobre una rejilla regular:
+    qué píxel de la pasada cae en cada píxel de la rejilla. Se calcula una vez con un
+    KD-tree y después cada adquisición con la misma geometría se regrida con una sola
+    indexación de arrays.
+    """
+
+    def __init__(self, target, source, shape, xy=None):
+        """
+        :param target: Índices (planos) de los píxeles de la rejilla con dato.
+        :param source: Índices (planos) del píxel de la pasada de cada uno.
+        :param shape: Forma (alto, ancho) de la rejilla.
+        :param xy: (Opcional) Posición (2, n) en el CRS de la rejilla de los píxeles de la pasada
+            usados, para comprobar si el índice sirve para otra adquisición (ver fits).
+        """
+        self.target = target
+        self.source = source
+        self.shape = tuple(shape)
+        self.xy = xy
+
+    @classmethod
+    def build(cls, lon, lat, grid, radius):
+        """
+        :param lon: Longitudes de la pasada (2D).
+        :param lat: Latitudes de la pasada (2D).
+        :param grid: Rejilla de destino (crs, transform, width, height), ver swath_grid.
+        :param radius: Distancia máxima (m) entre un píxel de la rejilla y el de la pasada.
+        :return: SwathIndex.
+        """
+        cKDTree = _import_kdtree()
+        crs, transform, width, height = grid
+        left, top = transform.c, transform.f
+        right, bottom = transform * (width, height)
+
+        # Solo los píxeles de la pasada cerca de la rejilla entran en el árbol
+        valid = np.flatnonzero(np.isfinite(lon.ravel()) & np.isfinite(lat.ravel()))
+        x, y = Transformer.from_crs("EPSG:4326", crs, always_xy=True).transform(lon.ravel()[valid], lat.ravel()[valid])
+        near = (x >= left - radius) & (x <= right + radius) & (y >= bottom - radius) & (y <= top + radius)
+        if not near.any():
+            return cls(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), (height, width))
+
+        tree = cKDTree(np.column_stack([x[near], y[near]]))
+        xs = left + transform.a * (np.arange(width) + 0.5)
+        ys = top + transform.e * (np.arange(height) + 0.5)
+        gx, gy = np.meshgrid(xs, ys)
+        distance, nearest = tree.query(np.column_stack([gx.ravel(), gy.ravel()]), distance_upper_bound=radius)
+        found = np.isfinite(distance)
+        xy = np.vstack([x[near][nearest[found]], y[near][nearest[found]]])
+        return cls(np.flatnonzero(found), valid[near][nearest[found]], (height, width), xy)
+
+    def fits(self, lon, lat, grid, max_shift=MAX_SHIFT):
+        """
+        Comprueba que el índice sirve para otra adquisición: los píxeles de la pasada que usa
+        no se han desplazado más de max_shift píxeles de la rejilla. Solo se proyectan esos
+        píxeles, no toda la pasada.
+
+        :param max_shift: (Opcional) Desplazamiento máximo, en fracción del píxel de la rejilla.
+        :return: True si el índice se puede reutilizar con esta geolocalización.
+        """
+        if self.xy is None or self.source.size == 0 or self.source.max() >= lon.size:
+            return False
+        crs, transform, width, height = grid
+        x, y = Transformer.from_crs("EPSG:4326", crs, always_xy=True).transform(
+            lon.ravel()[self.source], lat.ravel()[self.source])
+        shift = np.hypot(x - self.xy[0], y - self.xy[1])
+        return bool(np.all(shift <= max_shift * abs(transform.a)))
+
+    def apply(self, values):
+        """
+        :param values: Array 2D de la pasada (misma forma que su geolocalización).
+        :return: Array float32 (alto, ancho) en la rejilla, NaN donde no hay dato.
+        """
+        out = np.full(self.shape, np.nan, dtype='float32')
+        out.ravel()[self.target] = values.ravel()[self.source]
+        return out
+
+
+class SwathIndexCache:
+    """
+    Caché de índices de remuestreo por geometría (plataforma, órbita relativa y frame, ver
+    geometry_key): en memoria (los últimos max_items) y, opcionalmente, en disco (un .npz por
+    geometría) para reutilizarlos entre ejecuciones. Antes de reutilizar un índice se comprueba
+    que la geolocalización de la pasada no se ha desplazado más de max_shift (ver SwathIndex.fits);
+    si no, se recalcula.
+    """
+
+    def __init__(self, cache_dir=None, max_items=8, max_shift=MAX_SHIFT):
+        """
+        :param cache_dir: (Opcional) Carpeta de la caché en disco (True = ~/.cache/pyvpp/swath).
+            Por defecto solo en memoria.
+        :param max_items: (Opcional) Índices que se mantienen en memoria.
+        :param max_shift: (Opcional) Desplazamiento máximo de la geolocalización, en fracción del
+            píxel de la rejilla, para reutilizar un índice (0 = solo la misma geolocalización).
+        """
+        self.cache_dir = DEFAULT_SWATH_CACHE_DIR if cache_dir is True else cache_dir
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_items = max_items
+        self.max_shift = max_shift
+        self._items = OrderedDict()
+
+    def get(self, lon, lat, grid, radius, name=None):
+        """
+        Devuelve el índice de una pasada, calculándolo solo si no está en caché.
+
+        :param name: (Opcional) Nombre del producto SLSTR, para compartir el índice entre
+            las adquisiciones de la misma órbita relativa y frame.
+        :return: Tupla (SwathIndex, True si era un acierto de caché).
+        """
+        key = geometry_key(lon, lat, grid, radius, name)
+        path = os.path.join(self.cache_dir, f"{key}.npz") if self.cache_dir else None
+
+        index = self._items.get(key)
+        if index is None and path is not None and os.path.exists(path):
+            with np.load(path) as data:
+                index = SwathIndex(data['target'], data['source'], data['shape'],
+                                   data['xy'] if 'xy' in data else None)
+        hit = index is not None and index.fits(lon, lat, grid, self.max_shift)
+        if not hit:
+            index = SwathIndex.build(lon, lat, grid, radius)
+            if path is not None:
+                # Escritura atómica: otra ejecución nunca lee un índice a medias
+                fd, tmp = tempfile.mkstemp(suffix='.npz', dir=self.cache_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, target=index.target, source=index.source, shape=index.shape,
+                             xy=index.xy)
+                os.replace(tmp, path)
+
+        self._items[key] = index
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+        return index, hit
+
+
+def daily_composite(layers, stat='mean'):
+    """
+    Combina las adquisiciones regridadas de un día.
+
+    :param layers: Lista de arrays (alto, ancho) en la misma rejilla.
+    :param stat: (Opcional) 'mean', 'min', 'max' o 'median'.
+    :return: Array float32 (alto, ancho), NaN donde ninguna adquisición tiene dato.
+    """
+    with warnings.catch_warnings():
+        # Píxeles sin dato en todas las adquisiciones del día
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return DAILY_STATS[stat](np.stack(layers), axis=0).astype('float32')
@@ -0,0 +1,210 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+
+
+# Carpeta por defecto de la caché de tiles (compartida entre ejecuciones)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pyvpp", "tiles")
+
+
+def _pid_alive(pid):
+    """
+    Comprueba si un proceso sigue vivo en esta máquina.
+
+    :param pid: Identificador del proceso.
+    :return: True si el proceso existe.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _link_or_copy(src, dst):
+    """
+    Enlaza (hard link) un archivo en su destino, o lo copia si el enlace no es posible
+    (por ejemplo, si origen y destino están en sistemas de archivos distintos). Las carpetas
+    (ej. productos SLSTR .SEN3) se recrean enlazando cada uno de sus archivos.
+    """
+    if os.path.isdir(src):
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst, copy_function=_link_or_copy)
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class TileCache:
+    """
+    Caché en disco de tiles descargados, direccionada por contenido
+    (ID de producto + checksum) y con expulsión LRU por tamaño.
+
+    Cada entrada es una carpeta en <cache_dir>/entries/<clave>. Las descargas se hacen
+    en <cache_dir>/partial y solo se mueven a entries (con un rename atómico) cuando
+    han terminado, así que una entrada nunca contiene archivos a medio descargar.
+    La fecha de modificación de cada entrada marca su último uso.
+    """
+
+    def __init__(self, cache_dir=None, max_size=None):
+        """
+        :param cache_dir: (Opcional) Carpeta de la caché. Por defecto ~/.cache/pyvpp/tiles
+        :param max_size: (Opcional) Tamaño máximo de la caché en bytes (None = sin límite)
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_size = max_size
+        self.entries_dir = os.path.join(self.cache_dir, "entries")
+        self.partial_dir = os.path.join(self.cache_dir, "partial")
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.clean_partials()
+
+    @staticmethod
+    def key(result):
+        """
+        Calcula la clave de caché de un resultado de búsqueda de HDA.
+
+        :param result: Resultado de búsqueda (diccionario GeoJSON de HDA).
+        :return: Clave legible (ID de producto + hash del ID y el checksum).
+        """
+        prop = result.get("properties", {})
+        checksum = prop.get("checksum") or prop.get("size") or ""
+        digest = hashlib.sha1(f"{result['id']}|{checksum}".encode("utf-8")).hexdigest()[:16]
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", str(result["id"]))[:100]
+        return f"{name}-{digest}"
+
+    def _entry(self, key):
+        return os.path.join(self.entries_dir, key)
+
+    def clean_partials(self):
+        """
+        Elimina las descargas parciales que dejaron procesos interrumpidos.
+        Las de procesos que siguen vivos se respetan.
+        """
+        for name in os.listdir(self.partial_dir):
+            parts = name.split(".")
+            pid = int(parts[-2]) if len(parts) > 2 and parts[-2].isdigit() else None
+            if pid is None or not _pid_alive(pid):
+                shutil.rmtree(os.path.join(self.partial_dir, name), ignore_errors=True)
+
+    def get(self, key, dest_dir):
+        """
+        Busca una entrada en la caché y, si existe, la enlaza en la carpeta de destino.
+
+        :param key: Clave de caché.
+        :param dest_dir: Carpeta donde dejar los archivos.
+        :return: Lista de rutas en dest_dir, o None si la entrada no está en caché.
+        """
+        entry = self._entry(key)
+        if not os.path.isdir(entry):
+            return None
+
+        try:
+            names = os.listdir(entry)
+            os.makedirs(dest_dir, exist_ok=True)
+            paths = []
+            for name in names:
+                dst = os.path.join(dest_dir, name)
+                _link_or_copy(os.path.join(entry, name), dst)
+                paths.append(dst)
+            os.utime(entry)  # Marcar como usada recientemente
+        except FileNotFoundError:
+            # La entrada se ha expulsado mientras la leíamos
+            return None
+        return paths
+
+    def fetch(self, key, dest_dir, download):
+        """
+        Devuelve los archivos de una entrada, descargándolos solo si no están en caché.
+        Los archivos descargados se enlazan en dest_dir antes de guardar la entrada, así que
+        siempre se devuelven aunque otro proceso la expulse después. Las entradas más grandes
+        que max_size no se guardan en la caché (se expulsarían nada más añadirlas).
+
+        :param key: Clave de caché.
+        :param dest_dir: Carpeta donde dejar los archivos.
+        :param download: Función que recibe una carpeta temporal y descarga en ella.
+        :return: Tupla (lista de rutas en dest_dir, True si era un acierto de caché).
+        """
+        paths = self.get(key, dest_dir)
+        if paths is not None:
+            return paths, True
+
+        staging = tempfile.mkdtemp(prefix=f"{key}.{os.getpid()}.", dir=self.partial_dir)
+        try:
+            download(staging)
+            names = os.listdir(staging)
+            if not names:
+                raise IOError(f"Download for {key} produced no files")
+
+            os.makedirs(dest_dir, exist_ok=True)
+            paths = []
+            for name in names:
+                dst = os.path.join(dest_dir, name)
+                _link_or_copy(os.path.join(staging, name), dst)
+                paths.append(dst)
+
+            size = sum(os.path.getsize(os.path.join(staging, name)) for name in names)
+            if self.max_size and size > self.max_size:
+                print(f"Not caching {key}: {size} bytes is larger than the cache size ({self.max_size} bytes)")
+                shutil.rmtree(staging, ignore_errors=True)
+                return paths, False
+            try:
+                os.replace(staging, self._entry(key))
+            except OSError:
+                # Otro proceso ha completado la misma entrada antes que nosotros
+                shutil.rmtree(staging, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self.evict()
+        return paths, False
+
+    def size(self):
+        """
+        :return: Tamaño total de la caché en bytes.
+        """
+        return sum(size for _, size, _ in self._scan())
+
+    def _scan(self):
+        """
+        Lista las entradas de la caché como tuplas (último uso, tamaño, ruta).
+        """
+        entries = []
+        for name in os.listdir(self.entries_dir):
+            entry = self._entry(name)
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Expulsa las entradas usadas hace más tiempo hasta que la caché cabe en max_size.
+        """
+        if not self.max_size:
+            return
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """
+        Vacía la caché por completo.
+        """
+        for _, _, entry in self._scan():
+            shutil.rmtree(entry, ignore_errors=True)
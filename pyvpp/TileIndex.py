@@ -0,0 +1,149 @@
+import re
+import functools
+import numpy as np
+from pyproj import Transformer
+from shapely.geometry import Polygon, box
+from shapely.strtree import STRtree
+
+
+# Letras de las bandas de latitud MGRS (8º cada una desde -80º; la X llega hasta 84º)
+LATITUDE_BANDS = 'CDEFGHJKLMNPQRSTUVWX'
+
+# Letras de columna (según el huso) y de fila de los cuadrados de 100 km
+COLUMN_LETTERS = ('ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ')
+ROW_LETTERS = 'ABCDEFGHJKLMNPQRSTUV'
+
+# Los tiles de Sentinel-2 son cuadrados de 109.8 km anclados en la esquina superior
+# izquierda del cuadrado MGRS de 100 km (se solapan 9.8 km con sus vecinos)
+TILE_SIZE = 109800
+
+# ID de tile en los nombres de archivo HR-VPP (ej. 'VPP_2020_S2_T30STG-010m_V101_s1_SOSD.tif')
+TILE_PATTERN = re.compile(r'(?:^|_)T(\d{2}[C-HJ-NP-X][A-HJ-NP-Z]{2})(?=[-_.]|$)')
+
+
+def utm_zone(lon):
+    """
+    :param lon: Longitud en grados.
+    :return: Número de huso UTM (1-60).
+    """
+    return int((lon + 180) / 6) % 60 + 1
+
+
+def latitude_band(lat):
+    """
+    :param lat: Latitud en grados.
+    :return: Índice de la banda de latitud MGRS (0-19).
+    """
+    return min(max(int((lat + 80) // 8), 0), len(LATITUDE_BANDS) - 1)
+
+
+def mgrs_square(zone, easting, northing):
+    """
+    Obtiene las dos letras del cuadrado MGRS de 100 km que contiene unas coordenadas UTM.
+
+    :param zone: Número de huso UTM.
+    :param easting: Coordenada X UTM (m).
+    :param northing: Coordenada Y UTM (m, con falso norte en el hemisferio sur).
+    :return: Letras de columna y fila (ej. 'VK').
+    """
+    column = COLUMN_LETTERS[(zone - 1) % 3][int(easting // 100000) - 1]
+    row_offset = 5 if zone % 2 == 0 else 0
+    row = ROW_LETTERS[(int(northing // 100000) + row_offset) % len(ROW_LETTERS)]
+    return column + row
+
+
+def tile_from_name(name):
+    """
+    Extrae el ID de tile Sentinel-2 de un nombre de archivo o de producto.
+
+    :param name: Nombre de archivo o ID de producto HR-VPP.
+    :return: ID de tile (ej. '30STG') o None si el nombre no lo contiene.
+    """
+    match = TILE_PATTERN.search(name)
+    return match.group(1) if match else None
+
+
+def _densify(x0, y0, x1, y1, points=16):
+    """
+    Devuelve el contorno de un rectángulo con puntos intermedios en cada lado,
+    para que la huella reproyectada conserve la curvatura de sus bordes.
+    """
+    t = np.linspace(0, 1, points, endpoint=False)
+    xs = np.concatenate([x0 + (x1 - x0) * t, np.full(points, x1), x1 - (x1 - x0) * t, np.full(points, x0)])
+    ys = np.concatenate([np.full(points, y0), y0 + (y1 - y0) * t, np.full(points, y1), y1 - (y1 - y0) * t])
+    return xs, ys
+
+
+@functools.lru_cache(maxsize=None)
+def _cell_index(zone, band):
+    """
+    Calcula (una sola vez) las huellas en EPSG:4326 de los tiles Sentinel-2 de un huso
+    UTM y una banda de latitud, y construye su índice espacial.
+
+    :param zone: Número de huso UTM.
+    :param band: Índice de la banda de latitud.
+    :return: Tupla (lista de IDs de tile, lista de huellas, STRtree).
+    """
+    south = -80 + band * 8
+    north = 84 if band == len(LATITUDE_BANDS) - 1 else south + 8
+    west = -180 + (zone - 1) * 6
+    cell = box(west, south, west + 6, north)
+
+    epsg = (32700 if north <= 0 else 32600) + zone
+    to_utm = Transformer.from_crs(4326, epsg, always_xy=True)
+    to_geo = Transformer.from_crs(epsg, 4326, always_xy=True)
+
+    # Rango de coordenadas UTM que cubre la celda
+    xs, ys = to_utm.transform(*_densify(*cell.bounds))
+    ymin = np.floor((min(ys) - TILE_SIZE) / 100000) * 100000
+    ymax = np.ceil(max(ys) / 100000) * 100000
+
+    ids, footprints = [], []
+    for x0 in range(100000, 900000, 100000):
+        for y0 in np.arange(ymin, ymax, 100000):
+            top = y0 + 100000
+            lons, lats = to_geo.transform(*_densify(x0, top - TILE_SIZE, x0 + TILE_SIZE, top))
+            footprint = Polygon(zip(lons, lats))
+            # Solo existen los tiles que caen (al menos en parte) en su huso y banda
+            if not footprint.intersects(cell):
+                continue
+            ids.append(f"{zone:02d}{LATITUDE_BANDS[band]}{mgrs_square(zone, x0, y0)}")
+            footprints.append(footprint)
+
+    return ids, footprints, STRtree(footprints)
+
+
+def _query(tree, footprints, geometry):
+    """
+    Consulta un STRtree y devuelve los índices de las huellas que intersectan la geometría
+    (compatible con shapely 1.8, que devuelve geometrías, y con shapely 2, que devuelve índices).
+    """
+    hits = tree.query(geometry)
+    if len(hits) and not isinstance(hits[0], (int, np.integer)):
+        positions = {id(footprint): i for i, footprint in enumerate(footprints)}
+        hits = [positions[id(hit)] for hit in hits]
+    return [i for i in hits if footprints[i].intersects(geometry)]
+
+
+def get_mgrs_tiles(geometry):
+    """
+    Obtiene los IDs de los tiles Sentinel-2 (MGRS) que intersectan una geometría.
+
+    Las huellas de los tiles de cada huso y banda se calculan una sola vez y se
+    guardan en un índice espacial (STRtree), así que las consultas posteriores
+    sobre la misma zona son inmediatas.
+
+    :param geometry: Geometría en coordenadas geográficas (EPSG:4326).
+    :return: Lista ordenada de IDs de tile (ejemplo: ['29SQB', '30STG']).
+    """
+    minx, miny, maxx, maxy = geometry.bounds
+    # Los tiles de los husos y bandas vecinos también pueden solaparse con la geometría
+    zones = {(zone - 1) % 60 + 1 for zone in range(utm_zone(minx) - 1, utm_zone(maxx) + 2)}
+    bands = range(max(latitude_band(miny) - 1, 0), min(latitude_band(maxy) + 1, len(LATITUDE_BANDS) - 1) + 1)
+
+    tiles = set()
+    for zone in zones:
+        for band in bands:
+            ids, footprints, tree = _cell_index(zone, band)
+            tiles.update(ids[i] for i in _query(tree, footprints, geometry))
+    return sorted(tiles)
@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+import geopandas as gpd
+from .WekeoDownload import wekeo_download, hda_client
+from .TileCache import _link_or_copy
+from .Manifest import folder_lock
+from .RunReport import RunReport
+
+
+def site_name(shape, index=0):
+    """
+    Nombre de la carpeta de salida de un sitio a partir de su AOI.
+
+    :param shape: Ruta a shapefile, DEIMS ID o GeoDataFrame.
+    :param index: Posición del sitio en la lista (para los GeoDataFrames sin nombre).
+    :return: Nombre del sitio (ej. 'study_area' o el UUID del sitio DEIMS).
+    """
+    if isinstance(shape, gpd.GeoDataFrame):
+        return f"site_{index}"
+    if shape.startswith('deimsid'):
+        return shape.rstrip('/').split('/')[-1]
+    return os.path.splitext(os.path.basename(shape))[0]
+
+
+class wekeo_batch:
+    """
+    Procesa varias áreas de interés en una sola sesión: una única conexión HDA, una
+    búsqueda por producto sobre la unión de todas las AOIs, cada tile se descarga una
+    sola vez y el mosaico/recorte se hace después por sitio, cada uno en su carpeta.
+    """
+
+    def __init__(self, dataset, sites, dates, products, user=None, password=None, output_dir=None,
+                 max_workers=1, rate_limit=None, cache_dir=None, cache_size=None, prefilter=True,
+                 aoi_cache=None, hooks=None):
+        """
+        :param dataset: Nombre del dataset ('VPP_Index', 'VPP_ST', 'VPP_Pheno', 'SLSTR')
+        :param sites: Diccionario {nombre: AOI} o lista de AOIs (rutas a shapefile, DEIMS IDs o GeoDataFrames)
+        :param dates: Lista con [fecha_inicio, fecha_fin] en formato 'YYYY-MM-DD'
+        :param products: Lista de productos a descargar
+        :param user: (Opcional) Usuario de WEkEO. Si no se proporciona, usa .hdarc
+        :param password: (Opcional) Contraseña de WEkEO. Si no se proporciona, usa .hdarc
+        :param output_dir: (Opcional) Carpeta de salida, con una subcarpeta por sitio. Por defecto ./pyhda
+        :param max_workers: (Opcional) Número de hilos para búsquedas y descargas concurrentes (1 = serie)
+        :param rate_limit: (Opcional) Máximo de peticiones por segundo al servidor HDA (None = sin límite)
+        :param cache_dir: (Opcional) Carpeta de la caché persistente de tiles (True = ~/.cache/pyvpp/tiles)
+        :param cache_size: (Opcional) Tamaño máximo de la caché en bytes (None = sin límite)
+        :param prefilter: (Opcional) Descartar antes de descargar los resultados que no intersectan ninguna AOI
+        :param aoi_cache: (Opcional) Carpeta de la caché de AOIs resueltos (True = ~/.cache/pyvpp/aoi)
+        :param hooks: (Opcional) Funciones hook(evento, datos) que reciben las métricas de cada etapa (ver RunReport)
+        """
+        print('Initializing wekeo_batch script...')
+        self.conn = hda_client(user, password)
+        self.output_dir = os.path.abspath(output_dir) if output_dir else os.path.join(os.getcwd(), 'pyhda')
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        if not isinstance(sites, dict):
+            sites = {site_name(shape, i): shape for i, shape in enumerate(sites)}
+
+        # Un wekeo_download por sitio (sin conexión propia), cada uno con su carpeta de salida
+        self.sites = {}
+        for name, shape in sites.items():
+            if name in self.sites:
+                raise ValueError(f"Duplicated site name '{name}', pass the sites as a dict {{name: shape}}")
+            self.sites[name] = wekeo_download(dataset, shape, dates, products, prefilter=prefilter,
+                                              output_dir=os.path.join(self.output_dir, name), client=self.conn,
+                                              aoi_cache=aoi_cache)
+
+        # Carpeta de tiles única para esta sesión: varias sesiones pueden ejecutarse a la vez
+        self.tiles_dir = tempfile.mkdtemp(prefix='.tiles-', dir=self.output_dir)
+
+        # Búsqueda y descarga sobre la unión de todas las AOIs
+        union = gpd.GeoDataFrame(geometry=pd.concat([site.gdf_proj.geometry for site in self.sites.values()],
+                                                    ignore_index=True), crs="EPSG:4326")
+        self.downloader = wekeo_download(dataset, union, dates, products, output_dir=self.tiles_dir,
+                                         client=self.conn, max_workers=max_workers, rate_limit=rate_limit,
+                                         cache_dir=cache_dir, cache_size=cache_size, prefilter=prefilter)
+
+        # Un único informe para la descarga común y el procesado de todos los sitios
+        self.report = RunReport(hooks)
+        self._share_report()
+
+    def _share_report(self):
+        self.downloader.report = self.report
+        for site in self.sites.values():
+            site.report = self.report
+
+    def count_matches(self):
+        """
+        Devuelve el número total de resultados por producto para la unión de las AOIs.
+
+        :return: Diccionario {producto: número de resultados}.
+        """
+        return self.downloader.count_matches()
+
+    def download(self, engine='threads', concurrency=None):
+        """
+        Descarga (una sola vez) todos los tiles que intersectan alguna de las AOIs.
+
+        :param engine: (Opcional) Motor de descarga: 'threads' (por defecto) o 'async' (necesita aiohttp)
+        :param concurrency: (Opcional) Descargas simultáneas con engine='async'
+        """
+        self.downloader.download(engine, concurrency)
+        self.download_summary = self.downloader.download_summary
+
+    def _link_tiles(self, site):
+        """
+        Enlaza en la carpeta de un sitio los productos descargados que le corresponden: los
+        tiles de sus tiles MGRS y los productos sin tile (ej. pasadas SLSTR, carpetas .SEN3 o
+        zips de NetCDF) cuya huella intersecta su AOI.
+
+        :param site: Instancia de wekeo_download del sitio.
+        :return: Número de archivos (o carpetas) enlazados.
+        """
+        linked = set()
+        entries = self.downloader.catalogue.entries()
+        for entry in entries:
+            # Los productos que llegan en un zip se enlazan con el zip completo
+            source = entry.archive or entry.path
+            if source in linked:
+                continue
+            if entry.tile is not None:
+                wanted = entry.tile in site.tiles
+            else:
+                wanted = site._footprint_in_aoi(self.downloader.footprints.get(source))
+            if wanted:
+                path = os.path.join(site.pyhda, os.path.basename(source))
+                _link_or_copy(source, path)
+                site.catalogue.add(path)
+                linked.add(source)
+        if entries and not linked:
+            print(f"Warning: none of the {len(entries)} downloaded products matches {site.pyhda}")
+        return len(linked)
+
+    def mosaic_and_clip(self, clean=False, **clip_options):
+        """
+        Hace el mosaico y el recorte de cada sitio en su carpeta de salida. Un error en
+        un sitio no detiene los demás. La carpeta de cada sitio se bloquea mientras se
+        enlazan sus tiles, se procesan y se limpian, así que otras sesiones con el mismo
+        sitio y la misma carpeta de salida esperan en lugar de borrar o mezclar sus tiles.
+
+        :param clean: (Opcional) Eliminar de la carpeta de cada sitio los tiles enlazados después
+            de procesarlo (ver wekeo_download.clean).
+        :param clip_options: (Opcional) Opciones para mosaic_and_clip (ej. output='zarr', processes=4).
+        """
+        for i, (name, site) in enumerate(self.sites.items(), 1):
+            try:
+                with folder_lock(site.pyhda):
+                    tiles = self._link_tiles(site)
+                    print(f"[{i}/{len(self.sites)}] Site {name}: {tiles} products")
+                    self.report.count('site_tiles_linked', tiles)
+                    site.mosaic_and_clip(**clip_options)
+                    if clean:
+                        site.clean()
+            except Exception as e:
+                print(f"Error processing site {name}: {e}")
+                import traceback
+                traceback.print_exc()
+
+    def clean(self):
+        """
+        Elimina la carpeta de tiles compartida de esta sesión.
+        """
+        with self.report.stage('clean'):
+            shutil.rmtree(self.tiles_dir, ignore_errors=True)
+        print(f"Deleted directory: {self.tiles_dir}")
+
+    def run(self, **clip_options):
+        """
+        Ejecuta el proceso completo: descarga, mosaico/recorte por sitio y limpieza.
+
+        :param clip_options: (Opcional) Opciones para mosaic_and_clip (ej. output='zarr', profile='cog').
+        :return: Informe de la ejecución (ver RunReport.to_dict), también disponible en self.report.
+        """
+        self.report = RunReport(self.report.hooks)
+        self._share_report()
+        print('Downloading images...')
+        self.download()
+        print('Mosaicking and clipping...')
+        self.mosaic_and_clip(clean=True, **clip_options)
+        print('Cleaning the folder...')
+        self.clean()
+        print('Process completed!')
+        return self.report.to_dict()
@@ -1,136 +1,277 @@
 import os
 import time
 import shutil
-import zipfile
-import requests
-import rasterio
-import deims
+import tempfile
+import threading
+import multiprocessing
 import geopandas as gpd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 from hda import Client, Configuration
-from rasterio.merge import merge
-from rasterio.mask import mask
-from pyproj import CRS, Transformer
-from pyproj.aoi import AreaOfInterest
-from pyproj.database import query_utm_crs_info
-from shapely.geometry import box
+from hda.api import DataOrderRequest
+from shapely.geometry import shape as shapely_shape
+from shapely.prepared import prep
+from .Hdarc import create_hdarc, delete_hdarc, clean_old_hdarc
+from .TileCache import TileCache
+from .AoiCache import AoiCache
+from .TileIndex import get_mgrs_tiles, tile_from_name, utm_zone
+from .Catalogue import Catalogue, layer_name, parse_name
+from .Archive import split_vsizip
+from .Cube import CUBE_FORMATS
+from .Manifest import LOCK_NAME, MANIFEST_NAME, RunManifest, aoi_hash
+from .RunReport import RunReport, call_timed
+from .AsyncDownload import ASYNC_CONCURRENCY, CHUNK_SIZE, AsyncEngine, run_coroutine
 
 
-def create_hdarc(user, password):
+# Resultados por página en las búsquedas HDA
+ITEMS_PER_PAGE = 200
+
+
+def get_utm_zones(geometry):
     """
-    Crea un archivo .hdarc con las credenciales proporcionadas en el formato correcto
-    para la nueva versión de la librería HDA.
+    Obtiene una lista de husos UTM que cubren la geometría proporcionada.
     
-    :param user: Nombre de usuario de Wekeo.
-    :param password: Contraseña de Wekeo.
+    :param geometry: Geometría (shapely geometry).
+    :return: Lista de husos UTM (ejemplo: ['T29', 'T30']).
     """
-    # Formato correcto según la documentación actualizada de HDA
-    hdarc_content = f"user: {user}\npassword: {password}\n"
+    minx, miny, maxx, maxy = geometry.bounds
+    # Todos los husos entre los dos extremos, no solo los de los bordes
+    return [f"T{zone:02d}" for zone in range(utm_zone(minx), utm_zone(maxx) + 1)]
 
-    # Guardar el contenido en el archivo .hdarc en el directorio del usuario
-    home_directory = os.path.expanduser("~")
-    hdarc_path = os.path.join(home_directory, ".hdarc")
 
-    with open(hdarc_path, "w") as hdarc_file:
-        hdarc_file.write(hdarc_content)
-    print(f"Archivo .hdarc creado en: {hdarc_path}")
+def available_cores():
+    """
+    :return: Número de núcleos disponibles para este proceso.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
 
-def delete_hdarc():
+def _map_ordered(func, tasks, processes=1):
     """
-    Elimina el archivo .hdarc del directorio del usuario si existe.
+    Ejecuta func(*args) para cada tarea, en serie o en un pool de procesos, y devuelve
+    los resultados en el mismo orden que las tareas. Los errores se aíslan por tarea.
+    Los procesos se arrancan con 'spawn': el proceso principal puede tener hilos (descargas,
+    trabajos de pyvpp --jobs) y un fork heredaría los locks que tuvieran GDAL, hda o logging.
+
+    :param func: Función de módulo (debe poder serializarse para el pool de procesos).
+    :param tasks: Lista de tuplas de argumentos.
+    :param processes: Número de procesos (1 = en serie, None = todos los núcleos disponibles).
+    :return: Generador de tuplas (resultado, excepción o None).
     """
-    home_directory = os.path.expanduser("~")
-    hdarc_path = os.path.join(home_directory, ".hdarc")
+    processes = processes or available_cores()
+    if processes <= 1 or len(tasks) <= 1:
+        for args in tasks:
+            try:
+                yield func(*args), None
+            except Exception as e:
+                yield None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=min(processes, len(tasks)),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(func, *args) for args in tasks]
+        for future in futures:
+            try:
+                yield future.result(), None
+            except Exception as e:
+                yield None, e
 
-    if os.path.exists(hdarc_path):
-        os.remove(hdarc_path)
-        print(f"Archivo .hdarc eliminado de: {hdarc_path}")
+
+def _feature_ids(features, id_column=None):
+    """
+    :return: Array con el identificador de cada entidad (la columna id_column o el índice).
+    """
+    if id_column is None:
+        return features.index.to_numpy()
+    if id_column not in features.columns:
+        raise KeyError(f"Column '{id_column}' not found in features. Columns: {list(features.columns)}")
+    return features[id_column].to_numpy()
+
+
+def hda_client(user=None, password=None):
+    """
+    Crea la conexión con HDA, con las credenciales proporcionadas o con el archivo .hdarc.
+
+    :param user: (Opcional) Usuario de WEkEO. Si no se proporciona, usa .hdarc
+    :param password: (Opcional) Contraseña de WEkEO. Si no se proporciona, usa .hdarc
+    :return: Cliente HDA.
+    """
+    # Limpiar archivo .hdarc antiguo si existe
+    clean_old_hdarc()
+
+    if user and password:
+        # Opción 1: Usar credenciales directamente
+        conf = Configuration(user=user, password=password)
+        client = Client(config=conf)
+        print("Conectado usando credenciales proporcionadas")
     else:
-        print("No se encontró el archivo .hdarc.")
+        # Opción 2: Usar archivo .hdarc
+        client = Client()
+        print("Conectado usando archivo .hdarc")
+    return client
 
 
-def clean_old_hdarc():
+def load_shape(shape):
     """
-    Limpia archivos .hdarc antiguos (anteriores a marzo 2024) que puedan tener
-    la línea 'url:' que ya no es necesaria.
+    Carga el área de interés.
+
+    :param shape: Ruta a shapefile, DEIMS ID (formato: 'deimsid:https://...') o GeoDataFrame.
+    :return: GeoDataFrame con la geometría del área de interés.
     """
-    home_directory = os.path.expanduser("~")
-    hdarc_path = os.path.join(home_directory, ".hdarc")
-    
-    if os.path.exists(hdarc_path):
-        with open(hdarc_path, 'r') as f:
-            lines = f.readlines()
-        
-        # Filtrar líneas que NO contengan 'url:'
-        new_lines = [line for line in lines if not line.strip().startswith('url:')]
-        
-        # Reescribir el archivo sin la línea url
-        if len(new_lines) != len(lines):
-            with open(hdarc_path, 'w') as f:
-                f.writelines(new_lines)
-            print(f"Archivo .hdarc actualizado (eliminada línea 'url:')")
+    if isinstance(shape, gpd.GeoDataFrame):
+        return shape
+    if shape.startswith('deimsid'):
+        import deims
+        print('Con DEIMS hemos topado amigo Sancho...')
+        id_ = shape.split('/')[-1]
+        return deims.getSiteBoundaries(id_)
+    return gpd.read_file(shape)
 
 
-def get_utm_zones(geometry):
+def group_from_name(name):
     """
-    Obtiene una lista de husos UTM que cubren la geometría proporcionada.
-    
-    :param geometry: Geometría (shapely geometry).
-    :return: Lista de husos UTM (ejemplo: ['T29', 'T30']).
+    Grupo de salida (fecha, temporada) de un nombre de archivo o de producto: las dos
+    temporadas de un producto fenológico (s1, s2) de la misma fecha son salidas distintas.
+
+    :param name: Nombre de archivo o ID de producto.
+    :return: Tupla (fecha, temporada o None).
     """
-    utm_zones = set()
-    minx, miny, maxx, maxy = geometry.bounds
-    lons = [minx, maxx]
-    for lon in lons:
-        utm_zone_number = int((lon + 180) / 6) % 60 + 1
-        utm_zone = f"T{utm_zone_number:02d}"
-        utm_zones.add(utm_zone)
-    return list(utm_zones)
+    parsed = parse_name(name)
+    return (parsed.date, parsed.season) if parsed is not None else (None, None)
+
+
+class _RateLimiter:
+    """
+    Limita el número de peticiones por segundo que se lanzan contra cada host.
+    Es seguro entre hilos: cada llamada a wait() reserva el siguiente hueco libre.
+    """
+
+    def __init__(self, rate=None):
+        """
+        :param rate: Peticiones por segundo permitidas por host (None = sin límite).
+        """
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, url):
+        """
+        Bloquea hasta que se pueda lanzar una nueva petición contra el host de la URL.
+
+        :param url: URL (o base URL) de la petición.
+        """
+        if not self.rate:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1.0 / self.rate
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _PagedSearch:
+    """
+    Búsqueda paginada en HDA. Pide la primera página al crearse (para conocer el
+    total de resultados) y, al iterar, precarga la página N+1 en segundo plano
+    mientras se consumen los resultados de la página N.
+    """
+
+    def __init__(self, fetch_page, items_per_page=ITEMS_PER_PAGE):
+        """
+        :param fetch_page: Función que recibe un startIndex y devuelve la respuesta JSON de HDA.
+        :param items_per_page: Número de resultados por página.
+        """
+        self._fetch_page = fetch_page
+        self.items_per_page = items_per_page
+        self._first_page = fetch_page(0)
+        self.total = self._first_page.get('properties', {}).get('totalResults')
+
+    def _next_index(self, page, start_index):
+        """
+        Calcula el startIndex de la página siguiente, o None si no hay más páginas.
+        """
+        features = page.get('features', [])
+        prop = page.get('properties', {})
+        if not features:
+            return None
+        if 'totalResults' in prop:
+            next_index = prop.get('startIndex', start_index) + self.items_per_page
+            return next_index if next_index < prop['totalResults'] else None
+        # Algunos adaptadores no devuelven el total, solo el índice siguiente
+        return prop.get('nextIndex')
+
+    def pages(self):
+        """
+        Generador que devuelve la lista de resultados de cada página.
+        """
+        page, start_index = self._first_page, 0
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            while True:
+                next_index = self._next_index(page, start_index)
+                future = prefetcher.submit(self._fetch_page, next_index) if next_index is not None else None
+                yield page.get('features', [])
+                if future is None:
+                    return
+                page, start_index = future.result(), next_index
+
+    def __iter__(self):
+        for features in self.pages():
+            yield from features
 
 
 class wekeo_download:
     
-    def __init__(self, dataset, shape, dates, products, user=None, password=None):
+    def __init__(self, dataset, shape, dates, products, user=None, password=None,
+                 max_workers=1, rate_limit=None, cache_dir=None, cache_size=None, prefilter=True,
+                 incremental=False, output_dir=None, client=None, aoi_cache=None, hooks=None):
         """
         Inicializa la clase para descargar datos de WEkEO.
         
         :param dataset: Nombre del dataset ('VPP_Index', 'VPP_ST', 'VPP_Pheno', 'SLSTR')
-        :param shape: Ruta a shapefile o DEIMS ID (formato: 'deimsid:https://...')
+        :param shape: Ruta a shapefile, DEIMS ID (formato: 'deimsid:https://...') o GeoDataFrame
         :param dates: Lista con [fecha_inicio, fecha_fin] en formato 'YYYY-MM-DD'
         :param products: Lista de productos a descargar
         :param user: (Opcional) Usuario de WEkEO. Si no se proporciona, usa .hdarc
         :param password: (Opcional) Contraseña de WEkEO. Si no se proporciona, usa .hdarc
+        :param max_workers: (Opcional) Número de hilos para búsquedas y descargas concurrentes (1 = serie)
+        :param rate_limit: (Opcional) Máximo de peticiones por segundo al servidor HDA (None = sin límite)
+        :param cache_dir: (Opcional) Carpeta de la caché persistente de tiles (True = ~/.cache/pyvpp/tiles)
+        :param cache_size: (Opcional) Tamaño máximo de la caché en bytes (None = sin límite)
+        :param prefilter: (Opcional) Descartar antes de descargar los resultados que no intersectan el AOI
+        :param incremental: (Opcional) Usar el manifiesto de la carpeta de salida para descargar y procesar
+            solo las fechas nuevas o cuyos productos de origen han cambiado
+        :param output_dir: (Opcional) Carpeta de salida. Por defecto ./pyhda
+        :param client: (Opcional) Cliente HDA ya conectado, para compartir una sesión entre varias instancias
+        :param aoi_cache: (Opcional) Carpeta de la caché de AOIs resueltos (True = ~/.cache/pyvpp/aoi)
+        :param hooks: (Opcional) Funciones hook(evento, datos) que reciben las métricas de cada etapa
+            y elemento según se producen (ver RunReport)
         """
         print('Initializing wekeo_download script...')
 
-        # Limpiar archivo .hdarc antiguo si existe
-        clean_old_hdarc()
-
-        # Crear la conexión con HDA
-        if user and password:
-            # Opción 1: Usar credenciales directamente
-            conf = Configuration(user=user, password=password)
-            self.conn = Client(config=conf)
-            print("Conectado usando credenciales proporcionadas")
-        else:
-            # Opción 2: Usar archivo .hdarc
-            self.conn = Client()
-            print("Conectado usando archivo .hdarc")
+        # Crear la conexión con HDA (o reutilizar la que nos pasan)
+        self.conn = client if client is not None else hda_client(user, password)
 
         # Crear la carpeta de salida y continuar la inicialización
-        self.pyhda = os.path.join(os.getcwd(), 'pyhda')
+        self.pyhda = os.path.abspath(output_dir) if output_dir else os.path.join(os.getcwd(), 'pyhda')
         os.makedirs(self.pyhda, exist_ok=True)
         
         self.dataset = dataset
         self.shape = shape
 
-        # Manejar DEIMS o shapefiles proporcionados por el usuario
-        if self.shape.startswith('deimsid'):
-            print('Con DEIMS hemos topado amigo Sancho...')
-            id_ = self.shape.split('/')[-1]
-            self.gdf = deims.getSiteBoundaries(id_)
-        else:
-            self.gdf = gpd.read_file(self.shape)
+        # AOI ya resuelto en ejecuciones anteriores (opcional)
+        self.aoi_cache = AoiCache(None if aoi_cache is True else aoi_cache) if aoi_cache else None
+        aoi_key = AoiCache.key(self.shape) if self.aoi_cache is not None else None
+        cached = self.aoi_cache.get(aoi_key) if aoi_key else None
+        if cached is not None:
+            print(f"Using cached AOI: {aoi_key}")
+
+        # Manejar DEIMS, shapefiles o GeoDataFrames proporcionados por el usuario
+        self.gdf = cached['gdf'] if cached is not None else load_shape(self.shape)
 
         self.crs = self.gdf.crs
         self.bbox = self.gdf.bounds
@@ -142,12 +283,23 @@ class wekeo_download:
         else:
             self.gdf_proj = self.gdf
 
-        self.bbox = list(self.gdf_proj.total_bounds)
+        if cached is not None:
+            self.bbox = cached['bbox']
+            self.geometry = cached['geometry']
+        else:
+            self.bbox = list(self.gdf_proj.total_bounds)
+            self.geometry = self.gdf_proj.geometry.unary_union  # Geometría unificada
         print(f"Converted bbox to geographic coordinates: {self.bbox}")
 
-        self.geometry = self.gdf_proj.geometry.unary_union  # Geometría unificada
+        self._aoi_prepared = prep(self.geometry)  # Para filtrar huellas de resultados rápidamente
+        self.prefilter = prefilter
+        self.aoi_hash = aoi_hash(self.geometry)
         self.utm_zones = get_utm_zones(self.geometry)
         print(f"Husos UTM para el AOI: {self.utm_zones}")
+        self.tiles = cached['tiles'] if cached is not None else get_mgrs_tiles(self.geometry)
+        print(f"Tiles MGRS para el AOI: {self.tiles}")
+        if aoi_key and cached is None:
+            self.aoi_cache.put(aoi_key, self.gdf, self.bbox, self.geometry, self.tiles)
 
         self.dates = dates
         self.products = products
@@ -159,167 +311,930 @@ class wekeo_download:
         }
         self.dataset_name = self.datasetlists[self.dataset]
 
-    def download(self):
+        # Concurrencia de descargas y límite de peticiones por host
+        self.max_workers = max(1, int(max_workers))
+        self.rate_limiter = _RateLimiter(rate_limit)
+
+        # Caché de tiles compartida entre ejecuciones (opcional)
+        if cache_dir:
+            self.cache = TileCache(None if cache_dir is True else cache_dir, cache_size)
+            print(f"Using tile cache: {self.cache.cache_dir}")
+        else:
+            self.cache = None
+
+        # Modo incremental: manifiesto de salidas ya producidas en la carpeta de salida
+        self.incremental = incremental
+        self.manifest = RunManifest(self.pyhda) if incremental else None
+        self._new_sources = None  # {(producto, temporada, fecha): IDs de origen} descargados en esta sesión
+        self._failed_groups = set()
+
+        # Huellas de los productos descargados, por ruta (para repartir las pasadas SLSTR, sin tile, entre AOIs)
+        self.footprints = {}
+
+        # Tiempos, bytes y contadores de cada etapa
+        self.report = RunReport(hooks)
+
+        # Índice de los archivos descargados (dataset, tile, fecha, producto, ruta y tamaño)
+        self.catalogue = Catalogue(self.pyhda)
+
+    def _search_page(self, product, start_index=0):
         """
-        Descarga los productos desde WEkEO usando la API HDA actualizada.
+        Pide una página de resultados de búsqueda de un producto a HDA.
+
+        :param product: Nombre del producto (ej. 'SOSD', 'PPI').
+        :param start_index: Índice del primer resultado de la página.
+        :return: Respuesta JSON de HDA (features + properties).
         """
-        for product in self.products:
-            print(f'Getting product: {product}')
-            
-            # Estructura de query actualizada para la nueva API HDA
-            query = {
-                'dataset_id': self.dataset_name,
-                'productType': product,
-                'bbox': self.bbox,
-                'startdate': f"{self.dates[0]}T00:00:00.000Z",
-                'enddate': f"{self.dates[1]}T23:59:59.999Z",
-                'itemsPerPage': 200,  # Añadido para evitar límites
-                'startIndex': 0
-            }
+        # Estructura de query actualizada para la nueva API HDA
+        query = {
+            'dataset_id': self.dataset_name,
+            'productType': product,
+            'bbox': self.bbox,
+            'startdate': f"{self.dates[0]}T00:00:00.000Z",
+            'enddate': f"{self.dates[1]}T23:59:59.999Z",
+            'itemsPerPage': ITEMS_PER_PAGE,
+            'startIndex': start_index
+        }
 
-            try:
-                matches = self.conn.search(query)
-                print(f"Matches response: {matches}")
+        self.rate_limiter.wait(self.conn.config.url)
+        start = time.perf_counter()
+        page = self.conn.post(query, 'dataaccess/search')
+        self.report.item('search', f"{product}:{start_index}", time.perf_counter() - start,
+                         results=len(page.get('features', [])))
+        return page
+
+    def _search(self, product):
+        """
+        Lanza la búsqueda paginada de un producto en HDA.
+
+        :param product: Nombre del producto (ej. 'SOSD', 'PPI').
+        :return: Objeto _PagedSearch con el total de resultados y un iterador sobre todas las páginas.
+        """
+        print(f'Getting product: {product}')
+        self.rate_limiter.wait(self.conn.config.url)
+        self.conn.accept_tac(self.dataset_name)
+        return _PagedSearch(lambda start_index: self._search_page(product, start_index))
 
-                print(f"Found {len(matches.results)} matches for product: {product}.")
+    def search(self, product):
+        """
+        Generador con todos los resultados de búsqueda de un producto, recorriendo
+        todas las páginas (sin el límite de 200 resultados de una única petición).
+
+        :param product: Nombre del producto (ej. 'SOSD', 'PPI').
+        :return: Iterador de resultados (diccionarios GeoJSON de HDA).
+        """
+        return iter(self._search(product))
+
+    def count_matches(self):
+        """
+        Devuelve el número total de resultados por producto sin descargar nada,
+        para dimensionar los trabajos antes de empezar.
+
+        :return: Diccionario {producto: número de resultados}.
+        """
+        return {product: self._search(product).total for product in self.products}
 
-                # Descargar todos los productos encontrados
-                matches.download(download_dir=self.pyhda)
+    def _order(self, result):
+        """
+        Pide a HDA la preparación de la descarga de un resultado de búsqueda.
+
+        :param result: Resultado de búsqueda (diccionario GeoJSON de HDA).
+        :return: ID de descarga.
+        """
+        query = {
+            'dataset_id': self.dataset_name,
+            'product_id': result['id'],
+            'location': result['properties']['location']
+        }
+
+        self.rate_limiter.wait(self.conn.config.url)
+        return DataOrderRequest(self.conn).run(query)
+
+    def _stream_result(self, result, download_dir):
+        """
+        Pide y descarga en streaming un único resultado de búsqueda.
+
+        :param result: Resultado de búsqueda (diccionario GeoJSON de HDA).
+        :param download_dir: Carpeta de descarga.
+        """
+        download_id = self._order(result)
+
+        self.rate_limiter.wait(self.conn.config.url)
+        size = result.get('properties', {}).get('size', 0)
+        self.conn.stream(download_id, size, download_dir)
+
+    def _download_result(self, result, download_dir=None):
+        """
+        Descarga un único resultado de búsqueda, usando la caché de tiles si está activa.
+
+        Los archivos se descargan en una carpeta temporal y solo se mueven a su destino
+        cuando la descarga ha terminado, así que nunca quedan archivos a medias.
+
+        :param result: Resultado de búsqueda (diccionario GeoJSON de HDA).
+        :param download_dir: (Opcional) Carpeta de descarga. Por defecto self.pyhda.
+        :return: Lista de rutas de los archivos descargados.
+        """
+        download_dir = download_dir or self.pyhda
+        start = time.perf_counter()
+
+        if self.cache is not None:
+            paths, hit = self.cache.fetch(TileCache.key(result), download_dir,
+                                          lambda staging: self._stream_result(result, staging))
+            if hit:
+                print(f"Cache hit: {result['id']}")
+            self._report_download(result, paths, time.perf_counter() - start, hit)
+            return paths
+
+        staging = tempfile.mkdtemp(prefix='.partial-', dir=download_dir)
+        try:
+            self._stream_result(result, staging)
+            paths = []
+            for name in os.listdir(staging):
+                path = os.path.join(download_dir, name)
+                os.replace(os.path.join(staging, name), path)
+                paths.append(path)
+            self._report_download(result, paths, time.perf_counter() - start)
+            return paths
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _report_download(self, result, paths, elapsed, cache_hit=False):
+        """
+        Registra en el informe de la ejecución la descarga de un resultado.
+        """
+        nbytes = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+        self.report.item('download', result['id'], elapsed, nbytes, cache_hit=cache_hit)
+        self.report.count('tiles_cached' if cache_hit else 'tiles_downloaded', len(paths))
+
+    def _in_aoi(self, result):
+        """
+        Comprueba si la huella (footprint) de un resultado de búsqueda intersecta
+        la geometría real del área de interés (no solo su bbox).
+
+        :param result: Resultado de búsqueda (diccionario GeoJSON de HDA).
+        :return: True si intersecta o si el resultado no trae geometría.
+        """
+        # Primero el índice de tiles MGRS (inmediato), después la huella real
+        tile = tile_from_name(str(result.get('id', '')))
+        if tile is not None and tile not in self.tiles:
+            return False
+
+        return self._footprint_in_aoi(result.get('geometry'))
+
+    def _footprint_in_aoi(self, footprint):
+        """
+        :param footprint: Huella GeoJSON de un producto (o None).
+        :return: True si intersecta la geometría del área de interés o si no se conoce.
+        """
+        if not footprint:
+            return True
+        try:
+            return self._aoi_prepared.intersects(shapely_shape(footprint))
+        except Exception:
+            return True
+
+    def _plan_downloads(self, product, matches, summary):
+        """
+        Generador con los resultados de búsqueda de un producto que hay que descargar.
+
+        Descarta (y cuenta en el resumen) los resultados fuera del área de interés si
+        self.prefilter está activo y, en modo incremental, los grupos (producto, temporada, fecha)
+        que ya están en el manifiesto con los mismos productos de origen.
+
+        :param product: Nombre del producto.
+        :param matches: Iterable de resultados de búsqueda.
+        :param summary: Diccionario de resumen del producto (se actualiza).
+        :return: Iterador de resultados a descargar.
+        """
+        groups = {}
+        for result in matches:
+            summary['matches'] += 1
+            if self.prefilter and not self._in_aoi(result):
+                size = result.get('properties', {}).get('size', 0)
+                summary['skipped'] += 1
+                summary['skipped_bytes'] += size if isinstance(size, (int, float)) else 0
+                continue
+            if self.incremental:
+                # En modo incremental se decide por grupos completos (producto, temporada, fecha)
+                groups.setdefault(group_from_name(result['id']), []).append(result)
+                continue
+            yield result
+
+        for (date, season), results in groups.items():
+            sources = [result['id'] for result in results]
+            if self.manifest.is_current(self.dataset, product, date, self.aoi_hash, sources, season):
+                summary['up_to_date'] += len(results)
+                continue
+            self._new_sources[(product, season, date)] = sources
+            yield from results
+
+    def _start_downloads(self):
+        """
+        Reinicia el resumen de descargas (y el estado del modo incremental) antes de una descarga.
+        """
+        self.download_summary = {}
+        if self.incremental:
+            self._new_sources = {}
+            self._failed_groups = set()
+
+    def _new_summary(self, product):
+        summary = {'matches': 0, 'downloaded': 0, 'failed': 0, 'skipped': 0, 'skipped_bytes': 0,
+                   'up_to_date': 0, 'bytes': 0}
+        self.download_summary[product] = summary
+        return summary
+
+    def _download_done(self, product, paths, result=None):
+        """
+        Registra en el resumen la descarga correcta de un resultado (y la huella de sus archivos).
+        """
+        summary = self.download_summary[product]
+        summary['downloaded'] += 1
+        footprint = (result or {}).get('geometry')
+        for path in paths or []:
+            if os.path.exists(path):
+                summary['bytes'] += os.path.getsize(path)
+                self.catalogue.add(path)
+                if footprint:
+                    self.footprints[path] = footprint
+
+    def _download_failed(self, product, result_id, error):
+        """
+        Registra en el resumen la descarga fallida de un resultado.
+        """
+        self.download_summary[product]['failed'] += 1
+        date, season = group_from_name(result_id)
+        self._failed_groups.add((product, season, date))
+        print(f"Error downloading {result_id} ({product}): {error}")
+        import traceback
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def _report_downloads(self):
+        """
+        Muestra el resumen de descargas por producto.
+        """
+        for product, summary in self.download_summary.items():
+            if summary['skipped']:
+                print(f"Skipped {summary['skipped']} results for {product} outside the AOI "
+                      f"({summary['skipped_bytes'] / 1024 ** 2:.1f} MB not downloaded).")
+            if summary['up_to_date']:
+                print(f"{summary['up_to_date']} results for {product} already processed (incremental run).")
+            wanted = summary['matches'] - summary['skipped'] - summary['up_to_date']
+            if summary['failed']:
+                print(f"Downloaded {summary['downloaded']}/{wanted} products for {product}.")
+            else:
                 print(f"Downloaded all products for {product} successfully.")
 
-            except Exception as e:
-                print(f"Error downloading {product}: {e}")
-                import traceback
-                traceback.print_exc()
+    def download(self, engine='threads', concurrency=None):
+        """
+        Descarga los productos desde WEkEO usando la API HDA actualizada.
+
+        Con engine='threads', las búsquedas de cada producto y las descargas de cada resultado
+        se reparten en un pool de self.max_workers hilos (con max_workers=1 se ejecutan en serie).
+        Con engine='async', las descargas se hacen con asyncio sobre una sesión HTTP con
+        conexiones persistentes (ver download_async).
+        Si self.prefilter está activo, los resultados cuya huella no intersecta la
+        geometría del área de interés se descartan antes de descargar nada.
+        En modo incremental, los grupos (producto, fecha) que ya están en el manifiesto
+        con los mismos productos de origen no se descargan.
+        El resumen por producto queda en self.download_summary.
+
+        :param engine: (Opcional) Motor de descarga: 'threads' (por defecto) o 'async' (necesita aiohttp)
+        :param concurrency: (Opcional) Descargas simultáneas con engine='async' (por defecto max_workers, mínimo 8)
+        """
+        if engine == 'async':
+            run_coroutine(self.download_async(concurrency))
+            return
+        if engine != 'threads':
+            raise ValueError(f"Unknown download engine '{engine}'. Options: ['threads', 'async']")
+
+        if self.max_workers > 1:
+            print(f"Concurrent download mode: {self.max_workers} workers")
+
+        self._start_downloads()
+
+        with self.report.stage('download'):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                searches = {executor.submit(self._search, product): product for product in self.products}
+                downloads = {}
+
+                for future in as_completed(searches):
+                    product = searches[future]
+                    try:
+                        matches = future.result()
+                        print(f"Found {matches.total} matches for product: {product}.")
+                        summary = self._new_summary(product)
+
+                        # Las descargas de cada página arrancan mientras se precarga la siguiente
+                        for result in self._plan_downloads(product, matches, summary):
+                            downloads[executor.submit(self._download_result, result)] = (product, result)
+                    except Exception as e:
+                        print(f"Error downloading {product}: {e}")
+                        import traceback
+                        traceback.print_exc()
+                        continue
+
+                for future in as_completed(downloads):
+                    product, result = downloads[future]
+                    try:
+                        self._download_done(product, future.result(), result)
+                    except Exception as e:
+                        self._download_failed(product, result['id'], e)
+
+        self._report_downloads()
+
+    async def download_async(self, concurrency=None, chunk_size=CHUNK_SIZE):
+        """
+        Versión asyncio de download(): una única sesión HTTP (aiohttp) con conexiones
+        persistentes, descargas en streaming por bloques directamente a disco y como
+        mucho `concurrency` transferencias a la vez. Las búsquedas se detienen cuando
+        las descargas van por detrás (cola acotada).
+
+        :param concurrency: (Opcional) Descargas simultáneas (por defecto max_workers, mínimo 8)
+        :param chunk_size: (Opcional) Tamaño de bloque de lectura/escritura en bytes
+        """
+        concurrency = concurrency or max(self.max_workers, ASYNC_CONCURRENCY)
+        print(f"Async download mode: {concurrency} concurrent transfers")
+
+        self._start_downloads()
+        with self.report.stage('download'):
+            await AsyncEngine(self, concurrency, chunk_size).run()
+        self._report_downloads()
 
     def filter_tiles(self):
         """
-        Filtra los archivos TIFF para mantener solo aquellos que pertenecen a los husos UTM de interés.
+        Filtra los archivos TIFF para mantener solo aquellos que pertenecen a los tiles MGRS
+        que intersectan el área de interés. Los archivos sin ID de tile (ej. los mosaicos
+        ya recortados) no se tocan.
         """
         print("Filtering tiles...")
-        for root, _, files in os.walk(self.pyhda):
-            for file in files:
-                if file.endswith(".tif"):
-                    # Si el archivo no pertenece a ninguno de los husos UTM de interés, se elimina
-                    if not any(utm_zone in file for utm_zone in self.utm_zones):
-                        file_path = os.path.join(root, file)
-                        print(f"Removing tile not in UTM zones {self.utm_zones}: {file_path}")
-                        os.remove(file_path)
+        for entry in self.catalogue.entries('.tif'):
+            # Si el tile del archivo no intersecta el área de interés, se elimina
+            if entry.tile is not None and entry.tile not in self.tiles:
+                print(f"Removing tile {entry.tile} not in AOI tiles {self.tiles}: {entry.path}")
+                self.catalogue.remove(entry.path)
+                self.report.count('tiles_removed')
+                if entry.archive is None:
+                    os.remove(entry.path)
+                # Un zip se elimina cuando ya no contiene ningún tile del AOI
+                elif not self.catalogue.entries(archive=entry.archive):
+                    os.remove(entry.archive)
+
+    def _record_output(self, product, season, date, paths, out_path):
+        """
+        Registra una salida en el manifiesto con sus productos de origen (los IDs de los
+        resultados descargados en esta sesión o, si no se conocen, los nombres de los tiles).
+        """
+        sources = (self._new_sources or {}).get((product, season, date))
+        if sources is None:
+            sources = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+        self.manifest.record(self.dataset, product, date, self.aoi_hash, sources, out_path, season)
+
+    def _tile_groups(self):
+        """
+        Agrupa los tiles descargados por fecha, producto y temporada (ver Catalogue). Los recortes
+        de ejecuciones anteriores (*_rec.tif) son salidas, no tiles, y no están en el índice.
+
+        :return: Lista ordenada de tuplas (fecha, producto, temporada o None, rutas de los tiles).
+        """
+        return self.catalogue.groups('.tif')
+
+    def _corrections(self, groups, qflag=None, rescale=False):
+        """
+        Prepara la máscara de calidad y la escala de cada grupo fecha/producto.
+
+        :param groups: Grupos (fecha, producto, temporada, rutas) de _tile_groups.
+        :param qflag: (Opcional) Valores de QFLAG que se conservan (lista) o función que recibe el
+            array de QFLAG y devuelve True en los píxeles válidos. None = sin máscara de calidad.
+        :param rescale: (Opcional) True para aplicar la escala/offset de cada producto (la de los
+            metadatos del raster o, si no tiene, PRODUCT_SCALES), o diccionario {producto: (escala, offset)}.
+        :return: Lista con un ClipCorrection (o None) por grupo.
+        """
+        from .Quality import PRODUCT_SCALES, QUALITY_PRODUCT, ClipCorrection, companion_paths, raster_scale
+
+        if qflag is not None and not callable(qflag) and isinstance(qflag, (int, float)):
+            qflag = [qflag]
+        corrections = []
+        scales = {}
+        if qflag is not None:
+            # Las capas de calidad se buscan en el índice: pueden estar sueltas o en otro zip
+            catalogue = {entry.path: entry for entry in self.catalogue.entries('.tif')}
+            flags = {(entry.dataset, entry.date, entry.tile, entry.season): entry.path
+                     for entry in catalogue.values() if entry.product == QUALITY_PRODUCT}
+        for date, product, season, paths in groups:
+            scale, offset = 1.0, 0.0
+            if isinstance(rescale, dict):
+                scale, offset = rescale.get(product, (1.0, 0.0))
+            elif rescale:
+                if product not in scales:
+                    scales[product] = raster_scale(paths[0])
+                    if scales[product] == (1.0, 0.0):
+                        scales[product] = PRODUCT_SCALES.get(product, (1.0, 0.0))
+                scale, offset = scales[product]
+
+            flag_paths = None
+            if qflag is not None and product != QUALITY_PRODUCT:
+                entries = [catalogue.get(path) for path in paths]
+                flag_paths = companion_paths(entries, flags) if None not in entries else None
+                if flag_paths is None:
+                    print(f"No {QUALITY_PRODUCT} tiles for date {date} and product {layer_name(product, season)}, "
+                          f"quality mask not applied.")
 
-    def mosaic_and_clip(self):
+            correction = ClipCorrection(scale, offset, flag_paths, qflag)
+            corrections.append(correction if correction.rescale or flag_paths else None)
+        return corrections
+
+    def _delete_archive(self, archive):
+        """
+        Elimina un zip cuyos rasters ya se han procesado.
+        """
+        if os.path.exists(archive):
+            os.remove(archive)
+            print(f"Deleted archive: {archive}")
+        self.catalogue.remove(archive)
+        self.report.count('archives_deleted')
+
+    def mosaic_and_clip(self, streaming=False, block_size=512, processes=1, profile='default', bigtiff=False,
+                        output='gtiff', qflag=None, rescale=False, delete_archives=False):
         """
         Crea mosaicos de los tiles descargados y los recorta con la geometría del área de interés.
+        El mosaico se hace directamente sobre la extensión del AOI y se enmascara en memoria,
+        así que solo se escribe en disco el archivo recortado (mosaic_{fecha}_{producto}_rec.tif, con la
+        temporada en los productos fenológicos: mosaic_{fecha}_{producto}_{s1|s2}_rec.tif).
+
+        :param streaming: (Opcional) Si es True, el recorte se escribe bloque a bloque leyendo solo
+            las ventanas necesarias de cada tile, sin cargar el mosaico completo en memoria.
+        :param block_size: (Opcional) Tamaño de bloque en píxeles del modo streaming.
+        :param processes: (Opcional) Procesos para repartir los grupos fecha/producto
+            (1 = en serie, None = todos los núcleos disponibles).
+        :param profile: (Opcional) Perfil de los rasters de salida: 'default' (GeoTIFF sin comprimir),
+            'deflate' o 'zstd' (en teselas, comprimido y con predictor) o 'cog' (Cloud Optimized GeoTIFF).
+        :param bigtiff: (Opcional) Escribir las salidas en formato BigTIFF.
+        :param output: (Opcional) 'gtiff' (un GeoTIFF por fecha y producto) o 'zarr'/'netcdf' (un cubo
+            (time, y, x) por producto, cube_{producto}.zarr/.nc, al que se añade cada fecha según se procesa).
+            Los cubos se construyen siempre en memoria por fecha (streaming, profile y bigtiff no se aplican).
+        :param qflag: (Opcional) Enmascara cada producto con su capa QFLAG (misma fecha y tile) durante el
+            recorte: valores de QFLAG que se conservan (lista) o función que recibe el array de QFLAG
+            y devuelve True en los píxeles válidos (con processes > 1, una función de módulo, no una lambda).
+        :param rescale: (Opcional) Aplicar escala y offset durante el recorte (salidas float32 con NaN
+            como nodata): True para los de cada producto o diccionario {producto: (escala, offset)}.
+        :param delete_archives: (Opcional) Eliminar cada zip descargado en cuanto se han procesado todos
+            los rasters que contiene (los de los grupos con errores se conservan), para que los zips no
+            se acumulen en disco. Los rasters de los zips se leen siempre sin descomprimirlos (/vsizip/).
         """
-        # Filtrar solo los archivos en self.pyhda que corresponden a los tiles correctos
-        self.filter_tiles()
+        # Los productos SLSTR son pasadas (swaths) sin rejilla: se regridan en lugar de hacer mosaicos
+        if self.dataset == 'SLSTR':
+            ignored = [name for name, value, default in (('streaming', streaming, False), ('block_size', block_size, 512),
+                                                         ('processes', processes, 1), ('qflag', qflag, None),
+                                                         ('rescale', rescale, False))
+                       if value != default]
+            if ignored:
+                print(f"Warning: {ignored} only apply to HR-VPP tiles, not used for SLSTR swaths")
+            return self.regrid_swaths(output=output, profile=profile, bigtiff=bigtiff, delete_archives=delete_archives)
 
-        # Diccionario para agrupar rasters por fecha y producto
-        rasters = {}
+        # rasterio solo se carga cuando hace falta procesar
+        from .Mosaic import aoi_grid, clip_group, read_clip
+        from .Cube import CubeWriter
 
-        # Agrupar por fecha y producto usando el nombre del archivo
-        for file in os.listdir(self.pyhda):
-            if file.endswith('.tif'):
-                date = file.split('_')[1][:8]  # Extraer la fecha
-                product = file.split('_')[-1][:-4]  # Extraer el nombre del producto
+        with self.report.stage('mosaic_and_clip'):
+            # Filtrar solo los archivos en self.pyhda que corresponden a los tiles correctos
+            self.filter_tiles()
 
-                if date not in rasters:
-                    rasters[date] = {}
-                if product not in rasters[date]:
-                    rasters[date][product] = []
+            # Crear mosaicos y recortar para cada grupo de fecha y producto
+            groups = self._tile_groups()
 
-                rasters[date][product].append(os.path.join(self.pyhda, file))
+            # En modo incremental solo se procesan los grupos descargados en esta sesión
+            if self.incremental and self._new_sources is not None:
+                groups = [group for group in groups if (group[1], group[2], group[0]) in self._new_sources]
+            corrections = self._corrections(groups, qflag, rescale)
 
-        # Crear mosaicos y recortar para cada grupo de fecha y producto
-        for date, products in rasters.items():
-            for product, paths in products.items():
-                try:
-                    print(f"Mosaicking and clipping for date {date} and product {product}...")
-                    # Crear una lista de fuentes de raster
-                    nrasters = [rasterio.open(path) for path in paths]
-
-                    # Crear el mosaico
-                    mosaic, out_trans = merge(nrasters)
-
-                    # Actualizar metadatos para el archivo de salida
-                    out_meta = nrasters[0].meta.copy()
-                    out_meta.update({
-                        "driver": "GTiff",
-                        "height": mosaic.shape[1],
-                        "width": mosaic.shape[2],
-                        "transform": out_trans,
-                        "crs": nrasters[0].crs  # Asegurar que el CRS está definido
-                    })
-
-                    # Definir nombres de archivo de salida
-                    out_mosaic = os.path.join(self.pyhda, f"mosaic_{date}_{product}.tif")
-                    out_mosaic_rec = os.path.join(self.pyhda, f"mosaic_{date}_{product}_rec.tif")
-
-                    # Guardar el mosaico
-                    with rasterio.open(out_mosaic, "w", **out_meta) as dest:
-                        dest.write(mosaic)
-
-                    # Re-proyectar la geometría al CRS del raster
-                    site_geom = self.gdf.to_crs(out_meta['crs']).geometry.unary_union
-
-                    # Verificar la superposición
-                    raster_geom = box(*out_meta['transform'] * (0, 0),
-                                      *out_meta['transform'] * (out_meta['width'], out_meta['height']))
-
-                    if not raster_geom.intersects(site_geom):
-                        print(f"La geometría y el raster no se superponen para la fecha {date} y producto {product}.")
-                        continue  # Saltar al siguiente
-
-                    # Realizar el recorte
-                    with rasterio.open(out_mosaic) as src_:
-                        out_image, out_transform = mask(src_, [site_geom], crop=True)
-                        out_meta = src_.meta
-
-                    # Actualizar metadatos para el archivo recortado
-                    out_meta.update({
-                        "driver": "GTiff",
-                        "height": out_image.shape[1],
-                        "width": out_image.shape[2],
-                        "transform": out_transform
-                    })
-
-                    # Guardar el archivo recortado
-                    with rasterio.open(out_mosaic_rec, "w", **out_meta) as dest:
-                        dest.write(out_image)
-
-                    # Cerrar los archivos abiertos
-                    for raster in nrasters:
-                        raster.close()
+            if output == 'gtiff':
+                func = clip_group
+                tasks = [(paths, self.gdf,
+                          os.path.join(self.pyhda, f"mosaic_{date}_{layer_name(product, season)}_rec.tif"),
+                          streaming, block_size, profile, bigtiff, correction)
+                         for (date, product, season, paths), correction in zip(groups, corrections)]
+            elif output in CUBE_FORMATS:
+                # Todas las fechas de un producto comparten la rejilla fija del AOI
+                grids = {}
+                for date, product, season, paths in groups:
+                    if product not in grids:
+                        grids[product] = aoi_grid(paths[0], self.gdf)
+                func = read_clip
+                tasks = [(paths, self.gdf, grids[product], correction)
+                         for (date, product, season, paths), correction in zip(groups, corrections)]
+            else:
+                raise ValueError(f"Unknown output '{output}'. Options: {['gtiff'] + list(CUBE_FORMATS)}")
+
+            if processes != 1:
+                print(f"Parallel mosaicking: {min(processes or available_cores(), max(len(tasks), 1))} processes")
 
+            # Grupos pendientes que leen de cada zip (tiles y capas de calidad)
+            archives = []
+            pending = {}
+            for (date, product, season, paths), correction in zip(groups, corrections):
+                used = {split_vsizip(path)[0] for path in paths + ((correction and correction.flag_paths) or [])}
+                used.discard(None)
+                archives.append(used)
+                for archive in used:
+                    pending[archive] = pending.get(archive, 0) + 1
+
+            # Mosaico y recorte en una sola pasada, sin mosaico intermedio en disco
+            cubes = {}
+            try:
+                # Cada tarea devuelve también sus tiempos (merge, mask, write), aunque se ejecute en otro proceso
+                results = _map_ordered(call_timed, [(func,) + task for task in tasks], processes)
+                for i, ((date, product, season, paths), (timed_result, error)) in enumerate(zip(groups, results), 1):
+                    name = layer_name(product, season)
+                    print(f"[{i}/{len(groups)}] Mosaicking and clipping for date {date} and product {name}...")
+                    if error is not None:
+                        print(f"Error processing date {date} and product {name}: {error}")
+                        import traceback
+                        traceback.print_exception(type(error), error, error.__traceback__)
+                        self.report.count('groups_failed')
+                        continue
+
+                    for archive in archives[i - 1]:
+                        pending[archive] -= 1
+                        if delete_archives and not pending[archive]:
+                            self._delete_archive(archive)
+
+                    result, timings = timed_result
+                    if result is None:
+                        print(f"La geometría y el raster no se superponen para la fecha {date} y producto {name}.")
+                        continue
+
+                    out_path = result
+                    if output in CUBE_FORMATS:
+                        start = time.perf_counter()
+                        out_image, out_meta = result
+                        if name not in cubes:
+                            cube_path = os.path.join(self.pyhda, f"cube_{name}{CUBE_FORMATS[output]}")
+                            cubes[name] = CubeWriter(cube_path, output, name, out_meta)
+                        # En modo incremental el grupo se procesa porque sus productos de origen
+                        # son nuevos o han cambiado: su corte del cubo se sobrescribe
+                        written = cubes[name].append(date, out_image, out_meta, overwrite=self.incremental)
+                        out_path = cubes[name].path
+                        timings['write'] = timings.get('write', 0.0) + time.perf_counter() - start
+                        timings['total'] += timings['write']
+                        nbytes = out_image.nbytes
+                    else:
+                        written = True
+                        nbytes = os.path.getsize(out_path)
+                    self.report.item('mosaic_and_clip', f"{date}_{name}", timings['total'], nbytes,
+                                     timings=timings, tiles=len(paths))
+                    self.report.count('tiles_processed', len(paths))
+
+                    # Solo se registran las salidas escritas (una fecha ignorada por el cubo sigue desactualizada)
+                    if self.incremental and written and (product, season, date) not in self._failed_groups:
+                        self._record_output(product, season, date, paths, out_path)
+            finally:
+                for cube in cubes.values():
+                    cube.close()
+                if self.incremental:
+                    self.manifest.save()
+
+    def regrid_swaths(self, resolution=1000, overpass=None, stat='mean', cloud_mask=True, output='gtiff',
+                      profile='default', bigtiff=False, index_cache=None, delete_archives=False):
+        """
+        Regrida las pasadas SLSTR (SL_2_LST, NetCDF con geolocalización) descargadas sobre una rejilla
+        regular del AOI y escribe una serie diaria de LST (K): mosaic_{fecha}_LST_rec.tif o un cubo
+        cube_LST.zarr/.nc. El remuestreo es por vecino más próximo con un índice (KD-tree) que se calcula
+        una vez por geometría de pasada
+        (plataforma, órbita relativa y frame) y se reutiliza en todas las adquisiciones que la comparten.
+        En modo incremental solo se procesan los días descargados en esta sesión y cada día escrito
+        se registra en el manifiesto (como en mosaic_and_clip).
+
+        :param resolution: (Opcional) Tamaño de píxel de la rejilla en metros (UTM del centro del AOI).
+        :param overpass: (Opcional) 'day' o 'night' para usar solo las pasadas diurnas o nocturnas
+            (hora solar local en el centro del AOI). Por defecto, todas.
+        :param stat: (Opcional) Combinación de las adquisiciones de un mismo día: 'mean', 'min', 'max' o 'median'.
+        :param cloud_mask: (Opcional) Descartar los píxeles marcados como nube.
+        :param output: (Opcional) 'gtiff', 'zarr' o 'netcdf' (ver mosaic_and_clip).
+        :param profile: (Opcional) Perfil de los GeoTIFF de salida (ver mosaic_and_clip).
+        :param bigtiff: (Opcional) Escribir los GeoTIFF de salida en formato BigTIFF.
+        :param index_cache: (Opcional) Carpeta de la caché en disco de los índices (True = ~/.cache/pyvpp/swath).
+            Por defecto, los índices solo se reutilizan dentro de la ejecución.
+        :param delete_archives: (Opcional) Eliminar cada zip en cuanto se ha leído.
+        """
+        import numpy as np
+        from rasterio.features import geometry_mask
+        from .Archive import is_archive
+        from .Cube import CubeWriter
+        from .Mosaic import open_output, site_geometry
+        from .Swath import DAILY_STATS, SWATH_RESOLUTION, SwathIndexCache, acquisition_time, daily_composite, \
+            is_daytime, read_swath, swath_grid
+
+        if stat not in DAILY_STATS:
+            raise ValueError(f"Unknown stat '{stat}'. Options: {list(DAILY_STATS)}")
+        if overpass not in (None, 'day', 'night'):
+            raise ValueError(f"Unknown overpass '{overpass}'. Options: [None, 'day', 'night']")
+        if output != 'gtiff' and output not in CUBE_FORMATS:
+            raise ValueError(f"Unknown output '{output}'. Options: {['gtiff'] + list(CUBE_FORMATS)}")
+
+        with self.report.stage('regrid_swaths'):
+            grid = swath_grid(self.gdf, resolution)
+            crs, transform, width, height = grid
+            radius = 1.5 * max(resolution, SWATH_RESOLUTION)
+            outside = geometry_mask([site_geometry(self.gdf, crs)], out_shape=(height, width), transform=transform)
+            meta = {'driver': 'GTiff', 'dtype': 'float32', 'nodata': float('nan'), 'width': width,
+                    'height': height, 'count': 1, 'crs': crs, 'transform': transform}
+            center_lon = self.geometry.centroid.x
+            cache = SwathIndexCache(index_cache)
+
+            # Producto buscado (ej. 'SL_2_LST___') de cada día descargado en esta sesión: en modo
+            # incremental solo se procesan esos días y se registran en el manifiesto con ese producto
+            new_days = None
+            if self.incremental and self._new_sources is not None:
+                new_days = {date: product for product, season, date in self._new_sources}
+
+            # Productos SLSTR del índice (carpetas .SEN3 o zips), agrupados por día
+            days = {}
+            for entry in self.catalogue.entries(product='LST'):
+                if not (entry.path.endswith('.SEN3') or is_archive(entry.path)):
+                    continue
+                if new_days is not None and entry.date not in new_days:
+                    continue
+                when = acquisition_time(entry.path)
+                if overpass is not None and when is not None and is_daytime(when, center_lon) != (overpass == 'day'):
+                    continue
+                days.setdefault(entry.date, []).append(entry.path)
+
+            cube = None
+            try:
+                for i, (date, paths) in enumerate(sorted(days.items()), 1):
+                    print(f"[{i}/{len(days)}] Regridding {len(paths)} SLSTR acquisitions for date {date}...")
+                    layers = []
+                    failed = False
+                    for path in paths:
+                        start = time.perf_counter()
+                        try:
+                            lon, lat, lst = read_swath(path, cloud_mask, self.pyhda)
+                            timings = {'read': time.perf_counter() - start}
+                            t = time.perf_counter()
+                            index, hit = cache.get(lon, lat, grid, radius, os.path.basename(path))
+                            timings['index'] = time.perf_counter() - t
+                            t = time.perf_counter()
+                            layers.append(index.apply(lst))
+                            timings['regrid'] = time.perf_counter() - t
+                        except Exception as e:
+                            print(f"Error regridding {os.path.basename(path)}: {e}")
+                            import traceback
+                            traceback.print_exc()
+                            self.report.count('swaths_failed')
+                            failed = True
+                            continue
+                        self.report.item('regrid_swaths', os.path.basename(path), time.perf_counter() - start,
+                                         timings=timings, index_cache_hit=hit)
+                        self.report.count('swath_index_hits' if hit else 'swath_index_builds')
+                        if delete_archives and is_archive(path):
+                            self._delete_archive(path)
+
+                    if not layers:
+                        continue
+                    daily = daily_composite(layers, stat)
+                    daily[outside] = np.nan
+                    if output == 'gtiff':
+                        out_path = os.path.join(self.pyhda, f"mosaic_{date}_LST_rec.tif")
+                        with open_output(out_path, meta, profile, bigtiff) as dest:
+                            dest.write(daily, 1)
+                        written = True
+                    else:
+                        if cube is None:
+                            cube = CubeWriter(os.path.join(self.pyhda, f"cube_LST{CUBE_FORMATS[output]}"),
+                                              output, 'LST', meta)
+                        written = cube.append(date, daily, meta, overwrite=self.incremental)
+                        out_path = cube.path
+
+                    # Un día con pasadas que no se han podido leer o descargar se vuelve a procesar
+                    if self.incremental and written and not failed:
+                        product = (new_days or {}).get(date, self.products[0])
+                        if (product, None, date) not in self._failed_groups:
+                            self._record_output(product, None, date, paths, out_path)
+            finally:
+                if cube is not None:
+                    cube.close()
+                if self.incremental:
+                    self.manifest.save()
+
+    def iter_arrays(self, aligned=False, masked=False, qflag=None, rescale=False):
+        """
+        Mosaico y recorte en memoria, sin escribir nada en disco: devuelve un generador que
+        procesa cada grupo fecha/producto solo cuando se le pide el siguiente, así que en
+        memoria solo hay un recorte cada vez.
+
+        :param aligned: (Opcional) Usar para todas las fechas de un producto la rejilla fija
+            que cubre el AOI (como los cubos), para poder apilar los arrays directamente.
+        :param masked: (Opcional) Devolver arrays enmascarados (numpy.ma) con los píxeles sin
+            dato y los de fuera del AOI ocultos.
+        :param qflag: (Opcional) Máscara de calidad con la capa QFLAG (ver mosaic_and_clip).
+        :param rescale: (Opcional) Aplicar escala y offset (ver mosaic_and_clip).
+        :return: Generador de tuplas (fecha, producto, array (alto, ancho), transform, crs). Los productos
+            fenológicos llevan su temporada en el nombre (ej. 'SOSD_s1').
+        """
+        import numpy as np
+        from .Mosaic import aoi_grid, read_clip
+
+        with self.report.stage('iter_arrays'):
+            self.filter_tiles()
+            groups = self._tile_groups()
+            corrections = self._corrections(groups, qflag, rescale)
+
+        grids = {}
+        for i, ((date, product, season, paths), correction) in enumerate(zip(groups, corrections), 1):
+            name = layer_name(product, season)
+            # El tiempo del consumidor entre un grupo y el siguiente no cuenta para la etapa
+            with self.report.stage('iter_arrays'):
+                print(f"[{i}/{len(groups)}] Mosaicking and clipping for date {date} and product {name}...")
+                try:
+                    if aligned and product not in grids:
+                        grids[product] = aoi_grid(paths[0], self.gdf)
+                    result, timings = call_timed(read_clip, paths, self.gdf, grids.get(product), correction)
                 except Exception as e:
-                    print(f"Error processing date {date} and product {product}: {e}")
+                    print(f"Error processing date {date} and product {name}: {e}")
                     import traceback
                     traceback.print_exc()
+                    self.report.count('groups_failed')
                     continue
-                    
+
+                if result is None:
+                    print(f"La geometría y el raster no se superponen para la fecha {date} y producto {name}.")
+                    continue
+                out_image, out_meta = result
+                array = out_image[0]
+                if masked:
+                    array = np.ma.masked_invalid(array) if np.isnan(out_meta['nodata']) \
+                        else np.ma.masked_equal(array, out_meta['nodata'])
+                self.report.item('iter_arrays', f"{date}_{name}", timings['total'], array.nbytes,
+                                 timings=timings, tiles=len(paths))
+                self.report.count('tiles_processed', len(paths))
+
+            yield date, name, array, out_meta['transform'], out_meta['crs']
+
+    def extract(self, features, id_column=None, stat='mean', processes=1, dropna=False):
+        """
+        Extrae los valores de puntos o polígonos directamente de los tiles descargados, sin
+        hacer mosaicos ni escribir rasters: de cada tile solo se leen los bloques (puntos) o
+        ventanas (polígonos) que contienen entidades.
+
+        :param features: GeoDataFrame o ruta a un archivo vectorial (shapefile, GeoPackage...)
+            con puntos y/o polígonos. Sin CRS se asume EPSG:4326.
+        :param id_column: (Opcional) Columna que identifica cada entidad. Por defecto, el índice.
+        :param stat: (Opcional) Estadístico de los píxeles de cada polígono: 'mean', 'median',
+            'min', 'max' o 'std'. Los puntos toman el valor del píxel que los contiene.
+        :param processes: (Opcional) Procesos para repartir los grupos fecha/producto
+            (1 = en serie, None = todos los núcleos disponibles).
+        :param dropna: (Opcional) Eliminar las filas sin dato.
+        :return: DataFrame con las columnas feature, date, product y value (una fila por
+            entidad, fecha y producto).
+        """
+        import pandas as pd
+        from .Cube import to_datetime
+        from .Extract import STATS, extract_group
+
+        if stat not in STATS:
+            raise ValueError(f"Unknown stat '{stat}'. Options: {list(STATS)}")
+        features = load_shape(features)
+        if features.crs is None:
+            features = features.set_crs("EPSG:4326")
+        ids = _feature_ids(features, id_column)
+
+        frames = []
+        with self.report.stage('extract'):
+            groups = self._tile_groups()
+            tasks = [(extract_group, paths, features.geometry, stat) for date, product, season, paths in groups]
+            results = _map_ordered(call_timed, tasks, processes)
+            for i, ((date, product, season, paths), (timed_result, error)) in enumerate(zip(groups, results), 1):
+                name = layer_name(product, season)
+                print(f"[{i}/{len(groups)}] Extracting date {date} and product {name}...")
+                if error is not None:
+                    print(f"Error extracting date {date} and product {name}: {error}")
+                    import traceback
+                    traceback.print_exception(type(error), error, error.__traceback__)
+                    self.report.count('groups_failed')
+                    continue
+
+                values, timings = timed_result
+                self.report.item('extract', f"{date}_{name}", timings['total'], timings=timings,
+                                 tiles=len(paths), features=len(ids))
+                frames.append(pd.DataFrame({'feature': ids, 'date': to_datetime(date),
+                                            'product': name, 'value': values}))
+
+        if not frames:
+            return pd.DataFrame({'feature': [], 'date': pd.Series(dtype='datetime64[ns]'),
+                                 'product': [], 'value': []})
+        table = pd.concat(frames, ignore_index=True)
+        return table.dropna(subset=['value']).reset_index(drop=True) if dropna else table
+
+    def zonal_stats(self, features=None, id_column=None, stats=None, output=None, source='auto'):
+        """
+        Calcula estadísticos por entidad (polígono) para cada fecha y producto de los recortes
+        de mosaic_and_clip (GeoTIFF o cubos). Las entidades se rasterizan una sola vez por
+        rejilla de salida y esa rejilla de etiquetas se reutiliza en todas las fechas y
+        productos; los estadísticos se calculan con reducciones vectorizadas (bincount).
+
+        :param features: (Opcional) GeoDataFrame o ruta a un archivo vectorial con los polígonos.
+            Por defecto, las entidades del área de interés. Sin CRS se asume EPSG:4326.
+        :param id_column: (Opcional) Columna que identifica cada entidad. Por defecto, el índice.
+        :param stats: (Opcional) Estadísticos: 'count', 'sum', 'mean', 'std', 'min', 'max',
+            'median' y percentiles como 'p10' o 'p90'. Por defecto count, mean, std, min, max y median.
+        :param output: (Opcional) Archivo .csv o .parquet donde se escriben los resultados según
+            se calculan (Parquet necesita pyarrow). Si no se indica, se devuelve un DataFrame.
+        :param source: (Opcional) Salidas que se leen: 'auto' (cada fecha y producto una sola vez,
+            del cubo si lo contiene y si no del GeoTIFF), 'gtiff' o 'cube'.
+        :return: DataFrame con las columnas feature, date, product y una por estadístico,
+            o la ruta del archivo si se indica output.
+        """
+        import pandas as pd
+        from .Cube import to_datetime
+        from .Zonal import DEFAULT_STATS, TableWriter, ZoneLabels, iter_outputs, overlap_layers, parse_stats
+
+        stats = parse_stats(stats or DEFAULT_STATS)
+        features = self.gdf if features is None else load_shape(features)
+        if features.crs is None:
+            features = features.set_crs("EPSG:4326")
+        ids = _feature_ids(features, id_column)
+
+        writer = TableWriter(output) if output else None
+        frames = []
+        labels = {}
+        with self.report.stage('zonal_stats'):
+            layers = overlap_layers(features.geometry)
+            try:
+                start = time.perf_counter()
+                for date, product, grid, array, nodata in iter_outputs(self.pyhda, source):
+                    timings = {'read': time.perf_counter() - start}
+
+                    # Una rejilla de etiquetas por rejilla de salida, compartida por fechas y productos
+                    key = (grid[0].to_wkt(), tuple(grid[1]), grid[2], grid[3])
+                    if key not in labels:
+                        t = time.perf_counter()
+                        labels[key] = ZoneLabels(features.geometry, *grid, layers=layers)
+                        timings['rasterize'] = time.perf_counter() - t
+                        self.report.count('zone_grids')
+
+                    t = time.perf_counter()
+                    table = labels[key].reduce(array, nodata, stats)
+                    timings['reduce'] = time.perf_counter() - t
+
+                    frame = pd.DataFrame({'feature': ids, 'date': to_datetime(date), 'product': product, **table})
+                    t = time.perf_counter()
+                    if writer is not None:
+                        writer.write(frame)
+                    else:
+                        frames.append(frame)
+                    timings['write'] = time.perf_counter() - t
+
+                    self.report.item('zonal_stats', f"{date}_{product}", sum(timings.values()),
+                                     timings=timings, features=len(ids))
+                    start = time.perf_counter()
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        if writer is not None:
+            print(f"Zonal statistics saved to {output}")
+            return output
+        if not frames:
+            return pd.DataFrame(columns=['feature', 'date', 'product'] + [name for name, _ in stats])
+        return pd.concat(frames, ignore_index=True)
+
     def clean(self):
         """
-        Mantiene solo los archivos .rec.tif en la carpeta de salida y elimina todo lo demás.
+        Mantiene solo los archivos .rec.tif (y los cubos cube_*) en la carpeta de salida y elimina todo lo demás.
         """
-        for filename in os.listdir(self.pyhda):
-            file_path = os.path.join(self.pyhda, filename)
+        with self.report.stage('clean'):
+            for filename in os.listdir(self.pyhda):
+                file_path = os.path.join(self.pyhda, filename)
 
-            # Si es un directorio, eliminarlo por completo
-            if os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-                print(f"Deleted directory: {file_path}")
-            # Si es un archivo y no cumple la condición de ".rec.tif", eliminarlo
-            elif not filename.endswith('_rec.tif'):
-                os.remove(file_path)
-                print(f"Deleted file: {file_path}")
-                
-    def run(self):
+                # Los cubos de series temporales y el manifiesto son salidas, no se tocan (ni el bloqueo de wekeo_batch)
+                if filename.startswith('cube_') or filename in (MANIFEST_NAME, LOCK_NAME):
+                    continue
+                # Si es un directorio, eliminarlo por completo
+                elif os.path.isdir(file_path):
+                    shutil.rmtree(file_path)
+                    self.catalogue.remove(file_path)
+                    print(f"Deleted directory: {file_path}")
+                # Si es un archivo y no cumple la condición de ".rec.tif", eliminarlo
+                elif not filename.endswith('_rec.tif'):
+                    os.remove(file_path)
+                    self.catalogue.remove(file_path)
+                    print(f"Deleted file: {file_path}")
+
+    def run(self, **clip_options):
         """
         Ejecuta el proceso completo: descarga, mosaico/recorte y limpieza.
+
+        :param clip_options: (Opcional) Opciones para mosaic_and_clip (ej. output='zarr', profile='cog').
+        :return: Informe de la ejecución (ver RunReport.to_dict), también disponible en self.report.
         """
+        self.report = RunReport(self.report.hooks)
         print('Downloading images...')
         self.download()
         print('Mosaicking and clipping...')
-        self.mosaic_and_clip()
+        # clean() borra después todo lo descargado: los zips se eliminan en cuanto se procesan
+        clip_options.setdefault('delete_archives', True)
+        self.mosaic_and_clip(**clip_options)
         print('Cleaning the folder...')
         self.clean()
         print('Process completed!')
+        return self.report.to_dict()
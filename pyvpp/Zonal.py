@@ -0,0 +1,288 @@
+import os
+import re
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.features import rasterize
+from .Cube import CUBE_FORMATS, _import_xarray
+from .Extract import _valid
+
+
+# Estadísticos por defecto de zonal_stats
+DEFAULT_STATS = ('count', 'mean', 'std', 'min', 'max', 'median')
+
+# Estadísticos simples; además, percentiles como 'p10' o 'p90'
+SIMPLE_STATS = ('count', 'sum', 'mean', 'std', 'min', 'max', 'median')
+
+# Recortes escritos por mosaic_and_clip (mosaic_{fecha}_{producto}_rec.tif)
+OUTPUT_PATTERN = re.compile(r'^mosaic_(\d{4,8})_(.+)_rec\.tif$')
+
+
+def parse_stats(stats):
+    """
+    Valida la lista de estadísticos.
+
+    :param stats: Nombres de estadísticos (ver SIMPLE_STATS) o percentiles 'pNN' (ej. 'p10').
+    :return: Lista de tuplas (nombre, percentil o None).
+    """
+    parsed = []
+    for name in stats:
+        if name in SIMPLE_STATS:
+            parsed.append((name, 50.0 if name == 'median' else None))
+            continue
+        match = re.fullmatch(r'p(\d{1,2}(?:\.\d+)?|100)', name)
+        if not match:
+            raise ValueError(f"Unknown stat '{name}'. Options: {list(SIMPLE_STATS)} or percentiles like 'p10'")
+        parsed.append((name, float(match.group(1))))
+    return parsed
+
+
+def overlap_layers(geometries):
+    """
+    Reparte las entidades en capas sin solapes (coloreado voraz del grafo de solapes),
+    para rasterizar cada capa por separado y que un píxel cuente para todas las
+    entidades que lo cubren. Las entidades que solo se tocan en el borde no se separan.
+
+    :param geometries: GeoSeries de polígonos.
+    :return: Array con la capa de cada entidad.
+    """
+    geometries = geometries.reset_index(drop=True)
+    layers = np.zeros(len(geometries), dtype=np.int64)
+    valid = geometries.notna() & ~geometries.is_empty
+    if valid.sum() < 2:
+        return layers
+
+    # Pares de entidades que comparten interior
+    first, second = geometries[valid].sindex.query(geometries[valid], predicate='intersects')
+    positions = np.flatnonzero(valid.to_numpy())
+    first, second = positions[first], positions[second]
+    keep = first > second
+    first, second = first[keep], second[keep]
+    touching = geometries.iloc[first].reset_index(drop=True).touches(geometries.iloc[second].reset_index(drop=True))
+    first, second = first[~touching.to_numpy()], second[~touching.to_numpy()]
+
+    neighbours = {}
+    for i, j in zip(first, second):
+        neighbours.setdefault(i, []).append(j)
+    for i in sorted(neighbours):
+        used = {layers[j] for j in neighbours[i]}
+        layers[i] = next(layer for layer in range(len(used) + 1) if layer not in used)
+    return layers
+
+
+class ZoneLabels:
+    """
+    Entidades rasterizadas sobre una rejilla de salida. Se calcula una sola vez por
+    rejilla y se reutiliza para todas las fechas y productos que la comparten: los
+    píxeles de cada entidad quedan agrupados por etiqueta, así que cada reducción
+    es un bincount (o un ordenamiento, para los percentiles) sobre arrays planos.
+
+    Los píxeles se asignan por su centro. Las entidades que se solapan se rasterizan en
+    capas distintas (ver overlap_layers), así que un píxel cuenta para todas las que lo
+    cubren. Las entidades sin ningún píxel obtienen count 0 y NaN.
+    """
+
+    def __init__(self, geometries, crs, transform, width, height, layers=None):
+        """
+        :param geometries: GeoSeries de polígonos (cualquier CRS).
+        :param crs: CRS de la rejilla.
+        :param transform: Transformación afín de la rejilla.
+        :param width: Ancho en píxeles.
+        :param height: Alto en píxeles.
+        :param layers: (Opcional) Capa de cada entidad (ver overlap_layers). Por defecto, todas en una.
+        """
+        self.n = len(geometries)
+        layers = np.zeros(self.n, dtype=np.int64) if layers is None else np.asarray(layers)
+        geometries = geometries.to_crs(crs)
+
+        indices, labels = [], []
+        for layer in np.unique(layers):
+            shapes = [(geom, i) for i, (geom, geom_layer) in enumerate(zip(geometries, layers), 1)
+                      if geom_layer == layer and geom is not None and not geom.is_empty]
+            if not shapes:
+                continue
+            raster = rasterize(shapes, out_shape=(height, width), transform=transform,
+                               fill=0, dtype='int32').ravel()
+            inside = np.flatnonzero(raster)
+            indices.append(inside)
+            labels.append(raster[inside])
+
+        # Índices de los píxeles de cada entidad, agrupados por etiqueta
+        index = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+        label = np.concatenate(labels) if labels else np.zeros(0, dtype='int32')
+        order = np.argsort(label, kind='stable')
+        self.index = index[order]
+        self.labels = label[order]
+
+    def reduce(self, array, nodata, stats):
+        """
+        Calcula los estadísticos de cada entidad sobre un raster de la rejilla.
+
+        :param array: Array (alto, ancho) del raster.
+        :param nodata: Valor sin dato (o None).
+        :param stats: Estadísticos ya validados (ver parse_stats).
+        :return: Diccionario {estadístico: array con un valor por entidad}.
+        """
+        values = array.ravel()[self.index]
+        valid = _valid(values, nodata)
+        labels = self.labels[valid]
+        values = values[valid].astype('float64')
+
+        count = np.bincount(labels, minlength=self.n + 1)[1:]
+        empty = count == 0
+        names = {name for name, _ in stats}
+        result = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if names & {'sum', 'mean', 'std'}:
+                total = np.bincount(labels, weights=values, minlength=self.n + 1)[1:]
+                mean = total / count
+                result.update(sum=total, mean=mean)
+                if 'std' in names:
+                    squares = np.bincount(labels, weights=values ** 2, minlength=self.n + 1)[1:]
+                    result['std'] = np.sqrt(np.maximum(squares / count - mean ** 2, 0))
+
+            quantiles = [q for name, q in stats if q is not None]
+            if quantiles or names & {'min', 'max'}:
+                # Primer valor de cada entidad con datos (las etiquetas ya van en orden)
+                starts = (np.cumsum(count) - count)[~empty]
+                if quantiles:
+                    # Valores ordenados dentro de cada entidad
+                    values = values[np.lexsort((values, labels))]
+                    result['min'] = np.full(self.n, np.nan)
+                    result['max'] = np.full(self.n, np.nan)
+                    result['min'][~empty] = values[starts]
+                    result['max'][~empty] = values[starts + count[~empty] - 1]
+                    for name, q in stats:
+                        if q is None:
+                            continue
+                        # Interpolación lineal entre los dos valores más próximos (como numpy.percentile)
+                        position = starts + (count[~empty] - 1) * q / 100
+                        low, high = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+                        result[name] = np.full(self.n, np.nan)
+                        result[name][~empty] = values[low] + (values[high] - values[low]) * (position - low)
+                else:
+                    result['min'] = np.full(self.n, np.nan)
+                    result['max'] = np.full(self.n, np.nan)
+                    if starts.size:
+                        result['min'][~empty] = np.minimum.reduceat(values, starts)
+                        result['max'][~empty] = np.maximum.reduceat(values, starts)
+
+        table = {}
+        for name, _ in stats:
+            if name == 'count':
+                table[name] = count
+            else:
+                column = np.asarray(result[name], dtype='float64')
+                column[empty] = np.nan
+                table[name] = column
+        return table
+
+
+def _open_cube(path):
+    xr = _import_xarray()
+    return xr.open_zarr(path) if path.endswith('.zarr') else xr.open_dataset(path)
+
+
+def _cube_date(when):
+    return str(when)[:10].replace('-', '')
+
+
+def iter_outputs(folder, source='auto'):
+    """
+    Recorre los recortes de una carpeta de salida: los GeoTIFF mosaic_{fecha}_{producto}_rec.tif
+    y cada fecha de los cubos cube_{producto}.zarr/.nc. Cada fecha y producto se lee una sola
+    vez aunque esté en varias salidas (ej. un GeoTIFF y un cubo). Lee un raster cada vez.
+
+    :param folder: Carpeta de salida de mosaic_and_clip.
+    :param source: (Opcional) 'auto' (el cubo si contiene la fecha; si no, el GeoTIFF),
+        'gtiff' (solo los GeoTIFF) o 'cube' (solo los cubos).
+    :return: Generador de tuplas (fecha, producto, rejilla, array, nodata), donde la rejilla
+        es (crs, transform, ancho, alto).
+    """
+    if source not in ('auto', 'gtiff', 'cube'):
+        raise ValueError(f"Unknown source '{source}'. Options: ['auto', 'gtiff', 'cube']")
+
+    cubes = []
+    if source != 'gtiff':
+        for name in sorted(os.listdir(folder)):
+            product, ext = os.path.splitext(name)
+            if product.startswith('cube_') and ext in CUBE_FORMATS.values():
+                cubes.append((product[len('cube_'):], os.path.join(folder, name)))
+
+    # Fechas y productos que se leerán de los cubos (solo se lee el eje time)
+    seen = set()
+    for product, path in cubes:
+        with _open_cube(path) as ds:
+            seen.update((_cube_date(when), product) for when in ds['time'].values)
+
+    if source != 'cube':
+        for name in sorted(os.listdir(folder)):
+            match = OUTPUT_PATTERN.match(name)
+            if match and (match.group(1), match.group(2)) not in seen:
+                with rasterio.open(os.path.join(folder, name)) as src:
+                    grid = (src.crs, src.transform, src.width, src.height)
+                    yield match.group(1), match.group(2), grid, src.read(1), src.nodata
+
+    seen = set()
+    for product, path in cubes:
+        with _open_cube(path) as ds:
+            attrs = ds['spatial_ref'].attrs
+            c, a, b, f, d, e = (float(v) for v in attrs['GeoTransform'].split())
+            variable = ds[product]
+            grid = (CRS.from_wkt(attrs['crs_wkt']), Affine(a, b, c, d, e, f),
+                    variable.sizes['x'], variable.sizes['y'])
+            for i, when in enumerate(ds['time'].values):
+                date = _cube_date(when)
+                # El mismo producto en Zarr y en NetCDF: solo se lee el primero
+                if (date, product) in seen:
+                    continue
+                seen.add((date, product))
+                # xarray ya devuelve NaN en los píxeles sin dato
+                yield date, product, grid, variable.isel(time=i).values, None
+
+
+class TableWriter:
+    """
+    Escribe tablas por partes en un archivo CSV o Parquet (necesita pyarrow), para no
+    acumular todos los resultados en memoria.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Ruta de salida (.csv o .parquet). Si existe, se sobrescribe.
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in ('.csv', '.parquet', '.pq'):
+            raise ValueError(f"Unknown table format '{ext}'. Use .csv or .parquet")
+        self.path = path
+        self.fmt = 'csv' if ext == '.csv' else 'parquet'
+        self._writer = None
+        self._rows = 0
+        if self.fmt == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise ImportError("Parquet output needs pyarrow: pip install pyvpp[parquet]")
+            self._pa = pyarrow
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, frame):
+        """
+        Añade las filas de un DataFrame al archivo.
+        """
+        if self.fmt == 'csv':
+            frame.to_csv(self.path, mode='a', header=self._rows == 0, index=False)
+        else:
+            table = self._pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = self._pa.parquet.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        self._rows += len(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
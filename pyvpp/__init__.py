@@ -1,12 +1,46 @@
 __version__ = '0.1.9'
 
-from .WekeoDownload import *
+import importlib
+
+from .Hdarc import create_hdarc, delete_hdarc, clean_old_hdarc
+from .TileCache import TileCache
+from .AoiCache import AoiCache
+
+# Objetos que dependen de las librerías geoespaciales (rasterio, geopandas, hda, pyproj...):
+# se importan la primera vez que se usan, no al importar pyvpp
+_LAZY = {
+    'wekeo_download': 'WekeoDownload',
+    'get_utm_zones': 'WekeoDownload',
+    'wekeo_batch': 'WekeoBatch',
+    'get_mgrs_tiles': 'TileIndex',
+    'tile_from_name': 'TileIndex',
+    'parse_name': 'Catalogue',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
 
 # Exportar funciones principales
 __all__ = [
     'wekeo_download',
+    'wekeo_batch',
     'create_hdarc',
     'delete_hdarc',
     'clean_old_hdarc',
-    'get_utm_zones'
+    'get_utm_zones',
+    'get_mgrs_tiles',
+    'tile_from_name',
+    'parse_name',
+    'TileCache',
+    'AoiCache'
 ]
@@ -36,11 +36,35 @@ setup(
         'shapely>=1.8'
     ],
     extras_require={
+        'cube': [
+            'xarray>=0.19',
+            'zarr>=2.10',
+            'netCDF4>=1.5'
+        ],
+        'async': [
+            'aiohttp>=3.8'
+        ],
+        'cli': [
+            'pyyaml>=5.1',
+            'tomli>=1.1; python_version < "3.11"'
+        ],
+        'parquet': [
+            'pyarrow>=8'
+        ],
+        'slstr': [
+            'scipy>=1.6',
+            'netCDF4>=1.5'
+        ],
         'dev': [
             'pytest>=7.2.1',
             'black>=23.1.0'
         ]
     },
+    entry_points={
+        'console_scripts': [
+            'pyvpp=pyvpp.JobRunner:main',
+        ],
+    },
     keywords=['phenology', 'hrvpp', 'vegetation indexes', 'copernicus', 'wekeo'],
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -7,14 +7,21 @@ Verifies that the package is ready for distribution by checking:
 - File structure
 - Version consistency
 - Import capability
+- Import time budget
 - Required files present
 """
 
 import os
 import sys
+import json
+import subprocess
 from pathlib import Path
 import re
 
+# Tiempo máximo (segundos) de "import pyvpp": las dependencias geoespaciales se cargan bajo demanda
+IMPORT_TIME_BUDGET = 0.25
+HEAVY_MODULES = ['rasterio', 'geopandas', 'hda', 'pyproj', 'deims', 'shapely', 'numpy']
+
 def print_header(text):
     print("\n" + "="*60)
     print(text)
@@ -158,9 +165,45 @@ def check_imports():
         print_error(f"Unexpected error during import: {e}")
         return False
 
+def check_import_time(runs=5):
+    """Check that 'import pyvpp' stays within the import time budget"""
+    print_header("4. Checking Import Time")
+
+    code = (
+        "import sys, time, json; t = time.perf_counter(); import pyvpp; "
+        "print(json.dumps([time.perf_counter() - t, "
+        f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]]))"
+    )
+
+    try:
+        timings = []
+        for _ in range(runs):
+            # Un intérprete nuevo cada vez, para medir en frío
+            out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                 cwd=str(Path.cwd()), check=True).stdout
+            elapsed, loaded = json.loads(out.strip().splitlines()[-1])
+            timings.append(elapsed)
+    except Exception as e:
+        print_error(f"Error measuring import time: {e}")
+        return False
+
+    all_ok = True
+    best = min(timings)
+    if best <= IMPORT_TIME_BUDGET:
+        print_success(f"import pyvpp: {best * 1000:.0f} ms (budget {IMPORT_TIME_BUDGET * 1000:.0f} ms)")
+    else:
+        all_ok = print_error(f"import pyvpp: {best * 1000:.0f} ms exceeds the {IMPORT_TIME_BUDGET * 1000:.0f} ms budget")
+
+    if loaded:
+        all_ok = print_error(f"Heavy modules loaded by 'import pyvpp': {', '.join(loaded)}")
+    else:
+        print_success("No heavy geospatial modules loaded at import time")
+
+    return all_ok
+
 def check_readme():
     """Check README.md content"""
-    print_header("4. Checking README Content")
+    print_header("5. Checking README Content")
     
     try:
         with open('README.md', 'r') as f:
@@ -190,7 +233,7 @@ def check_readme():
 
 def check_dependencies():
     """Check that dependencies are properly specified"""
-    print_header("5. Checking Dependencies")
+    print_header("6. Checking Dependencies")
     
     # Expected dependencies
     expected_deps = ['hda', 'deims', 'geopandas', 'pyproj', 'rasterio', 'requests', 'fiona']
@@ -243,6 +286,7 @@ def main():
     results['structure'] = check_file_structure()
     results['version'] = check_version_consistency()
     results['imports'] = check_imports()
+    results['import_time'] = check_import_time()
     results['readme'] = check_readme()
     results['dependencies'] = check_dependencies()
     